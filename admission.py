@@ -0,0 +1,222 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    """Raised when an analysis cannot be admitted; retry_after is a hint in seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionReservation:
+    """A slot, or a place in the wait queue, taken by AdmissionController.reserve"""
+
+    def __init__(self, waiter: Optional[asyncio.Future]):
+        # None when a slot was free straight away
+        self.waiter = waiter
+        self.reserved_at = time.monotonic()
+
+
+class AdmissionController:
+    """
+    Limits how many heavy analyses run at once, with a bounded FIFO wait queue.
+
+    Up to max_concurrent callers run at the same time and up to max_queue more
+    wait for a slot. Anyone beyond that is rejected immediately, so load spikes
+    turn into fast 429s instead of unbounded memory and Gemini fan-out.
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_queue: int = 16, queue_timeout_seconds: Optional[float] = 30.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        # Metrics
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.timed_out_total = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.max_queue_depth_seen = 0
+        self.avg_service_seconds: Optional[float] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def is_saturated(self) -> bool:
+        """True if a new caller would be rejected right now"""
+        return self.active >= self.max_concurrent and len(self._waiters) >= self.max_queue
+
+    def reject_if_saturated(self) -> None:
+        """
+        Fail fast, without taking a slot, if a new caller would be rejected right now.
+
+        Raises:
+            AdmissionRejected: If every slot is busy and the wait queue is full
+        """
+        if self.is_saturated():
+            self.rejected_total += 1
+            raise AdmissionRejected("Too many analyses in progress", self.retry_after_hint())
+
+    def retry_after_hint(self) -> int:
+        """Estimate, in whole seconds, how long until a queued caller would get a slot"""
+        service_seconds = self.avg_service_seconds or 1.0
+        waves = (len(self._waiters) + 1) / max(1, self.max_concurrent)
+        return max(1, math.ceil(service_seconds * waves))
+
+    def reserve(self) -> "AdmissionReservation":
+        """
+        Take a slot, or a place in the wait queue, without waiting.
+
+        The reservation counts against the limits at once, so callers that
+        answer before they start waiting (such as background jobs) cannot
+        overshoot the queue. Redeem it with wait(), or give it up with
+        cancel() if it will never be waited on.
+
+        Raises:
+            AdmissionRejected: If every slot is busy and the wait queue is full
+        """
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self._record_admission(0.0)
+            return AdmissionReservation(None)
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_total += 1
+            raise AdmissionRejected("Too many analyses in progress", self.retry_after_hint())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.max_queue_depth_seen = max(self.max_queue_depth_seen, len(self._waiters))
+        return AdmissionReservation(waiter)
+
+    async def wait(self, reservation: "AdmissionReservation", timeout: Optional[float] = -1) -> float:
+        """
+        Wait until a reservation holds a slot.
+
+        Args:
+            reservation: Returned by reserve()
+            timeout: Maximum seconds to wait in the queue; -1 uses queue_timeout_seconds, None waits forever
+
+        Returns:
+            Seconds spent waiting in the queue since the reservation was made
+
+        Raises:
+            AdmissionRejected: If the wait timed out
+        """
+        waiter = reservation.waiter
+        if waiter is None:
+            return 0.0
+        if timeout == -1:
+            timeout = self.queue_timeout_seconds
+
+        try:
+            if timeout is None:
+                await waiter
+            else:
+                await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            self._discard_waiter(waiter)
+            self.timed_out_total += 1
+            raise AdmissionRejected("Timed out waiting for an analysis slot", self.retry_after_hint())
+        except BaseException:
+            self.cancel(reservation)
+            raise
+
+        waited = time.monotonic() - reservation.reserved_at
+        self._record_admission(waited)
+        return waited
+
+    def cancel(self, reservation: "AdmissionReservation") -> None:
+        """Give up a reservation that will not be waited on, freeing its slot or queue position"""
+        waiter = reservation.waiter
+        if waiter is None or (waiter.done() and not waiter.cancelled()):
+            # The slot is held (or was handed to us just now); pass it on
+            self.release()
+        else:
+            waiter.cancel()
+            self._discard_waiter(waiter)
+
+    async def acquire(self, timeout: Optional[float] = -1) -> float:
+        """
+        Wait for an analysis slot.
+
+        Args:
+            timeout: Maximum seconds to wait in the queue; -1 uses queue_timeout_seconds, None waits forever
+
+        Returns:
+            Seconds spent waiting in the queue
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait timed out
+        """
+        return await self.wait(self.reserve(), timeout)
+
+    def release(self, service_seconds: Optional[float] = None) -> None:
+        """
+        Give a slot back, handing it directly to the next queued caller if any.
+
+        Args:
+            service_seconds: How long the finished analysis held the slot, used for Retry-After estimates
+        """
+        if service_seconds is not None:
+            if self.avg_service_seconds is None:
+                self.avg_service_seconds = service_seconds
+            else:
+                self.avg_service_seconds = 0.8 * self.avg_service_seconds + 0.2 * service_seconds
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot moves to the waiter, so active stays unchanged
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def admit(self, timeout: Optional[float] = -1) -> AsyncIterator[float]:
+        """Hold an analysis slot for the duration of the block; yields the queue wait in seconds"""
+        waited = await self.acquire(timeout)
+        started = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(time.monotonic() - started)
+
+    def _discard_waiter(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _record_admission(self, waited: float) -> None:
+        self.admitted_total += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return current load and queueing metrics"""
+        return {
+            'active': self.active,
+            'queue_depth': len(self._waiters),
+            'max_concurrent': self.max_concurrent,
+            'max_queue': self.max_queue,
+            'queue_timeout_seconds': self.queue_timeout_seconds,
+            'admitted_total': self.admitted_total,
+            'rejected_total': self.rejected_total,
+            'timed_out_total': self.timed_out_total,
+            'avg_wait_seconds': self.total_wait_seconds / self.admitted_total if self.admitted_total else 0.0,
+            'max_wait_seconds': self.max_wait_seconds,
+            'max_queue_depth_seen': self.max_queue_depth_seen,
+            'avg_service_seconds': self.avg_service_seconds
+        }
@@ -1,10 +1,73 @@
 from collections import defaultdict, Counter
-from typing import Dict, List, Tuple, Any
+from typing import Callable, Collection, Dict, Iterator, List, Tuple, Any, Optional
+import asyncio
+import contextvars
 import json
 import os
-import requests
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
 from urllib.parse import urlparse
 
+from cooccurrence import DomainCooccurrenceIndex
+from query_clustering import DEFAULT_SIMILARITY_THRESHOLD, QueryClusterIndex
+from snippet_index import SnippetSearchIndex
+from records import CitationRecord, citation_ranks
+from snippets import SnippetList, SnippetStore
+from cache import PersistentResultCache, get_file_fingerprint, load_processed_dataset, save_processed_dataset
+from metrics import record_cache_outcome, stage
+
+# Model configuration used for competitor analysis; part of the result cache key
+GEMINI_ANALYSIS_MODEL = "gemini-2.5-flash"
+GEMINI_ANALYSIS_MAX_OUTPUT_TOKENS = 1024
+GEMINI_ANALYSIS_THINKING_BUDGET = 0
+
+# Number of worst prompts sent to Gemini and how many of those calls may run at once
+DEFAULT_WORST_PROMPTS = 3
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '8'))
+
+# Key order of generate_comprehensive_report's output
+REPORT_SECTION_ORDER = (
+    'overview',
+    'query_frequency_stats',
+    'prompt_stats',
+    'domain_analysis',
+    'query_analysis',
+    'response_chunks_analysis',
+    'gemini_analysis'
+)
+
+# Gemini competitor analyses persisted across requests and restarts
+gemini_analysis_cache = PersistentResultCache(
+    os.getenv('GEMINI_CACHE_PATH', '.gemini_analysis_cache.sqlite3'),
+    ttl_seconds=float(os.getenv('GEMINI_CACHE_TTL_SECONDS', str(7 * 24 * 3600))),
+    max_entries=int(os.getenv('GEMINI_CACHE_MAX_ENTRIES', '5000'))
+)
+
+
+def is_gemini_error(analysis: Optional[str]) -> bool:
+    """Whether a Gemini analysis is an error placeholder (or empty) rather than a real answer"""
+    return not analysis or analysis.startswith("ERROR:")
+
+
+_gemini_client = None
+_gemini_client_lock = threading.Lock()
+
+
+def get_gemini_client():
+    """
+    Return a process-wide Gemini client, creating it on first use.
+    
+    The client is thread-safe and keeps its HTTP connection pool, so reusing
+    it avoids paying connection setup on every analysis call.
+    """
+    global _gemini_client
+    if _gemini_client is None:
+        with _gemini_client_lock:
+            if _gemini_client is None:
+                from google import genai
+                _gemini_client = genai.Client()
+    return _gemini_client
+
 
 def extract_domain_from_url(url: str) -> str:
     """
@@ -37,19 +100,174 @@ def extract_domain_from_url(url: str) -> str:
         return url.replace('https://', '').replace('http://', '').replace('www.', '').split('/')[0].lower()
 
 
-def load_and_process_experiment_results(file_path: str) -> Tuple[Dict[str, Dict[str, Dict[str, Dict[str, Any]]]], Dict[str, Dict[str, List[str]]]]:
+def aggregate_experiment_searches(experiment: Dict[str, Any], snippet_store: Optional[SnippetStore] = None) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Aggregate the web searches of one experiment record across all of its model runs.
+    
+    Args:
+        experiment: One entry of the experiment results list ({'prompt': ..., 'results': {...}})
+        snippet_store: Store the contents are interned into; share one per loaded dataset
+        
+    Returns:
+        Dictionary of query -> domain -> CitationRecord ({'citations': sorted unique ranks, 'contents': SnippetList})
+    """
+    if snippet_store is None:
+        snippet_store = SnippetStore()
+    prompt_searches = defaultdict(lambda: defaultdict(lambda: {'citations': [], 'contents': SnippetList(snippet_store)}))
+    
+    for model_name, model_runs in experiment.get('results', {}).items():
+        for run_result in model_runs:
+            if run_result.get('success', False) and 'web_searches' in run_result:
+                web_searches = run_result['web_searches']
+                
+                # Handle the new format where web_searches is a dict of query -> domain -> citations_dict
+                if isinstance(web_searches, dict):
+                    for query, domains in web_searches.items():
+                        if isinstance(domains, dict):
+                            for domain_url, citations_data in domains.items():
+                                # Extract domain name from URL
+                                domain = extract_domain_from_url(domain_url)
+                                
+                                if isinstance(citations_data, dict):
+                                    # New format: {"citations": [...], "contents": [...]}
+                                    citations = citations_data.get('citations', [])
+                                    contents = citations_data.get('contents', [])
+                                    if isinstance(citations, list):
+                                        prompt_searches[query][domain]['citations'].extend(citations)
+                                    if isinstance(contents, list):
+                                        # Skip malformed snippets so one bad item does not fail the whole file
+                                        snippets = [text for text in contents if isinstance(text, str)]
+                                        if len(snippets) < len(contents):
+                                            print(f"Skipping {len(contents) - len(snippets)} non-text snippet(s) for {domain} on query '{query}'")
+                                        prompt_searches[query][domain]['contents'].extend(snippets)
+                                elif isinstance(citations_data, list):
+                                    # Old format: just a list of citations
+                                    prompt_searches[query][domain]['citations'].extend(citations_data)
+    
+    # Convert to compact records, removing duplicate citations and sorting them
+    # (contents may have duplicates, but each is only an id into the snippet store)
+    return {
+        query: {
+            domain: CitationRecord(sorted(set(citation_data['citations'])), citation_data['contents'])
+            for domain, citation_data in domains.items()
+        }
+        for query, domains in prompt_searches.items()
+    }
+
+
+def response_segments_from_citation_index(response_text: str, citation_index: Dict[str, Any]) -> List[Tuple[str, List[str]]]:
+    """
+    Decode the cited segments of a response from the citation index saved by extract.py.
+    
+    Args:
+        response_text: Full response text the segment offsets refer to
+        citation_index: {'sources': [uri, ...], 'segments': [[start, end, [source_id, ...](, text)], ...]}
+        
+    Returns:
+        List of (segment text, cited domains) in response order
+    """
+    domains = [extract_domain_from_url(uri) for uri in citation_index.get('sources', [])]
+    encoded_text = (response_text or "").encode('utf-8')
+    
+    segments = []
+    for segment in citation_index.get('segments', []):
+        start, end, source_ids = segment[:3]
+        # Offsets are UTF-8 byte positions; the text is stored only when they do not reproduce it
+        text = segment[3] if len(segment) > 3 else encoded_text[start:end].decode('utf-8', errors='replace')
+        text = text.strip()
+        if text:
+            segments.append((text, [domains[source_id] for source_id in source_ids if source_id < len(domains)]))
+    return segments
+
+
+def response_segments_from_web_searches(web_searches: Dict[str, Any]) -> List[Tuple[str, List[str]]]:
+    """
+    Rebuild the cited segments of a response from its web_searches, for runs saved without a citation index.
+    
+    extract.py stores every grounding chunk under each query with the indices and
+    texts of the segments citing it, so one query's entry holds the whole alignment.
+    
+    Returns:
+        List of (segment text, cited domains) in citation order
+    """
+    cited_segments = {}  # citation index -> (text, domains)
+    
+    for domains in web_searches.values():
+        if not isinstance(domains, dict) or not domains:
+            continue
+        
+        for domain_url, citations_data in domains.items():
+            if not isinstance(citations_data, dict):
+                continue
+            domain = extract_domain_from_url(domain_url)
+            for citation, text in zip(citations_data.get('citations', []), citations_data.get('contents', [])):
+                if isinstance(text, str) and text.strip():
+                    cited_segments.setdefault(citation, (text.strip(), []))[1].append(domain)
+        break
+    
+    return [cited_segments[citation] for citation in sorted(cited_segments)]
+
+
+def extract_experiment_response_chunks(experiment: Dict[str, Any]) -> Dict[str, List[str]]:
+    """
+    Map the cited sentences of one experiment record's responses to the domains they cite.
+    
+    Uses the citation index saved by extract.py, falling back to the segment
+    texts stored in web_searches for results extracted before it existed.
+    
+    Args:
+        experiment: One entry of the experiment results list
+        
+    Returns:
+        Dictionary of sentence -> cited domains (a domain cited twice appears twice)
+    """
+    response_chunks = {}
+    
+    for model_name, model_runs in experiment.get('results', {}).items():
+        for run_result in model_runs:
+            if not run_result.get('success', False):
+                continue
+            
+            citation_index = run_result.get('citation_index')
+            if isinstance(citation_index, dict) and citation_index.get('segments'):
+                segments = response_segments_from_citation_index(run_result.get('response', ''), citation_index)
+            elif isinstance(run_result.get('web_searches'), dict):
+                segments = response_segments_from_web_searches(run_result['web_searches'])
+            else:
+                segments = []
+            
+            for sentence, domains in segments:
+                response_chunks.setdefault(sentence, []).extend(domains)
+    
+    return response_chunks
+
+
+def load_and_process_experiment_results(file_path: str, use_cache: bool = True) -> Tuple[Dict[str, Dict[str, Dict[str, Dict[str, Any]]]], Dict[str, Dict[str, List[str]]]]:
     """
     Load experiment results from JSON file generated by main.py and convert to analytics format.
     
+    The processed result is cached in PROCESSED_CACHE_DIR and reused as long
+    as the file's path, size, mtime and content hash are unchanged.
+    
     Args:
         file_path: Path to the JSON file generated by main.py
+        use_cache: Whether to read and write the processed-dataset cache
         
     Returns:
         Tuple of (search_analytics_data, ai_response_chunks)
         - search_analytics_data: Format expected by SearchAnalytics class with both citations and contents
-        - ai_response_chunks: Placeholder for response chunks (empty for now)
+          (contents are SnippetList views over one SnippetStore per file)
+        - ai_response_chunks: prompt -> cited response sentence -> cited domains
     """
     try:
+        fingerprint = None
+        if use_cache:
+            fingerprint = get_file_fingerprint(file_path)
+            cached = load_processed_dataset(file_path, fingerprint)
+            record_cache_outcome("processed_dataset", cached is not None)
+            if cached is not None:
+                return cached
+        
         with open(file_path, 'r') as f:
             data = json.load(f)
         
@@ -59,92 +277,25 @@ def load_and_process_experiment_results(file_path: str) -> Tuple[Dict[str, Dict[
         
         # Process each experiment separately to maintain prompt-query associations
         search_analytics_data = {}
-        
-        for experiment in data:
-            prompt = experiment.get('prompt', '')
-            results = experiment.get('results', {})
-            
-            if prompt not in search_analytics_data:
-                search_analytics_data[prompt] = {}
-            
-            # Aggregate searches for this specific prompt only
-            prompt_searches = defaultdict(lambda: defaultdict(lambda: {'citations': [], 'contents': []}))
-            
-            for model_name, model_runs in results.items():
-                for run_result in model_runs:
-                    if run_result.get('success', False) and 'web_searches' in run_result:
-                        web_searches = run_result['web_searches']
-                        
-                        # Handle the new format where web_searches is a dict of query -> domain -> citations_dict
-                        if isinstance(web_searches, dict):
-                            for query, domains in web_searches.items():
-                                if isinstance(domains, dict):
-                                    for domain_url, citations_data in domains.items():
-                                        # Extract domain name from URL
-                                        domain = extract_domain_from_url(domain_url)
-                                        
-                                        if isinstance(citations_data, dict):
-                                            # New format: {"citations": [...], "contents": [...]}
-                                            citations = citations_data.get('citations', [])
-                                            contents = citations_data.get('contents', [])
-                                            if isinstance(citations, list):
-                                                prompt_searches[query][domain]['citations'].extend(citations)
-                                            if isinstance(contents, list):
-                                                prompt_searches[query][domain]['contents'].extend(contents)
-                                        elif isinstance(citations_data, list):
-                                            # Old format: just a list of citations
-                                            prompt_searches[query][domain]['citations'].extend(citations_data)
-            
-            # Convert to the expected format for this prompt
-            for query, domains in prompt_searches.items():
-                if query not in search_analytics_data[prompt]:
-                    search_analytics_data[prompt][query] = {}
-                
-                for domain, citation_data in domains.items():
-                    if domain not in search_analytics_data[prompt][query]:
-                        search_analytics_data[prompt][query][domain] = {
-                            'citations': [],
-                            'contents': []
-                        }
-                    
-                    # Remove duplicates and sort citations
-                    unique_citations = sorted(list(set(citation_data['citations'])))
-                    search_analytics_data[prompt][query][domain]['citations'] = unique_citations
-                    
-                    # Add contents (may have duplicates, but that's okay for analysis)
-                    search_analytics_data[prompt][query][domain]['contents'] = citation_data['contents']
-        
-        # Clean up duplicates in final result (already done above, but keeping for consistency)
-        for prompt_data in search_analytics_data.values():
-            for query_data in prompt_data.values():
-                for domain_data in query_data.values():
-                    domain_data['citations'] = sorted(list(set(domain_data['citations'])))
-                    # Keep contents as is - duplicates might be meaningful
-        
-        # Extract AI response chunks from experiment results
         ai_response_chunks = {}
+        # Every citation snippet of the file is stored once and referenced by id
+        snippet_store = SnippetStore()
         
         for experiment in data:
             prompt = experiment.get('prompt', '')
-            results = experiment.get('results', {})
             
-            if prompt not in ai_response_chunks:
-                ai_response_chunks[prompt] = {}
+            # A later experiment with the same prompt replaces the per-domain entries it also covers
+            prompt_data = search_analytics_data.setdefault(prompt, {})
+            for query, domains in aggregate_experiment_searches(experiment, snippet_store).items():
+                prompt_data.setdefault(query, {}).update(domains)
             
-            for model_name, model_runs in results.items():
-                for run_result in model_runs:
-                    if run_result.get('success', False) and 'response' in run_result:
-                        response_text = run_result['response']
-                        if response_text:
-                            # Split response into chunks (sentences or paragraphs)
-                            # For now, split by periods followed by space or newline
-                            chunks = [chunk.strip() for chunk in response_text.split('.') if chunk.strip()]
-                            
-                            # Store chunks for this prompt/model combination
-                            chunk_key = f"{model_name}_response"
-                            if chunk_key not in ai_response_chunks[prompt]:
-                                ai_response_chunks[prompt][chunk_key] = []
-                            ai_response_chunks[prompt][chunk_key].extend(chunks)
+            # Align cited response sentences with their domains, accumulating across experiments of the same prompt
+            prompt_chunks = ai_response_chunks.setdefault(prompt, {})
+            for sentence, domains in extract_experiment_response_chunks(experiment).items():
+                prompt_chunks.setdefault(sentence, []).extend(domains)
+        
+        if use_cache:
+            save_processed_dataset(file_path, fingerprint, (search_analytics_data, ai_response_chunks))
         
         return search_analytics_data, ai_response_chunks
         
@@ -165,6 +316,7 @@ def load_multiple_experiment_files(file_paths: List[str]) -> Tuple[Dict[str, Dic
     """
     combined_search_data = {}
     combined_response_chunks = {}
+    snippet_store = SnippetStore()
     
     for file_path in file_paths:
         search_data, response_chunks = load_and_process_experiment_results(file_path)
@@ -185,7 +337,7 @@ def load_multiple_experiment_files(file_paths: List[str]) -> Tuple[Dict[str, Dic
                     if domain not in combined_search_data[prompt][query]:
                         combined_search_data[prompt][query][domain] = {
                             'citations': [],
-                            'contents': []
+                            'contents': SnippetList(snippet_store)
                         }
                     combined_search_data[prompt][query][domain]['citations'].extend(citation_data['citations'])
                     combined_search_data[prompt][query][domain]['contents'].extend(citation_data['contents'])
@@ -195,17 +347,17 @@ def load_multiple_experiment_files(file_paths: List[str]) -> Tuple[Dict[str, Dic
             if prompt not in combined_response_chunks:
                 combined_response_chunks[prompt] = {}
             
-            for chunk_key, chunk_list in chunks.items():
-                if chunk_key not in combined_response_chunks[prompt]:
-                    combined_response_chunks[prompt][chunk_key] = []
-                combined_response_chunks[prompt][chunk_key].extend(chunk_list)
+            for sentence, domains in chunks.items():
+                if sentence not in combined_response_chunks[prompt]:
+                    combined_response_chunks[prompt][sentence] = []
+                combined_response_chunks[prompt][sentence].extend(domains)
     
-    # Clean up duplicates in final result
+    # Clean up duplicates in final result and pack the merged entries into compact records
     for prompt_data in combined_search_data.values():
         for query_data in prompt_data.values():
-            for domain_data in query_data.values():
-                domain_data['citations'] = sorted(list(set(domain_data['citations'])))
+            for domain, domain_data in query_data.items():
                 # Keep contents as is - duplicates might be meaningful
+                query_data[domain] = CitationRecord(sorted(set(domain_data['citations'])), domain_data['contents'])
     
     return combined_search_data, combined_response_chunks
 
@@ -385,6 +537,31 @@ class SearchAnalytics:
         self.domain_stats = {}
         self.query_stats = {}
         self.prompt_stats = {}
+        self._cooccurrence_index = None
+        self._index_lock = threading.Lock()
+        self._query_cluster_indexes = {}
+        self._sentence_domain_counts = None
+        self._snippet_index = None
+    
+    def get_cooccurrence_index(self) -> DomainCooccurrenceIndex:
+        """
+        Return the domain co-occurrence / out-ranked-by index, building it on first use
+        """
+        if self._cooccurrence_index is None:
+            with self._index_lock:
+                if self._cooccurrence_index is None:
+                    self._cooccurrence_index = DomainCooccurrenceIndex(self.data)
+        return self._cooccurrence_index
+    
+    def get_snippet_index(self) -> SnippetSearchIndex:
+        """
+        Return the full-text index over citation snippets, building it on first use
+        """
+        if self._snippet_index is None:
+            with self._index_lock:
+                if self._snippet_index is None:
+                    self._snippet_index = SnippetSearchIndex(self.data)
+        return self._snippet_index
         
     def calculate_domain_stats(self, domain_of_interest: str) -> Dict[str, Any]:
         """
@@ -416,7 +593,7 @@ class SearchAnalytics:
                     domain_in_prompt = True
                     stats['query_appearances'].append(query)
                     
-                    citations = domains[domain_of_interest]['citations']
+                    citations = citation_ranks(domains[domain_of_interest])
                     if citations:  # If domain was actually cited
                         queries_with_citations += 1
                         stats['total_citations'] += len(citations)
@@ -474,6 +651,59 @@ class SearchAnalytics:
             'most_common_queries': query_counter.most_common(10)
         }
     
+    def get_query_cluster_index(self, threshold: float = DEFAULT_SIMILARITY_THRESHOLD) -> QueryClusterIndex:
+        """
+        Return the near-duplicate query clusters for a similarity threshold, building them on first use
+        """
+        with self._index_lock:
+            index = self._query_cluster_indexes.get(threshold)
+            if index is None:
+                index = QueryClusterIndex(threshold=threshold)
+                index.add_all(query for queries in self.data.values() for query in queries)
+                self._query_cluster_indexes[threshold] = index
+        return index
+    
+    def calculate_query_cluster_stats(self, threshold: float = DEFAULT_SIMILARITY_THRESHOLD) -> Dict[str, Any]:
+        """
+        Calculate frequency statistics for clusters of near-duplicate queries
+        
+        Works like calculate_query_frequency_stats, but query variants such as
+        "bikes in Berlin" and "bikes near Berlin" are counted as one cluster,
+        labelled by the first variant seen.
+        """
+        index = self.get_query_cluster_index(threshold)
+        cluster_counter = Counter()
+        cluster_prompt_mapping = defaultdict(list)
+        
+        total_queries = 0
+        
+        for prompt, queries in self.data.items():
+            for query in queries.keys():
+                cluster = index.cluster_of(query)
+                cluster_counter[cluster] += 1
+                cluster_prompt_mapping[cluster].append(prompt)
+                total_queries += 1
+        
+        members = index.clusters()
+        cluster_stats = {}
+        for cluster, count in cluster_counter.items():
+            cluster_stats[cluster] = {
+                'queries': members[cluster],
+                'variant_count': len(members[cluster]),
+                'frequency': count,
+                'frequency_rate': count / total_queries,
+                'prompts': cluster_prompt_mapping[cluster],
+                'unique_prompts': len(set(cluster_prompt_mapping[cluster]))
+            }
+        
+        return {
+            'total_queries': total_queries,
+            'unique_clusters': len(cluster_counter),
+            'similarity_threshold': threshold,
+            'cluster_details': cluster_stats,
+            'most_common_clusters': cluster_counter.most_common(10)
+        }
+    
     def calculate_prompt_stats(self) -> Dict[str, Any]:
         """
         Calculate statistics for each prompt
@@ -495,9 +725,10 @@ class SearchAnalytics:
                 stats['unique_domains'].update(domains.keys())
                 
                 for domain, citation_data in domains.items():
-                    if citation_data['citations']:
+                    citations = citation_ranks(citation_data)
+                    if citations:
                         stats['domains_with_citations'].add(domain)
-                        total_citations += len(citation_data['citations'])
+                        total_citations += len(citations)
             
             stats['total_citations'] = total_citations
             stats['avg_citations_per_query'] = total_citations / len(queries) if queries else 0
@@ -537,7 +768,7 @@ class SearchAnalytics:
                 # Check if target domain was retrieved
                 if domain_of_interest in domains:
                     query_analysis[query]['target_domain_retrieved'] = True
-                    citations = domains[domain_of_interest]['citations']
+                    citations = citation_ranks(domains[domain_of_interest])
                     query_analysis[query]['target_domain_citations'].extend(citations)
                     
                     # Check if target domain was actually cited
@@ -613,36 +844,67 @@ class SearchAnalytics:
                     status = "⭐" if domain == domain_of_interest else "🔸"
                     print(f"      {status} {domain}")
     
-    def generate_comprehensive_report(self, domain_of_interest: str = None) -> Dict[str, Any]:
+    def calculate_overview(self) -> Dict[str, Any]:
         """
-        Generate a comprehensive analytics report
+        Calculate dataset-level totals for prompts, queries and domains
         """
-        report = {
-            'overview': {
-                'total_prompts': len(self.data),
-                'total_queries': sum(len(queries) for queries in self.data.values()),
-                'total_unique_domains': len(set(
-                    domain for queries in self.data.values() 
-                    for domains in queries.values() 
-                    for domain in domains.keys()
-                ))
-            },
-            'query_frequency_stats': self.calculate_query_frequency_stats(),
-            'prompt_stats': self.calculate_prompt_stats()
+        return {
+            'total_prompts': len(self.data),
+            'total_queries': sum(len(queries) for queries in self.data.values()),
+            'total_unique_domains': len(set(
+                domain for queries in self.data.values() 
+                for domains in queries.values() 
+                for domain in domains.keys()
+            ))
         }
+    
+    def iter_report_sections(self, domain_of_interest: str = None, worst_prompts: int = DEFAULT_WORST_PROMPTS,
+                             include_gemini: bool = True, sections: Optional[Collection[str]] = None) -> Iterator[Tuple[str, Any]]:
+        """
+        Yield (section_name, section_data) pairs of the comprehensive report one at a time.
+        
+        Sections are computed lazily and the cheap ones come first, so callers
+        streaming the report can send them before the expensive ones are done.
+        If sections is given, only those sections are computed.
+        """
+        def wanted(name: str) -> bool:
+            return sections is None or name in sections
+        
+        if wanted('overview'):
+            yield 'overview', self.calculate_overview()
+        
+        if domain_of_interest and wanted('domain_analysis'):
+            yield 'domain_analysis', self.calculate_domain_stats(domain_of_interest)
+        
+        if wanted('prompt_stats'):
+            yield 'prompt_stats', self.calculate_prompt_stats()
+        if wanted('query_frequency_stats'):
+            yield 'query_frequency_stats', self.calculate_query_frequency_stats()
         
         if domain_of_interest:
-            report['domain_analysis'] = self.calculate_domain_stats(domain_of_interest)
-            report['query_analysis'] = self.analyze_queries_with_target_domain(domain_of_interest)
+            if wanted('query_analysis'):
+                yield 'query_analysis', self.analyze_queries_with_target_domain(domain_of_interest)
             
             # Add response chunks analysis if available
-            if self.response_chunks:
-                report['response_chunks_analysis'] = self.analyze_response_chunks(domain_of_interest)
+            if self.response_chunks and wanted('response_chunks_analysis'):
+                yield 'response_chunks_analysis', self.analyze_response_chunks(domain_of_interest)
                 
             # Add Gemini analysis for poor performance cases
-            report['gemini_analysis'] = self.analyze_poor_performance(domain_of_interest)
+            if include_gemini and wanted('gemini_analysis'):
+                yield 'gemini_analysis', self.analyze_poor_performance(domain_of_interest, worst_prompts)
+    
+    def generate_comprehensive_report(self, domain_of_interest: str = None, worst_prompts: int = DEFAULT_WORST_PROMPTS,
+                                      include_gemini: bool = True) -> Dict[str, Any]:
+        """
+        Generate a comprehensive analytics report
+        
+        With include_gemini=False the Gemini poor-performance section is left
+        out so callers can run it separately (e.g. via analyze_poor_performance_async).
+        """
+        sections = dict(self.iter_report_sections(domain_of_interest, worst_prompts, include_gemini))
         
-        return report
+        # Keep the established key order of the report
+        return {name: sections[name] for name in REPORT_SECTION_ORDER if name in sections}
     
     def print_domain_analysis(self, domain: str):
         """
@@ -679,8 +941,9 @@ class SearchAnalytics:
             for query, domains in queries.items():
                 query_prompt_mapping[query].append(prompt)
                 for domain, citation_data in domains.items():
-                    if citation_data['citations']:  # Only count domains that were actually cited
-                        query_domain_stats[query][domain].update(citation_data['citations'])
+                    citations = citation_ranks(citation_data)
+                    if citations:  # Only count domains that were actually cited
+                        query_domain_stats[query][domain].update(citations)
         
         # Identify intersecting queries (appearing in multiple prompts)
         intersecting_queries = {
@@ -703,6 +966,47 @@ class SearchAnalytics:
         
         return intersecting_analysis
     
+    def analyze_intersecting_query_clusters(self, threshold: float = DEFAULT_SIMILARITY_THRESHOLD) -> Dict[str, Any]:
+        """
+        Analyze clusters of near-duplicate queries that appear across multiple prompts
+        
+        Like analyze_intersecting_queries, but a prompt counts towards a
+        cluster when it used any of the cluster's query variants.
+        """
+        index = self.get_query_cluster_index(threshold)
+        cluster_prompt_mapping = defaultdict(list)
+        cluster_domain_stats = defaultdict(lambda: defaultdict(set))
+        
+        # Map clusters to prompts and track cited domains
+        for prompt, queries in self.data.items():
+            for query, domains in queries.items():
+                cluster = index.cluster_of(query)
+                cluster_prompt_mapping[cluster].append(prompt)
+                for domain, citation_data in domains.items():
+                    citations = citation_ranks(citation_data)
+                    if citations:  # Only count domains that were actually cited
+                        cluster_domain_stats[cluster][domain].update(citations)
+        
+        members = index.clusters()
+        intersecting_analysis = {}
+        for cluster, prompts in cluster_prompt_mapping.items():
+            unique_prompts = list(dict.fromkeys(prompts))
+            if len(unique_prompts) <= 1:
+                continue
+            
+            intersecting_analysis[cluster] = {
+                'queries': members[cluster],
+                'frequency': len(prompts),
+                'unique_prompts': len(unique_prompts),
+                'prompts': unique_prompts,
+                'total_domains': len(cluster_domain_stats[cluster]),
+                'domains_with_citations': {
+                    domain: sorted(citations) for domain, citations in cluster_domain_stats[cluster].items()
+                }
+            }
+        
+        return intersecting_analysis
+    
     def print_intersecting_queries_analysis(self):
         """
         Print detailed analysis of intersecting queries
@@ -732,11 +1036,25 @@ class SearchAnalytics:
             for domain, citation_count in sorted_domains[:5]:  # Show top 5
                 print(f"     - {domain}: {citation_count} citations")
 
+    def get_sentence_domain_counts(self) -> Dict[str, Dict[str, Counter]]:
+        """
+        Return prompt -> sentence -> citations per domain, built once from the response chunks
+        """
+        if self._sentence_domain_counts is None:
+            with self._index_lock:
+                if self._sentence_domain_counts is None:
+                    self._sentence_domain_counts = {
+                        prompt: {sentence: Counter(domains) for sentence, domains in chunks.items()}
+                        for prompt, chunks in self.response_chunks.items()
+                    }
+        return self._sentence_domain_counts
+    
     def analyze_response_chunks(self, domain_of_interest: str) -> Dict[str, Any]:
         """
         Analyze AI response chunks to understand domain performance in final responses
         """
         chunk_analysis = {}
+        sentence_domain_counts = self.get_sentence_domain_counts()
         
         for prompt, chunks in self.response_chunks.items():
             domain_mentions = []
@@ -745,12 +1063,13 @@ class SearchAnalytics:
             
             for sentence, domains in chunks.items():
                 total_citations += len(domains)
+                citation_count = sentence_domain_counts[prompt][sentence].get(domain_of_interest, 0)
                 
-                if domain_of_interest in domains:
+                if citation_count:
                     domain_mentions.append({
                         'sentence': sentence,
                         'position': len(domain_mentions) + 1,
-                        'citation_count': domains.count(domain_of_interest)
+                        'citation_count': citation_count
                     })
                 else:
                     # Track competitors mentioned in this sentence
@@ -793,16 +1112,11 @@ class SearchAnalytics:
         else:
             return 'poor'
     
-    def call_gemini_analysis(self, prompt: str, domain_of_interest: str, competitor_info: List[str]) -> str:
+    def _build_gemini_analysis_prompt(self, prompt: str, domain_of_interest: str, competitor_info: List[str]) -> str:
         """
-        Call Gemini API to analyze why competitors ranked higher
+        Build the competitor analysis prompt sent to Gemini
         """
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            return "ERROR: GEMINI_API_KEY not found in environment variables"
-        
-        # Prepare the analysis prompt for Gemini
-        analysis_prompt = f"""
+        return f"""
         Analyze why competing domains ranked higher than {domain_of_interest} in AI search results.
 
         User Query/Prompt: {prompt}
@@ -816,97 +1130,161 @@ class SearchAnalytics:
         
         Avoid giving generic advice like "{domain_of_interest} should improve their SEO."
         """
+    
+    def _gemini_analysis_cache_key(self, analysis_prompt: str) -> str:
+        """
+        Key a Gemini analysis by its exact prompt and model configuration
+        """
+        return PersistentResultCache.make_key(
+            analysis_prompt,
+            GEMINI_ANALYSIS_MODEL,
+            GEMINI_ANALYSIS_MAX_OUTPUT_TOKENS,
+            GEMINI_ANALYSIS_THINKING_BUDGET
+        )
+    
+    def _gemini_analysis_config(self):
+        """
+        Generation settings for competitor analysis (no grounding needed for analysis)
+        """
+        from google.genai import types
+        
+        return types.GenerateContentConfig(
+            max_output_tokens=GEMINI_ANALYSIS_MAX_OUTPUT_TOKENS,
+            thinking_config=types.ThinkingConfig(
+                thinking_budget=GEMINI_ANALYSIS_THINKING_BUDGET
+            ),  # Disable thinking for speed
+        )
+    
+    def call_gemini_analysis(self, prompt: str, domain_of_interest: str, competitor_info: List[str]) -> str:
+        """
+        Call Gemini API to analyze why competitors ranked higher
+        
+        Successful analyses are cached persistently, keyed by the exact analysis
+        prompt and model configuration, so repeated requests skip the API call.
+        """
+        analysis_prompt = self._build_gemini_analysis_prompt(prompt, domain_of_interest, competitor_info)
+        
+        cache_key = self._gemini_analysis_cache_key(analysis_prompt)
+        cached_analysis = gemini_analysis_cache.get(cache_key)
+        record_cache_outcome("gemini_analysis", cached_analysis is not None)
+        if cached_analysis is not None:
+            return cached_analysis
+        
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            return "ERROR: GEMINI_API_KEY not found in environment variables"
         
         try:
-            # Use the same genai library approach as in main.py
-            from google import genai
-            from google.genai import types
+            with stage("gemini_call"):
+                response = get_gemini_client().models.generate_content(
+                    model=GEMINI_ANALYSIS_MODEL, 
+                    contents=analysis_prompt, 
+                    config=self._gemini_analysis_config()
+                )
+            
+            # Only cache real answers so failures are retried on the next request
+            if response.text:
+                gemini_analysis_cache.put(cache_key, response.text)
             
-            client = genai.Client()
+            return response.text
             
-            # Configure generation settings (no grounding needed for analysis)
-            config = types.GenerateContentConfig(
-                max_output_tokens=1024,
-                thinking_config=types.ThinkingConfig(
-                    thinking_budget=0
-                ),  # Disable thinking for speed
-            )
+        except Exception as e:
+            return f"ERROR: Gemini API call failed - {str(e)}"
+    
+    async def call_gemini_analysis_async(self, prompt: str, domain_of_interest: str, competitor_info: List[str]) -> str:
+        """
+        Async variant of call_gemini_analysis using the client's aio interface
+        
+        The SQLite result cache is consulted in a worker thread so the event
+        loop never blocks on disk I/O.
+        """
+        analysis_prompt = self._build_gemini_analysis_prompt(prompt, domain_of_interest, competitor_info)
+        
+        cache_key = self._gemini_analysis_cache_key(analysis_prompt)
+        cached_analysis = await asyncio.to_thread(gemini_analysis_cache.get, cache_key)
+        record_cache_outcome("gemini_analysis", cached_analysis is not None)
+        if cached_analysis is not None:
+            return cached_analysis
+        
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            return "ERROR: GEMINI_API_KEY not found in environment variables"
+        
+        try:
+            with stage("gemini_call"):
+                response = await get_gemini_client().aio.models.generate_content(
+                    model=GEMINI_ANALYSIS_MODEL, 
+                    contents=analysis_prompt, 
+                    config=self._gemini_analysis_config()
+                )
             
-            response = client.models.generate_content(
-                model="gemini-2.5-flash", 
-                contents=analysis_prompt, 
-                config=config
-            )
+            # Only cache real answers so failures are retried on the next request
+            if response.text:
+                await asyncio.to_thread(gemini_analysis_cache.put, cache_key, response.text)
             
             return response.text
             
         except Exception as e:
             return f"ERROR: Gemini API call failed - {str(e)}"
     
-    def analyze_poor_performance(self, domain_of_interest: str) -> Dict[str, Any]:
+    def _select_poor_performers(self, domain_of_interest: str, worst_prompts: int) -> List[Dict[str, Any]]:
         """
-        Identify the worst 3 prompts where domain performed poorly and get Gemini analysis.
+        Rank prompts where the domain appeared from worst to best and collect competitor info for the worst ones.
         
         Ranking criteria (worst to best):
         1. Domain was retrieved but got no citations (empty list [])
         2. Domain was cited but the lowest citation number is highest (e.g., [5, 6] is worse than [3, 8])
         """
+        index = self.get_cooccurrence_index()
+        
+        # Collect the domain's citations per prompt from the index postings
+        citations_by_prompt = {}
+        for prompt, query in index.iter_appearances(domain_of_interest):
+            citations_by_prompt.setdefault(prompt, []).extend(citation_ranks(self.data[prompt][query][domain_of_interest]))
+        
         # Collect performance data for each prompt
         prompt_performance = []
         
-        for prompt, queries in self.data.items():
-            domain_appeared = False
-            all_citations = []
-            
-            # Check all queries in this prompt for the target domain
-            for query, domains in queries.items():
-                if domain_of_interest in domains:
-                    domain_appeared = True
-                    citations = domains[domain_of_interest]['citations']
-                    all_citations.extend(citations)
+        for prompt, all_citations in citations_by_prompt.items():
+            if not all_citations:
+                # Domain retrieved but no citations - worst case
+                performance_score = float('inf')
+                min_citation_rank = None
+            else:
+                # Domain cited - use minimum citation rank as performance score
+                min_citation_rank = min(all_citations)
+                performance_score = min_citation_rank
             
-            if domain_appeared:
-                if not all_citations:
-                    # Domain retrieved but no citations - worst case
-                    performance_score = float('inf')
-                    min_citation_rank = None
-                else:
-                    # Domain cited - use minimum citation rank as performance score
-                    min_citation_rank = min(all_citations)
-                    performance_score = min_citation_rank
-                
-                prompt_performance.append({
-                    'prompt': prompt,
-                    'performance_score': performance_score,
-                    'min_citation_rank': min_citation_rank,
-                    'all_citations': all_citations,
-                    'total_citations': len(all_citations)
-                })
+            prompt_performance.append({
+                'prompt': prompt,
+                'performance_score': performance_score,
+                'min_citation_rank': min_citation_rank,
+                'all_citations': all_citations,
+                'total_citations': len(all_citations)
+            })
         
         # Sort by performance score (higher is worse, inf is worst)
         prompt_performance.sort(key=lambda x: x['performance_score'], reverse=True)
         
-        # Take the worst 3 prompts
-        worst_prompts = prompt_performance[:3]
+        # Take the worst prompts
+        worst_prompt_data = prompt_performance[:worst_prompts]
         
-        poor_performance_analysis = {}
-        
-        for prompt_data in worst_prompts:
+        for prompt_data in worst_prompt_data:
             prompt = prompt_data['prompt']
             
-            # Get competitor information from this prompt
-            competitor_domains = []
-            for query, domains in self.data[prompt].items():
-                for domain, citation_data in domains.items():
-                    if domain != domain_of_interest and citation_data['citations']:
-                        # Find competitors that ranked better than our domain
-                        if prompt_data['min_citation_rank'] is None or min(citation_data['citations']) < prompt_data['performance_score']:
-                            competitor_domains.append({
-                                'domain': domain,
-                                'query': query,
-                                'best_citation': min(citation_data['citations']),
-                                'all_citations': citation_data['citations']
-                            })
+            # Get competitors that ranked better than our domain in this prompt
+            # (every cited competitor when our domain was not cited)
+            competitor_domains = [
+                {
+                    'domain': domain,
+                    'query': query,
+                    'best_citation': best_citation,
+                    'all_citations': self.data[prompt][query][domain]['citations']
+                }
+                for query, domain, best_citation in index.prompt_competitors(
+                    prompt, domain_of_interest, prompt_data['performance_score']
+                )
+            ]
             
             # Create competitor info for Gemini analysis with content instead of ranks
             competitor_info = []
@@ -931,47 +1309,130 @@ class SearchAnalytics:
                     # Fallback to rank if domain data not found
                     competitor_info.append(f"Domain {domain} ranked at position {comp['best_citation']} for query: {query}")
             
-            if competitor_info:
-                gemini_analysis = self.call_gemini_analysis(
-                    prompt, 
-                    domain_of_interest, 
-                    competitor_info
-                )
-            else:
+            prompt_data['competitor_count'] = len(competitor_domains)
+            prompt_data['competitor_info'] = competitor_info
+        
+        return worst_prompt_data
+    
+    def _build_poor_performance_entry(self, prompt_data: Dict[str, Any], gemini_analysis: str) -> Dict[str, Any]:
+        """
+        Combine a poor performer's ranking data with its Gemini analysis
+        """
+        # Determine performance rating
+        if prompt_data['min_citation_rank'] is None:
+            performance_rating = 'absent'
+        elif prompt_data['min_citation_rank'] >= 5:
+            performance_rating = 'poor'
+        else:
+            performance_rating = 'suboptimal'
+        
+        return {
+            'performance_rating': performance_rating,
+            'performance_score': prompt_data['performance_score'],
+            'min_citation_rank': prompt_data['min_citation_rank'],
+            'total_citations': prompt_data['total_citations'],
+            'all_citations': prompt_data['all_citations'],
+            'competitor_count': prompt_data['competitor_count'],
+            'competitor_info': prompt_data['competitor_info'],
+            'gemini_analysis': gemini_analysis
+        }
+    
+    def analyze_poor_performance(self, domain_of_interest: str, worst_prompts: int = DEFAULT_WORST_PROMPTS,
+                                 max_concurrency: int = GEMINI_MAX_CONCURRENCY) -> Dict[str, Any]:
+        """
+        Identify the worst prompts where domain performed poorly and get Gemini analysis.
+        
+        The Gemini calls for the selected prompts run concurrently on a shared
+        client, at most max_concurrency at a time.
+        
+        Args:
+            domain_of_interest: Domain to analyze
+            worst_prompts: How many of the worst performing prompts to analyze
+            max_concurrency: Maximum number of simultaneous Gemini calls
+        """
+        worst_prompt_data = self._select_poor_performers(domain_of_interest, worst_prompts)
+        
+        analyses = {}
+        to_analyze = [prompt_data for prompt_data in worst_prompt_data if prompt_data['competitor_info']]
+        
+        if to_analyze:
+            with ThreadPoolExecutor(max_workers=max(1, min(len(to_analyze), max_concurrency))) as executor:
+                futures = {
+                    prompt_data['prompt']: executor.submit(
+                        self.call_gemini_analysis,
+                        prompt_data['prompt'],
+                        domain_of_interest,
+                        prompt_data['competitor_info']
+                    )
+                    for prompt_data in to_analyze
+                }
+                for prompt, future in futures.items():
+                    analyses[prompt] = future.result()
+        
+        poor_performance_analysis = {}
+        
+        for prompt_data in worst_prompt_data:
+            prompt = prompt_data['prompt']
+            gemini_analysis = analyses.get(prompt, "No competitor data available for analysis")
+            poor_performance_analysis[prompt] = self._build_poor_performance_entry(prompt_data, gemini_analysis)
+        
+        return poor_performance_analysis
+    
+    async def analyze_poor_performance_async(self, domain_of_interest: str, worst_prompts: int = DEFAULT_WORST_PROMPTS,
+                                             max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+                                             executor: Optional[Executor] = None,
+                                             on_result: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Async variant of analyze_poor_performance for use inside an event loop.
+        
+        Prompt selection runs on executor (the loop's default executor if None)
+        and the Gemini calls are awaited concurrently, at most max_concurrency
+        at a time. If given, on_result is called with (prompt, entry) as soon
+        as each prompt's analysis finishes.
+        """
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the caller's context so stage timings reach the current request
+        context = contextvars.copy_context()
+        worst_prompt_data = await loop.run_in_executor(
+            executor, context.run, self._select_poor_performers, domain_of_interest, worst_prompts
+        )
+        
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        
+        async def analyze(prompt_data: Dict[str, Any]) -> Dict[str, Any]:
+            if not prompt_data['competitor_info']:
                 gemini_analysis = "No competitor data available for analysis"
-            
-            # Determine performance rating
-            if prompt_data['min_citation_rank'] is None:
-                performance_rating = 'absent'
-            elif prompt_data['min_citation_rank'] >= 5:
-                performance_rating = 'poor'
             else:
-                performance_rating = 'suboptimal'
+                async with semaphore:
+                    gemini_analysis = await self.call_gemini_analysis_async(
+                        prompt_data['prompt'],
+                        domain_of_interest,
+                        prompt_data['competitor_info']
+                    )
             
-            poor_performance_analysis[prompt] = {
-                'performance_rating': performance_rating,
-                'performance_score': prompt_data['performance_score'],
-                'min_citation_rank': prompt_data['min_citation_rank'],
-                'total_citations': prompt_data['total_citations'],
-                'all_citations': prompt_data['all_citations'],
-                'competitor_count': len(competitor_domains),
-                'competitor_info': competitor_info,
-                'gemini_analysis': gemini_analysis
-            }
+            entry = self._build_poor_performance_entry(prompt_data, gemini_analysis)
+            if on_result is not None:
+                on_result(prompt_data['prompt'], entry)
+            return entry
         
-        return poor_performance_analysis
+        entries = await asyncio.gather(*(analyze(prompt_data) for prompt_data in worst_prompt_data))
+        
+        return {
+            prompt_data['prompt']: entry
+            for prompt_data, entry in zip(worst_prompt_data, entries)
+        }
     
-    def print_poor_performance_analysis(self, domain_of_interest: str):
+    def print_poor_performance_analysis(self, domain_of_interest: str, worst_prompts: int = DEFAULT_WORST_PROMPTS):
         """
-        Print detailed analysis of the worst 3 performing prompts with Gemini insights
+        Print detailed analysis of the worst performing prompts with Gemini insights
         """
-        poor_performance = self.analyze_poor_performance(domain_of_interest)
+        poor_performance = self.analyze_poor_performance(domain_of_interest, worst_prompts)
         
         if not poor_performance:
             print(f"\n🎉 No poor performance cases found for {domain_of_interest}!")
             return
         
-        print(f"\n🔍 WORST 3 PROMPTS ANALYSIS FOR {domain_of_interest}")
+        print(f"\n🔍 WORST {len(poor_performance)} PROMPTS ANALYSIS FOR {domain_of_interest}")
         print("=" * 80)
         
         # Sort by performance score to show worst first
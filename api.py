@@ -1,24 +1,234 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from pydantic_core import to_json
+from typing import AsyncIterator, Callable, List, Optional, Dict, Any, Set, Tuple
+import asyncio
+import contextvars
+import functools
+import itertools
+import json
 import os
+import threading
+import time
+from admission import AdmissionController, AdmissionRejected
 from analytics import (
     load_and_process_experiment_results, 
     load_multiple_experiment_files,
     SearchAnalytics,
-    analyze_experiment_results
+    analyze_experiment_results,
+    gemini_analysis_cache,
+    DEFAULT_WORST_PROMPTS,
+    GEMINI_MAX_CONCURRENCY,
+    REPORT_SECTION_ORDER,
+    get_gemini_client,
+    is_gemini_error
 )
+from cache import PersistentResultCache, TTLLRUCache, get_file_fingerprint
+from experiment_diff import DEFAULT_MIN_SAMPLES, DEFAULT_SIGNIFICANCE_LEVEL, diff_experiment_sets
+from jobs import JobManager, ProgressCallback
+from metrics import PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, record_cache_outcome, record_stage, registry, stage
+from serialization import json_response
+from shared_dataset import SharedDatasetStore
+
+API_VERSION = "1.0.0"
+DEFAULT_EXPERIMENT_FILE = "gemini_experiment_results.json"
+
+# Let browsers and reverse proxies reuse analyses briefly and revalidate them cheaply via ETag
+ANALYSIS_CACHE_CONTROL = os.getenv('ANALYSIS_CACHE_CONTROL', 'public, max-age=60, stale-while-revalidate=300')
+EXPERIMENT_FILES_CACHE_CONTROL = "public, max-age=10"
+
+# Key order of the enhanced report returned by /analyze
+ENHANCED_REPORT_ORDER = (
+    "overview",
+    "query_frequency_stats",
+    "prompt_stats",
+    "domain_analysis",
+    "query_analysis",
+    "response_chunks_analysis",
+    "gemini_analysis",
+    "domain_detailed_stats",
+    "intersecting_queries",
+    "recommendations",
+    "competitive_insights"
+)
+
+# Sections only computed when requested explicitly through `sections`
+OPTIONAL_REPORT_SECTIONS = (
+    "query_clusters",
+    "intersecting_query_clusters"
+)
+ALL_REPORT_SECTIONS = ENHANCED_REPORT_ORDER + OPTIONAL_REPORT_SECTIONS
+
+# Sections whose data maps a query or prompt to a stats entry; field
+# projection applies to each entry rather than to the section itself
+ENTRY_MAP_SECTIONS = {
+    "prompt_stats", "query_analysis", "intersecting_queries", "response_chunks_analysis", "intersecting_query_clusters"
+}
+
+# Large per-query maps that can be paginated: section -> key of the map inside it (None for the section itself)
+PAGINATED_SECTIONS = {
+    "query_frequency_stats": "query_details",
+    "query_analysis": None,
+    "intersecting_queries": None,
+    "query_clusters": "cluster_details",
+    "intersecting_query_clusters": None
+}
+
+# Bounded pool for file I/O and pure-Python aggregation, keeping both off the event loop
+analysis_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ANALYSIS_WORKERS', '4')),
+    thread_name_prefix="analysis"
+)
+
+# Background analysis jobs; finished results are kept for JOB_RESULT_TTL_SECONDS
+job_manager = JobManager(result_ttl_seconds=float(os.getenv('JOB_RESULT_TTL_SECONDS', '3600')))
+
+# At most MAX_CONCURRENT_ANALYSES analyses (including background jobs) run at once and
+# MAX_QUEUED_ANALYSES more may wait; anything beyond that is rejected with 429
+admission_controller = AdmissionController(
+    max_concurrent=int(os.getenv('MAX_CONCURRENT_ANALYSES', '4')),
+    max_queue=int(os.getenv('MAX_QUEUED_ANALYSES', '16')),
+    queue_timeout_seconds=float(os.getenv('ANALYSIS_QUEUE_TIMEOUT_SECONDS', '30'))
+)
+
+def too_many_requests(rejection: AdmissionRejected) -> HTTPException:
+    """Turn an admission rejection into a 429 carrying a Retry-After hint"""
+    return HTTPException(
+        status_code=429,
+        detail=f"{rejection.reason}; retry after {rejection.retry_after}s",
+        headers={"Retry-After": str(rejection.retry_after)}
+    )
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking function on the analysis executor and await its result"""
+    loop = asyncio.get_running_loop()
+    # Run in a copy of the caller's context so stage timings reach the current request
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(analysis_executor, context.run, functools.partial(func, *args, **kwargs))
+
+# Loaded SearchAnalytics instances, keyed by the fingerprints of their experiment files
+analytics_cache = TTLLRUCache(
+    max_entries=int(os.getenv('ANALYTICS_CACHE_SIZE', '8')),
+    ttl_seconds=float(os.getenv('ANALYTICS_CACHE_TTL_SECONDS', '3600'))
+)
+
+# With several uvicorn workers, set SHARED_DATASET_DIR so processed datasets are published
+# there once and memory-mapped read-only by every worker instead of loaded per process
+SHARED_DATASET_DIR = os.getenv('SHARED_DATASET_DIR')
+shared_dataset_store = SharedDatasetStore(SHARED_DATASET_DIR) if SHARED_DATASET_DIR else None
+
+# Set ANALYTICS_BACKEND=sqlite to compute the domain, query and intersecting-query
+# analyses from the SQLite store at ANALYTICS_DB_PATH instead of in memory
+ANALYTICS_BACKEND = os.getenv('ANALYTICS_BACKEND', 'memory')
+ANALYTICS_DB_PATH = os.getenv('ANALYTICS_DB_PATH', 'search_analytics.sqlite3')
+analytics_store = None
+analytics_store_lock = threading.Lock()
+
+def get_analytics_store():
+    """Return the SQLite analytics store, opening it on first use"""
+    global analytics_store
+    with analytics_store_lock:
+        if analytics_store is None:
+            from sqlite_store import SQLiteAnalyticsStore
+            analytics_store = SQLiteAnalyticsStore(ANALYTICS_DB_PATH)
+        return analytics_store
+
+def get_analytics(experiment_files: List[str]) -> Tuple[Optional[SearchAnalytics], bool]:
+    """
+    Return a SearchAnalytics instance for the given experiment files, reusing a cached one when possible.
+    
+    Args:
+        experiment_files: Paths of the experiment files to analyze
+        
+    Returns:
+        Tuple of (analytics or None if the files hold no search data, was_cache_hit)
+    """
+    fingerprints = [get_file_fingerprint(file_path) for file_path in experiment_files]
+    cache_key = tuple(
+        (fingerprint['path'], fingerprint['size'], fingerprint['mtime_ns'], fingerprint['sha256'])
+        for fingerprint in fingerprints
+    )
+    
+    def load_data() -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        if len(experiment_files) == 1:
+            return load_and_process_experiment_results(experiment_files[0])
+        return load_multiple_experiment_files(experiment_files)
+    
+    def make_analytics(search_data: Dict[str, Any], response_chunks: Dict[str, Any]) -> SearchAnalytics:
+        if ANALYTICS_BACKEND == 'sqlite':
+            from sqlite_store import SQLiteBackedAnalytics
+            return SQLiteBackedAnalytics(search_data, response_chunks, get_analytics_store(), experiment_files)
+        return SearchAnalytics(search_data, response_chunks)
+    
+    def load_analytics() -> Optional[SearchAnalytics]:
+        if shared_dataset_store is not None:
+            # Only the first worker to need these files loads them; the rest map the published file
+            dataset = shared_dataset_store.get_or_publish(fingerprints, load_data)
+            if dataset is None:
+                return None
+            return make_analytics(dataset.data, dataset.response_chunks)
+        
+        search_data, response_chunks = load_data()
+        if not search_data:
+            return None
+        return make_analytics(search_data, response_chunks)
+    
+    analytics, cache_hit = analytics_cache.get_or_create(cache_key, load_analytics)
+    record_cache_outcome("analytics", cache_hit)
+    return analytics, cache_hit
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmups = []
+    # Preload the default dataset so the first dashboard request does not pay for loading it
+    if os.path.exists(DEFAULT_EXPERIMENT_FILE):
+        warmups.append(run_blocking(get_analytics, [DEFAULT_EXPERIMENT_FILE]))
+    # Build the Gemini client (and import its SDK) now rather than in the first analysis request
+    if os.getenv('GEMINI_API_KEY'):
+        warmups.append(run_blocking(get_gemini_client))
+    await asyncio.gather(*warmups)
+    yield
 
 app = FastAPI(
     title="Search Analytics API",
     description="API for analyzing search performance and domain citations in AI-powered search results",
-    version="1.0.0"
+    version=API_VERSION,
+    lifespan=lifespan
 )
+app.add_middleware(MetricsMiddleware, run_blocking=run_blocking)
 
 class AnalysisRequest(BaseModel):
     prompts: List[str] = []  # Ignored for now as mentioned
     target_domain: str
     experiment_files: Optional[List[str]] = None  # Optional list of experiment files to analyze
+    worst_prompts: int = Field(default=DEFAULT_WORST_PROMPTS, ge=0, le=50)  # Worst prompts sent to Gemini for analysis
+    sections: Optional[List[str]] = None  # Report sections to compute; all standard sections if omitted (clusters are opt-in)
+    fields: Optional[List[str]] = None  # "section.field" entries to keep; other fields of those sections are dropped
+    page: int = Field(default=1, ge=1)  # Page of the large per-query maps to return
+    page_size: Optional[int] = Field(default=None, ge=1, le=10000)  # Entries per page; no pagination if omitted
+    
+    @field_validator("sections")
+    @classmethod
+    def validate_sections(cls, sections: Optional[List[str]]) -> Optional[List[str]]:
+        if sections is not None:
+            unknown = [name for name in sections if name not in ALL_REPORT_SECTIONS]
+            if unknown:
+                raise ValueError(f"Unknown sections {unknown}; valid sections are {list(ALL_REPORT_SECTIONS)}")
+        return sections
+    
+    @field_validator("fields")
+    @classmethod
+    def validate_fields(cls, fields: Optional[List[str]]) -> Optional[List[str]]:
+        for field in fields or []:
+            section, _, name = field.partition(".")
+            if section not in ALL_REPORT_SECTIONS or not name:
+                raise ValueError(f"Invalid field '{field}'; expected '<section>.<field>' with a valid section name")
+        return fields
 
 class AnalysisResponse(BaseModel):
     success: bool
@@ -26,14 +236,34 @@ class AnalysisResponse(BaseModel):
     error: Optional[str] = None
     metadata: Optional[Dict[str, Any]] = None
 
+class DiffRequest(BaseModel):
+    before_files: List[str] = Field(min_length=1)  # Experiment files of the earlier run
+    after_files: List[str] = Field(min_length=1)  # Experiment files of the later run
+    target_domain: Optional[str] = None  # Adds per-query/per-prompt target metrics and competitor displacement
+    significance_level: float = Field(default=DEFAULT_SIGNIFICANCE_LEVEL, gt=0, lt=1)
+    min_samples: int = Field(default=DEFAULT_MIN_SAMPLES, ge=1)  # Observations per side before a change is flagged
+    max_domains: Optional[int] = Field(default=100, ge=1)  # Domains returned, most significant changes first
+    max_queries: Optional[int] = Field(default=100, ge=1)  # Changed queries returned, largest changes first
+    max_prompts: Optional[int] = Field(default=100, ge=1)  # Changed prompts returned, largest changes first
+    include_queries: bool = True
+    include_prompts: bool = True
+    include_unchanged: bool = False  # Also list queries and prompts that did not change
+
 @app.get("/")
 async def root():
     return {
         "message": "Search Analytics API",
-        "version": "1.0.0",
+        "version": API_VERSION,
         "endpoints": {
-            "analyze": "POST /analyze - Analyze domain performance",
-            "health": "GET /health - Health check"
+            "analyze": "POST /analyze - Analyze domain performance (also GET /analyze with query parameters, ETag-cacheable)",
+            "analyze_stream": "POST /analyze/stream - Analyze domain performance, streaming report sections as NDJSON",
+            "jobs": "POST /jobs - Start a background analysis; GET /jobs/{job_id} and GET /jobs/{job_id}/events for result and progress",
+            "competitors": "GET /competitors - Domains that out-rank a target domain, with the queries where they do",
+            "metrics": "GET /metrics - Prometheus metrics: request latency, stage timings, payload sizes, cache outcomes",
+            "snippet_search": "GET /snippets/search - Full-text search over cited snippets, with the prompts, queries and domains citing them",
+            "diff": "POST /diff - Per-domain, per-query and per-prompt deltas between two experiment sets, with significance flags",
+            "health": "GET /health - Health check",
+            "stats": "GET /stats - Cache, job and admission-control statistics"
         }
     }
 
@@ -41,68 +271,250 @@ async def root():
 async def health():
     return {"status": "healthy", "service": "search-analytics-api"}
 
-@app.post("/analyze", response_model=AnalysisResponse)
-async def analyze_domain_performance(request: AnalysisRequest):
+@app.get("/stats")
+async def stats():
+    """Report cache hit/miss statistics, job counts and admission queue metrics"""
+    return {
+        "analytics_cache": analytics_cache.stats(),
+        "gemini_analysis_cache": gemini_analysis_cache.stats(),
+        "jobs": job_manager.stats(),
+        "admission": admission_controller.stats(),
+        "shared_datasets": shared_dataset_store.stats() if shared_dataset_store is not None else None
+    }
+
+def collect_runtime_gauges() -> List[Tuple[str, str, Tuple[str, ...], Dict[Tuple[str, ...], float]]]:
+    """Expose admission-control load and analytics cache size as gauges at scrape time"""
+    admission = admission_controller.stats()
+    return [
+        ("search_analytics_admission_active", "Analyses currently holding a slot", (), {(): admission['active']}),
+        ("search_analytics_admission_queue_depth", "Analyses waiting for a slot", (), {(): admission['queue_depth']}),
+        ("search_analytics_cached_datasets", "Loaded datasets held in the analytics cache", (),
+         {(): analytics_cache.stats()['size']}),
+    ]
+
+registry.register_collector(collect_runtime_gauges)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(registry.render(), headers={"Content-Type": PROMETHEUS_CONTENT_TYPE})
+
+def resolve_experiment_files(experiment_files: Optional[List[str]]) -> List[str]:
     """
-    Analyze domain performance in search results
+    Validate the requested experiment files, falling back to the default file
     
-    Args:
-        request: Contains target_domain and optionally experiment_files
-        
-    Returns:
-        Comprehensive analysis results including:
-        - Domain statistics (retrieval rate, usage rate, citation rank)
-        - Query analysis
-        - Performance insights
-        - Recommendations
-        - Gemini AI-powered competitive analysis
+    Raises:
+        HTTPException: If a requested file or the default file does not exist
     """
-    try:
-        # Determine which experiment files to use
-        if request.experiment_files:
-            # Use provided experiment files
-            experiment_files = request.experiment_files
-            # Validate that files exist
-            for file_path in experiment_files:
-                if not os.path.exists(file_path):
-                    raise HTTPException(
-                        status_code=400, 
-                        detail=f"Experiment file not found: {file_path}"
-                    )
-        else:
-            # Use default experiment file
-            default_file = "gemini_experiment_results.json"
-            if not os.path.exists(default_file):
+    if experiment_files:
+        # Validate that files exist
+        for file_path in experiment_files:
+            if not os.path.exists(file_path):
                 raise HTTPException(
-                    status_code=404,
-                    detail=f"Default experiment file not found: {default_file}. Either provide experiment_files or ensure {default_file} exists."
+                    status_code=400, 
+                    detail=f"Experiment file not found: {file_path}"
                 )
-            experiment_files = [default_file]
-        
-        # Load and process experiment data
-        if len(experiment_files) == 1:
-            search_data, response_chunks = load_and_process_experiment_results(experiment_files[0])
-        else:
-            search_data, response_chunks = load_multiple_experiment_files(experiment_files)
-        
-        if not search_data:
-            raise HTTPException(
-                status_code=400,
-                detail="No valid search data found in the experiment files"
-            )
+        return experiment_files
+    
+    # Use default experiment file
+    default_file = DEFAULT_EXPERIMENT_FILE
+    if not os.path.exists(default_file):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Default experiment file not found: {default_file}. Either provide experiment_files or ensure {default_file} exists."
+        )
+    return [default_file]
+
+def parse_field_projection(fields: Optional[List[str]]) -> Dict[str, Set[str]]:
+    """Group "section.field" entries into a section -> fields mapping"""
+    projection: Dict[str, Set[str]] = {}
+    for field in fields or []:
+        section, _, name = field.partition(".")
+        projection.setdefault(section, set()).add(name)
+    return projection
+
+def project_section(name: str, data: Any, projection: Dict[str, Set[str]]) -> Any:
+    """
+    Keep only the requested fields of a section
+    
+    For per-query/per-prompt sections the fields are picked from every entry;
+    sections without a projection are returned unchanged.
+    """
+    keep = projection.get(name)
+    if not keep or not isinstance(data, dict):
+        return data
+    
+    if name in ENTRY_MAP_SECTIONS:
+        return {
+            key: {field: value for field, value in entry.items() if field in keep} if isinstance(entry, dict) else entry
+            for key, entry in data.items()
+        }
+    return {field: value for field, value in data.items() if field in keep}
+
+def paginate_section(name: str, data: Any, page: int, page_size: Optional[int]) -> Tuple[Any, Optional[int]]:
+    """
+    Slice the per-query map of a paginated section down to one page
+    
+    Returns:
+        Tuple of (section data with only the requested page, total number of entries or None if not paginated)
+    """
+    if page_size is None or name not in PAGINATED_SECTIONS or not isinstance(data, dict):
+        return data, None
+    
+    map_key = PAGINATED_SECTIONS[name]
+    entries = data.get(map_key) if map_key else data
+    if not isinstance(entries, dict):
+        return data, None
+    
+    start = (page - 1) * page_size
+    page_entries = dict(itertools.islice(entries.items(), start, start + page_size))
+    
+    if map_key:
+        return {**data, map_key: page_entries}, len(entries)
+    return page_entries, len(entries)
+
+async def iter_analysis_sections(request: AnalysisRequest, progress: Optional[ProgressCallback] = None) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Compute the enhanced analysis report one section at a time
+    
+    'metadata' is yielded first, followed by the report sections from cheapest
+    to most expensive; the Gemini-backed sections come last.
+    
+    Args:
+        request: Contains target_domain and optionally experiment_files
+        progress: Optional callback receiving (stage, details) as the analysis advances
         
-        # Initialize analytics
-        analytics = SearchAnalytics(search_data, response_chunks)
+    Yields:
+        (section_name, section_data) pairs
         
-        # Generate comprehensive report (now includes Gemini analysis automatically)
-        report = analytics.generate_comprehensive_report(request.target_domain)
+    Raises:
+        HTTPException: If the experiment files are missing or hold no search data
+    """
+    def report_progress(stage: str, **details) -> None:
+        if progress is not None:
+            progress(stage, details)
+    
+    # Validate files and load experiment data off the event loop,
+    # reusing an already loaded dataset for unchanged files
+    report_progress("loading")
+    with stage("validate_files"):
+        experiment_files = await run_blocking(resolve_experiment_files, request.experiment_files)
+    with stage("load"):
+        analytics, cache_hit = await run_blocking(get_analytics, experiment_files)
+    
+    if analytics is None:
+        raise HTTPException(
+            status_code=400,
+            detail="No valid search data found in the experiment files"
+        )
+    
+    search_data = analytics.data
+    response_chunks = analytics.response_chunks
+    report_progress("loaded", experiment_files=experiment_files, prompts=len(search_data), cache_hit=cache_hit)
+    
+    # Prepare metadata
+    yield "metadata", {
+        "target_domain": request.target_domain,
+        "experiment_files": experiment_files,
+        "total_prompts_analyzed": len(search_data),
+        "has_gemini_api": bool(os.getenv('GEMINI_API_KEY')),
+        "has_response_chunks": bool(response_chunks),
+        "analytics_cache_hit": cache_hit,
+        "requested_sections": request.sections,
+        "analysis_timestamp": None  # Could add timestamp if needed
+    }
+    
+    # Only compute what was asked for; recommendations are derived from the Gemini analysis
+    wanted = set(request.sections) if request.sections is not None else set(ENHANCED_REPORT_ORDER)
+    projection = parse_field_projection(request.fields)
+    total_items: Dict[str, int] = {}
+    
+    def shape_section(name: str, data: Any) -> Any:
+        # Paginate the large per-query maps, then apply the field projection
+        data, total = paginate_section(name, data, request.page, request.page_size)
+        if total is not None:
+            total_items[name] = total
+        return project_section(name, data, projection)
+    
+    needs_gemini = bool(wanted & {"gemini_analysis", "recommendations"})
+    
+    analytics_sections = wanted & set(REPORT_SECTION_ORDER)
+    if "domain_detailed_stats" in wanted:
+        analytics_sections.add("domain_analysis")
+    
+    # Step through the report sections on the analysis executor; the Gemini
+    # section is awaited separately through the async client
+    report = {}
+    sections = analytics.iter_report_sections(
+        request.target_domain, include_gemini=False, sections=analytics_sections
+    )
+    competitive_insights_sent = "competitive_insights" not in wanted
+    while True:
+        started = time.perf_counter()
+        section = await run_blocking(next, sections, None)
+        if section is None:
+            break
         
-        # Add additional analysis specific to the domain
-        domain_stats = analytics.calculate_domain_stats(request.target_domain)
-        intersecting_queries = analytics.analyze_intersecting_queries()
+        name, data = section
+        record_stage(f"section.{name}", time.perf_counter() - started)
+        report[name] = data
+        report_progress("section_ready", section=name)
+        if name in wanted:
+            yield name, shape_section(name, data)
         
-        # Extract Gemini analysis from the comprehensive report
-        gemini_analysis_from_report = report.get('gemini_analysis', {})
+        # Add additional analysis specific to the domain right behind the domain stats
+        if name == "domain_analysis":
+            if "domain_detailed_stats" in wanted:
+                yield "domain_detailed_stats", shape_section("domain_detailed_stats", data)
+            if not competitive_insights_sent:
+                with stage("section.competitive_insights"):
+                    competitive_insights = await run_blocking(
+                        generate_competitive_insights, analytics, request.target_domain
+                    )
+                report_progress("section_ready", section="competitive_insights")
+                yield "competitive_insights", shape_section("competitive_insights", competitive_insights)
+                competitive_insights_sent = True
+    
+    if not competitive_insights_sent:
+        with stage("section.competitive_insights"):
+            competitive_insights = await run_blocking(
+                generate_competitive_insights, analytics, request.target_domain
+            )
+        report_progress("section_ready", section="competitive_insights")
+        yield "competitive_insights", shape_section("competitive_insights", competitive_insights)
+    
+    if "intersecting_queries" in wanted:
+        with stage("section.intersecting_queries"):
+            intersecting_queries = await run_blocking(analytics.analyze_intersecting_queries)
+        report_progress("section_ready", section="intersecting_queries")
+        yield "intersecting_queries", shape_section("intersecting_queries", intersecting_queries)
+    
+    # Near-duplicate query clusters (opt-in)
+    if "query_clusters" in wanted:
+        with stage("section.query_clusters"):
+            query_clusters = await run_blocking(analytics.calculate_query_cluster_stats)
+        report_progress("section_ready", section="query_clusters")
+        yield "query_clusters", shape_section("query_clusters", query_clusters)
+    if "intersecting_query_clusters" in wanted:
+        with stage("section.intersecting_query_clusters"):
+            intersecting_query_clusters = await run_blocking(analytics.analyze_intersecting_query_clusters)
+        report_progress("section_ready", section="intersecting_query_clusters")
+        yield "intersecting_query_clusters", shape_section("intersecting_query_clusters", intersecting_query_clusters)
+    
+    if needs_gemini:
+        report_progress("gemini_analysis", worst_prompts=request.worst_prompts)
+        with stage("section.gemini_analysis"):
+            gemini_analysis_from_report = await analytics.analyze_poor_performance_async(
+                request.target_domain,
+                request.worst_prompts,
+                max_concurrency=GEMINI_MAX_CONCURRENCY,
+                executor=analysis_executor,
+                on_result=lambda prompt, entry: report_progress(
+                    "gemini_prompt_analyzed", prompt=prompt, performance_rating=entry['performance_rating'],
+                    failed=is_gemini_error(entry['gemini_analysis'])
+                )
+            )
+        report['gemini_analysis'] = gemini_analysis_from_report
         
         # Format Gemini analysis for API response
         gemini_analysis = {
@@ -117,30 +529,111 @@ async def analyze_domain_performance(request: AnalysisRequest):
         elif not os.getenv('GEMINI_API_KEY'):
             gemini_analysis["note"] = "GEMINI_API_KEY not set - Gemini analysis may contain error messages"
         
-        # Prepare metadata
-        metadata = {
-            "target_domain": request.target_domain,
-            "experiment_files": experiment_files,
-            "total_prompts_analyzed": len(search_data),
-            "has_gemini_api": bool(os.getenv('GEMINI_API_KEY')),
-            "has_response_chunks": bool(response_chunks),
-            "analysis_timestamp": None  # Could add timestamp if needed
+        report_progress("section_ready", section="gemini_analysis")
+        if "gemini_analysis" in wanted:
+            yield "gemini_analysis", shape_section("gemini_analysis", gemini_analysis)
+        if "recommendations" in wanted:
+            yield "recommendations", generate_recommendations(report.get('domain_analysis', {}), report, gemini_analysis)
+    
+    if request.page_size is not None:
+        yield "pagination", {
+            "page": request.page,
+            "page_size": request.page_size,
+            "total_items": total_items,
+            "total_pages": {name: -(-total // request.page_size) for name, total in total_items.items()}
         }
+
+async def run_analysis(request: AnalysisRequest, progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """
+    Run the full domain analysis for a request
+    
+    Args:
+        request: Contains target_domain and optionally experiment_files
+        progress: Optional callback receiving (stage, details) as the analysis advances
         
-        # Enhanced response with additional insights including Gemini analysis
-        enhanced_report = {
-            **report,
-            "domain_detailed_stats": domain_stats,
-            "intersecting_queries": intersecting_queries,
-            "gemini_analysis": gemini_analysis,
-            "recommendations": generate_recommendations(domain_stats, report, gemini_analysis),
-            "competitive_insights": generate_competitive_insights(analytics, request.target_domain)
-        }
+    Returns:
+        Dictionary with the enhanced report under 'data' and request metadata under 'metadata'
+    """
+    sections = {}
+    async for name, data in iter_analysis_sections(request, progress):
+        sections[name] = data
+    
+    metadata = sections.pop("metadata")
+    if "pagination" in sections:
+        metadata["pagination"] = sections.pop("pagination")
+    
+    # Enhanced response with additional insights including Gemini analysis
+    enhanced_report = {name: sections[name] for name in ALL_REPORT_SECTIONS if name in sections}
+    
+    return {"data": enhanced_report, "metadata": metadata}
+
+def compute_etag(*parts: Any) -> str:
+    """Build a weak ETag from JSON-serializable parts (weak because the body encoding may vary)"""
+    return f'W/"{PersistentResultCache.make_key(API_VERSION, *parts)}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    
+    def opaque(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+    
+    return any(opaque(candidate) == opaque(etag) for candidate in if_none_match.split(","))
+
+def not_modified(cache_headers: Dict[str, str]) -> Response:
+    """304 for a client copy that is still current, varying on encoding like the full response"""
+    return Response(status_code=304, headers={"Vary": "Accept-Encoding", **cache_headers})
+
+def compute_analysis_etag(experiment_files: List[str], request: AnalysisRequest) -> str:
+    """
+    Derive a deterministic ETag for an analysis from its input files and options
+    
+    Files are identified by their fingerprints, so the tag changes as soon as
+    any input file changes, without loading or analyzing anything.
+    """
+    fingerprints = [get_file_fingerprint(file_path) for file_path in experiment_files]
+    options = request.model_dump(exclude={"prompts", "experiment_files"})
+    return compute_etag(fingerprints, options, bool(os.getenv('GEMINI_API_KEY')))
+
+async def respond_with_analysis(request: AnalysisRequest, http_request: Request) -> Response:
+    """
+    Run an analysis and encode it, answering 304 up front if the client's copy is current
+    """
+    try:
+        experiment_files = await run_blocking(resolve_experiment_files, request.experiment_files)
+        etag = await run_blocking(compute_analysis_etag, experiment_files, request)
+        cache_headers = {"ETag": etag, "Cache-Control": ANALYSIS_CACHE_CONTROL}
+        
+        client_copy_current = etag_matches(http_request.headers.get("if-none-match"), etag)
+        record_cache_outcome("etag", client_copy_current)
+        if client_copy_current:
+            return not_modified(cache_headers)
+        
+        # The tag only covers the inputs, so a report with failed Gemini calls must not be cached under it
+        failed_gemini_prompts = []
+        
+        def track_gemini_failures(stage_name: str, details: Dict[str, Any]) -> None:
+            if stage_name == "gemini_prompt_analyzed" and details.get("failed"):
+                failed_gemini_prompts.append(details["prompt"])
         
-        return AnalysisResponse(
-            success=True,
-            data=enhanced_report,
-            metadata=metadata
+        try:
+            async with admission_controller.admit():
+                result = await run_analysis(request, track_gemini_failures)
+        except AdmissionRejected as rejection:
+            raise too_many_requests(rejection)
+        
+        if failed_gemini_prompts:
+            cache_headers = {"Cache-Control": "no-store"}
+        
+        return await json_response(
+            {"success": True, "data": result["data"], "error": None, "metadata": result["metadata"]},
+            http_request.headers.get("accept-encoding"),
+            headers=cache_headers,
+            run_blocking=run_blocking
         )
         
     except HTTPException:
@@ -153,6 +646,304 @@ async def analyze_domain_performance(request: AnalysisRequest):
             detail=f"Internal server error during analysis: {str(e)}"
         )
 
+@app.post("/analyze", response_model=AnalysisResponse)
+async def analyze_domain_performance(request: AnalysisRequest, http_request: Request):
+    """
+    Analyze domain performance in search results
+    
+    Args:
+        request: Contains target_domain and optionally experiment_files
+        
+    Returns:
+        Comprehensive analysis results including:
+        - Domain statistics (retrieval rate, usage rate, citation rank)
+        - Query analysis
+        - Performance insights
+        - Recommendations
+        - Gemini AI-powered competitive analysis
+        
+    The report is encoded straight to JSON (bypassing response-model
+    validation of the large data dict) and gzip/brotli-compressed when the
+    client accepts it. Responses carry an ETag derived from the input file
+    fingerprints and request options; a matching If-None-Match gets a 304.
+    Reports with failed Gemini calls get no ETag and are not cacheable.
+    """
+    return await respond_with_analysis(request, http_request)
+
+@app.get("/analyze", response_model=AnalysisResponse)
+async def analyze_domain_performance_get(
+    http_request: Request,
+    target_domain: str,
+    experiment_files: Optional[List[str]] = Query(default=None),
+    worst_prompts: int = DEFAULT_WORST_PROMPTS,
+    sections: Optional[List[str]] = Query(default=None),
+    fields: Optional[List[str]] = Query(default=None),
+    page: int = 1,
+    page_size: Optional[int] = None
+):
+    """
+    Cacheable GET variant of POST /analyze taking the same options as query parameters
+    
+    List options (experiment_files, sections, fields) are given by repeating
+    the parameter. Reverse proxies can cache these responses by URL.
+    """
+    try:
+        request = AnalysisRequest(
+            target_domain=target_domain,
+            experiment_files=experiment_files,
+            worst_prompts=worst_prompts,
+            sections=sections,
+            fields=fields,
+            page=page,
+            page_size=page_size
+        )
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    
+    return await respond_with_analysis(request, http_request)
+
+@app.post("/analyze/stream")
+async def stream_domain_performance(request: AnalysisRequest):
+    """
+    Analyze domain performance, streaming each report section as soon as it is computed
+    
+    The response is NDJSON: one {"section": name, "data": ...} object per line,
+    starting with "metadata" and ending with {"section": "done"}. Cheap sections
+    such as the overview and domain stats arrive before the Gemini analysis.
+    A failure mid-stream is reported as a final {"section": "error"} line.
+    """
+    # Resolve the files and take an analysis slot up front so a bad or
+    # rejected request still gets a proper 4xx status
+    await run_blocking(resolve_experiment_files, request.experiment_files)
+    try:
+        await admission_controller.acquire()
+    except AdmissionRejected as rejection:
+        raise too_many_requests(rejection)
+    started = time.monotonic()
+    
+    async def ndjson_lines():
+        try:
+            async for name, data in iter_analysis_sections(request):
+                yield to_json({"section": name, "data": data}) + b"\n"
+            yield to_json({"section": "done"}) + b"\n"
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else f"Internal server error during analysis: {str(e)}"
+            yield to_json({"section": "error", "error": detail}) + b"\n"
+    
+    # The slot is released once the response finishes, even if the client disconnects mid-stream
+    return StreamingResponse(
+        ndjson_lines(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(lambda: admission_controller.release(time.monotonic() - started))
+    )
+
+@app.post("/jobs", status_code=202)
+async def submit_analysis_job(request: AnalysisRequest):
+    """
+    Start an analysis in the background and return its job id immediately
+    
+    Progress is streamed from GET /jobs/{job_id}/events and the finished
+    result is fetched from GET /jobs/{job_id}.
+    
+    Jobs share the analysis slots with /analyze: the job's slot, or its place
+    in the wait queue, is reserved before the job id is returned, and the job
+    then waits (without a timeout) until it holds the slot. Requests are
+    refused with 429 when the wait queue is already full.
+    """
+    try:
+        reservation = admission_controller.reserve()
+    except AdmissionRejected as rejection:
+        raise too_many_requests(rejection)
+    
+    async def run_admitted_analysis(progress: ProgressCallback) -> Dict[str, Any]:
+        waited = await admission_controller.wait(reservation, timeout=None)
+        started = time.monotonic()
+        try:
+            progress("admitted", {"queue_wait_seconds": waited})
+            return await run_analysis(request, progress)
+        finally:
+            admission_controller.release(time.monotonic() - started)
+    
+    try:
+        job = job_manager.submit(run_admitted_analysis)
+    except BaseException:
+        admission_controller.cancel(reservation)
+        raise
+    
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.job_id}",
+        "events_url": f"/jobs/{job.job_id}/events"
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_analysis_job(job_id: str, http_request: Request):
+    """Return a job's status, and its AnalysisResponse-shaped result once finished"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found or expired: {job_id}")
+    
+    summary = job.to_dict(include_result=False)
+    if job.status == "completed":
+        summary["result"] = {"success": True, "data": job.result["data"], "error": None, "metadata": job.result["metadata"]}
+    elif job.status == "failed":
+        summary["result"] = {"success": False, "data": None, "error": job.error, "metadata": None}
+    return await json_response(summary, http_request.headers.get("accept-encoding"), run_blocking=run_blocking)
+
+@app.get("/jobs/{job_id}/events")
+async def stream_analysis_job_events(job_id: str, last_event_id: Optional[str] = Header(default=None)):
+    """
+    Stream a job's progress as Server-Sent Events until it finishes
+    
+    Clients reconnecting with a Last-Event-ID header resume after that event.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found or expired: {job_id}")
+    
+    start = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+    
+    async def event_stream():
+        async for event in job.iter_events(start):
+            yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/competitors")
+async def get_competitors(
+    http_request: Request,
+    target_domain: str,
+    experiment_files: Optional[List[str]] = Query(default=None),
+    limit: int = Query(default=10, ge=1, le=1000)
+):
+    """
+    List the domains that out-rank the target domain most often, and on which queries
+    
+    Answered from the dataset's precomputed co-occurrence index, so repeated
+    calls for the same dataset are lookups rather than scans.
+    """
+    experiment_files = await run_blocking(resolve_experiment_files, experiment_files)
+    analytics, _ = await run_blocking(get_analytics, experiment_files)
+    if analytics is None:
+        raise HTTPException(status_code=400, detail="No valid search data found in experiment files")
+    
+    def lookup() -> Dict[str, Any]:
+        index = analytics.get_cooccurrence_index()
+        outranked_by = index.outranked_by(target_domain)
+        cooccurrence = index.cooccurrence(target_domain)
+        return {
+            "target_domain": target_domain,
+            "total_appearances": index.domain_frequency(target_domain),
+            "outranked_by": [
+                {"domain": domain, "cooccurrences": cooccurrence.get(domain, 0), **entry}
+                for domain, entry in itertools.islice(outranked_by.items(), limit)
+            ]
+        }
+    
+    return await json_response(
+        await run_blocking(lookup), http_request.headers.get("accept-encoding"), run_blocking=run_blocking
+    )
+
+@app.get("/snippets/search")
+async def search_snippets(
+    http_request: Request,
+    q: str = Query(min_length=1),
+    experiment_files: Optional[List[str]] = Query(default=None),
+    domain: Optional[str] = None,
+    prompt: Optional[str] = None,
+    prefix: bool = False,
+    limit: int = Query(default=20, ge=1, le=1000)
+):
+    """
+    Find the cited snippets that mention every term of q, most cited first
+    
+    Answered from the dataset's inverted snippet index, which is built on the
+    first search and reused for later ones. Set prefix=true to match the last
+    term as a prefix.
+    """
+    experiment_files = await run_blocking(resolve_experiment_files, experiment_files)
+    analytics, _ = await run_blocking(get_analytics, experiment_files)
+    if analytics is None:
+        raise HTTPException(status_code=400, detail="No valid search data found in experiment files")
+    
+    def lookup() -> Dict[str, Any]:
+        result = analytics.get_snippet_index().search(q, domain=domain, prompt=prompt, limit=limit, prefix=prefix)
+        return {"query": q, **result}
+    
+    return await json_response(
+        await run_blocking(lookup), http_request.headers.get("accept-encoding"), run_blocking=run_blocking
+    )
+
+@app.post("/diff")
+async def diff_experiments(request: DiffRequest, http_request: Request):
+    """
+    Compare two experiment sets, e.g. the same prompts re-run after a content change
+    
+    Returns per-domain retrieval/usage rate and best-rank deltas, new and lost
+    citations per query and prompt and, for target_domain, the competitors
+    that displaced it, each change flagged by a significance test. Both sets
+    come from the analytics cache and are diffed in one pass over their
+    indexes. Responses carry an ETag derived from both sets' file fingerprints
+    and the options; a matching If-None-Match gets a 304.
+    """
+    before_files = await run_blocking(resolve_experiment_files, request.before_files)
+    after_files = await run_blocking(resolve_experiment_files, request.after_files)
+    
+    def fingerprints(files: List[str]) -> List[Dict[str, Any]]:
+        return [get_file_fingerprint(file_path) for file_path in files]
+    
+    etag = compute_etag(
+        await run_blocking(fingerprints, before_files),
+        await run_blocking(fingerprints, after_files),
+        request.model_dump(exclude={"before_files", "after_files"})
+    )
+    cache_headers = {"ETag": etag, "Cache-Control": ANALYSIS_CACHE_CONTROL}
+    client_copy_current = etag_matches(http_request.headers.get("if-none-match"), etag)
+    record_cache_outcome("etag", client_copy_current)
+    if client_copy_current:
+        return not_modified(cache_headers)
+    
+    try:
+        async with admission_controller.admit():
+            with stage("load"):
+                before, _ = await run_blocking(get_analytics, before_files)
+                after, _ = await run_blocking(get_analytics, after_files)
+            if before is None or after is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"No valid search data found in the {'before' if before is None else 'after'} experiment files"
+                )
+            
+            with stage("diff"):
+                result = await run_blocking(
+                    diff_experiment_sets,
+                    before,
+                    after,
+                    target_domain=request.target_domain,
+                    significance_level=request.significance_level,
+                    min_samples=request.min_samples,
+                    max_domains=request.max_domains,
+                    max_queries=request.max_queries,
+                    max_prompts=request.max_prompts,
+                    include_queries=request.include_queries,
+                    include_prompts=request.include_prompts,
+                    include_unchanged=request.include_unchanged
+                )
+    except AdmissionRejected as rejection:
+        raise too_many_requests(rejection)
+    
+    return await json_response(
+        {"before_files": before_files, "after_files": after_files, **result},
+        http_request.headers.get("accept-encoding"),
+        headers=cache_headers,
+        run_blocking=run_blocking
+    )
+
 def generate_recommendations(domain_stats: Dict[str, Any], report: Dict[str, Any], gemini_analysis: Dict[str, Any]) -> List[str]:
     """Generate actionable recommendations based on Gemini analysis of poor performers"""
     recommendations = []
@@ -204,16 +995,8 @@ def generate_competitive_insights(analytics: SearchAnalytics, target_domain: str
         else:
             insights["market_position"] = "emerging_player"
         
-        # Identify key competitors (domains that appear frequently)
-        competitor_frequency = {}
-        for prompt, queries in analytics.data.items():
-            for query, domains in queries.items():
-                for domain in domains.keys():
-                    if domain != target_domain:
-                        competitor_frequency[domain] = competitor_frequency.get(domain, 0) + 1
-        
-        # Get top competitors
-        top_competitors = sorted(competitor_frequency.items(), key=lambda x: x[1], reverse=True)[:5]
+        # Identify key competitors (domains retrieved for the most prompt/query pairs)
+        top_competitors = analytics.get_cooccurrence_index().top_competitors(target_domain, 5)
         insights["key_competitors"] = [{"domain": domain, "frequency": freq} for domain, freq in top_competitors]
         
         # Generate competitive advantages and improvement areas
@@ -237,10 +1020,11 @@ def generate_competitive_insights(analytics: SearchAnalytics, target_domain: str
     return insights
 
 @app.get("/experiment-files")
-async def list_experiment_files():
+async def list_experiment_files(http_request: Request):
     """List available experiment files in the current directory"""
     try:
         files = []
+        modified = []
         for file in os.listdir('.'):
             if file.endswith('.json') and 'experiment' in file.lower():
                 files.append({
@@ -248,12 +1032,22 @@ async def list_experiment_files():
                     "path": file,
                     "size": os.path.getsize(file)
                 })
+                modified.append(os.stat(file).st_mtime_ns)
         
-        return {
+        listing = {
             "available_files": files,
-            "default_file": "gemini_experiment_results.json",
-            "default_exists": os.path.exists("gemini_experiment_results.json")
+            "default_file": DEFAULT_EXPERIMENT_FILE,
+            "default_exists": os.path.exists(DEFAULT_EXPERIMENT_FILE)
         }
+        
+        etag = compute_etag(listing, modified)
+        cache_headers = {"ETag": etag, "Cache-Control": EXPERIMENT_FILES_CACHE_CONTROL}
+        if etag_matches(http_request.headers.get("if-none-match"), etag):
+            return not_modified(cache_headers)
+        
+        return await json_response(
+            listing, http_request.headers.get("accept-encoding"), headers=cache_headers, run_blocking=run_blocking
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing files: {str(e)}")
 
@@ -0,0 +1,237 @@
+"""
+Batch report generator: one JSON report per tracked domain, computed in parallel.
+
+The experiment files are loaded once and published as a shared dataset file
+(see shared_dataset.py), which every worker process maps read-only, so the
+pool costs one copy of the data rather than one per worker. Dataset-wide
+report sections are computed once in the parent and written to a single
+shared file that every domain's report references by name.
+
+Run from the repository root, e.g. nightly:
+    python batch_reports.py internal_responce_log.json --min-appearances 20 --output-dir reports
+    python batch_reports.py run1.json run2.json --domains decathlon.de fahrrad.de --workers 4
+
+Writes <output-dir>/<domain>.json per domain, <output-dir>/dataset_sections.json
+and <output-dir>/summary.json.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+from analytics import (
+    DEFAULT_WORST_PROMPTS,
+    REPORT_SECTION_ORDER,
+    SearchAnalytics,
+    load_and_process_experiment_results,
+    load_multiple_experiment_files
+)
+from cache import get_file_fingerprint
+from serialization import encode_json
+from shared_dataset import SharedDataset, SharedDatasetStore
+
+# Sections that do not depend on the domain; computed once per batch and written to DATASET_SECTIONS_FILE
+DATASET_SECTIONS = ('overview', 'query_frequency_stats', 'prompt_stats')
+DATASET_SECTIONS_FILE = "dataset_sections.json"
+
+# Per-process state of pool workers, set up by _init_worker
+_worker_analytics: Optional[SearchAnalytics] = None
+_worker_options: Dict[str, Any] = {}
+
+
+def count_domain_appearances(data: Dict[str, Any]) -> Counter:
+    """Count the (prompt, query) pairs each domain was retrieved for"""
+    counts = Counter()
+    for queries in data.values():
+        for domains in queries.values():
+            counts.update(domains.keys())
+    return counts
+
+
+def report_file_name(domain: str) -> str:
+    """File name of a domain's report, with anything but letters, digits, '.', '-' and '_' replaced"""
+    return re.sub(r'[^A-Za-z0-9._-]', '_', domain) + ".json"
+
+
+def write_file_atomically(path: str, body: bytes) -> None:
+    temp_path = f"{path}.tmp{os.getpid()}"
+    with open(temp_path, "wb") as f:
+        f.write(body)
+    os.replace(temp_path, path)
+
+
+def _init_worker(dataset_path: str, options: Dict[str, Any]) -> None:
+    """Pool initializer: map the shared dataset once per worker process"""
+    global _worker_analytics, _worker_options
+    dataset = SharedDataset(dataset_path)
+    _worker_analytics = SearchAnalytics(dataset.data, dataset.response_chunks)
+    _worker_options = options
+
+
+def _write_domain_report(domain: str) -> Dict[str, Any]:
+    """Compute one domain's report in a pool worker, write it and return its summary entry"""
+    options = _worker_options
+    started = time.perf_counter()
+    sections = dict(_worker_analytics.iter_report_sections(
+        domain,
+        worst_prompts=options['worst_prompts'],
+        include_gemini=options['include_gemini'],
+        sections=set(REPORT_SECTION_ORDER) - set(DATASET_SECTIONS)
+    ))
+    # The dataset-wide sections live once in the shared file, referenced relative to the report
+    report = {'dataset_sections_file': DATASET_SECTIONS_FILE}
+    report.update((name, sections[name]) for name in REPORT_SECTION_ORDER if name in sections)
+
+    path = os.path.join(options['output_dir'], report_file_name(domain))
+    write_file_atomically(path, encode_json(report))
+
+    domain_stats = report.get('domain_analysis', {})
+    return {
+        'domain': domain,
+        'file': path,
+        'seconds': time.perf_counter() - started,
+        'total_appearances': domain_stats.get('total_appearances'),
+        'total_citations': domain_stats.get('total_citations'),
+        'retrieval_rate': domain_stats.get('retrieval_rate'),
+        'usage_rate': domain_stats.get('usage_rate'),
+        'avg_citation_rank': domain_stats.get('avg_citation_rank')
+    }
+
+
+def generate_batch_reports(experiment_files: List[str], output_dir: str, domains: Optional[List[str]] = None,
+                           min_appearances: int = 1, workers: Optional[int] = None,
+                           worst_prompts: int = DEFAULT_WORST_PROMPTS, include_gemini: bool = False,
+                           shared_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Write a JSON report per domain and a summary, computing the reports across a process pool.
+
+    Args:
+        experiment_files: Experiment files to analyze together
+        output_dir: Directory for the report files and summary.json
+        domains: Domains to report on; if omitted, every domain with at least min_appearances
+        min_appearances: Minimum (prompt, query) pairs a domain must be retrieved for when domains is omitted
+        workers: Worker processes (defaults to the CPU count)
+        worst_prompts: Worst prompts per domain sent to Gemini
+        include_gemini: Include the Gemini poor-performance section (one API call per worst prompt and domain)
+        shared_dir: Where the shared dataset file is published (defaults to <output_dir>/.dataset)
+
+    Returns:
+        The summary, also written to <output_dir>/summary.json; the dataset-wide
+        sections are written once to <output_dir>/dataset_sections.json
+    """
+    started = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    store = SharedDatasetStore(shared_dir or os.path.join(output_dir, ".dataset"))
+
+    def load_data():
+        if len(experiment_files) == 1:
+            return load_and_process_experiment_results(experiment_files[0])
+        return load_multiple_experiment_files(experiment_files)
+
+    sources = [get_file_fingerprint(file_path) for file_path in experiment_files]
+    dataset = store.get_or_publish(sources, load_data)
+    if dataset is None:
+        raise ValueError(f"No search data found in {experiment_files}")
+    print(f"📁 Dataset ready in {time.perf_counter() - started:.1f} s: {dataset.path}")
+
+    appearances = count_domain_appearances(dataset.data)
+    if domains is None:
+        domains = [domain for domain, count in appearances.most_common() if count >= min_appearances]
+    print(f"🎯 {len(domains)} domains to report on")
+
+    analytics = SearchAnalytics(dataset.data, dataset.response_chunks)
+    dataset_sections = dict(analytics.iter_report_sections(sections=DATASET_SECTIONS))
+    dataset_sections_path = os.path.join(output_dir, DATASET_SECTIONS_FILE)
+    write_file_atomically(dataset_sections_path, encode_json(dataset_sections))
+    options = {
+        'worst_prompts': worst_prompts,
+        'include_gemini': include_gemini,
+        'output_dir': output_dir
+    }
+
+    reports, failures = [], []
+    workers = workers or os.cpu_count() or 1
+    reports_started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(dataset.path, options)) as executor:
+        futures = {executor.submit(_write_domain_report, domain): domain for domain in domains}
+        for done, future in enumerate(as_completed(futures), 1):
+            domain = futures[future]
+            try:
+                reports.append(future.result())
+                status = "✅"
+            except Exception as e:
+                failures.append({'domain': domain, 'error': str(e)})
+                status = "❌"
+            elapsed = time.perf_counter() - reports_started
+            rate = done / elapsed if elapsed > 0 else 0.0
+            eta = (len(domains) - done) / rate if rate > 0 else 0.0
+            print(f"{status} [{done}/{len(domains)}] {domain} | {rate:.1f} reports/s | ETA {eta:.0f} s", flush=True)
+
+    reports.sort(key=lambda entry: -appearances[entry['domain']])
+    elapsed = time.perf_counter() - started
+    report_seconds = time.perf_counter() - reports_started
+    summary = {
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        'experiment_files': experiment_files,
+        'dataset_generation': dataset.generation,
+        'dataset_sections_file': dataset_sections_path,
+        'overview': dataset_sections.get('overview'),
+        'workers': workers,
+        'include_gemini': include_gemini,
+        'domains_requested': len(domains),
+        'reports_written': len(reports),
+        'failures': failures,
+        'elapsed_seconds': elapsed,
+        'reports_per_second': len(reports) / report_seconds if report_seconds > 0 else 0.0,
+        'reports': reports
+    }
+    write_file_atomically(os.path.join(output_dir, "summary.json"), json.dumps(summary, indent=2).encode("utf-8"))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a JSON analytics report per domain using a process pool")
+    parser.add_argument("experiment_files", nargs="+", help="Experiment result files to analyze together")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument("--domains", nargs="+", help="Domains to report on")
+    selection.add_argument("--min-appearances", type=int, default=1,
+                           help="Report on every domain retrieved for at least this many prompt/query pairs")
+    parser.add_argument("--output-dir", default="reports", help="Directory for the reports and summary.json")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--worst-prompts", type=int, default=DEFAULT_WORST_PROMPTS)
+    parser.add_argument("--include-gemini", action="store_true",
+                        help="Include Gemini poor-performance analysis (API calls for every domain)")
+    parser.add_argument("--shared-dir", help="Directory for the shared dataset file (default: <output-dir>/.dataset)")
+    args = parser.parse_args()
+
+    for file_path in args.experiment_files:
+        if not os.path.exists(file_path):
+            print(f"❌ Error: File {file_path} not found")
+            sys.exit(1)
+
+    summary = generate_batch_reports(
+        args.experiment_files,
+        args.output_dir,
+        domains=args.domains,
+        min_appearances=args.min_appearances,
+        workers=args.workers,
+        worst_prompts=args.worst_prompts,
+        include_gemini=args.include_gemini,
+        shared_dir=args.shared_dir
+    )
+    print("=" * 60)
+    print(f"📊 {summary['reports_written']} reports, {len(summary['failures'])} failed, "
+          f"{summary['elapsed_seconds']:.1f} s total, {summary['reports_per_second']:.1f} reports/s")
+    print(f"📄 Summary: {os.path.join(args.output_dir, 'summary.json')}")
+    if summary['failures']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Import-time benchmark for the API and CLI entry points.
+
+Every measurement runs in a fresh interpreter with -X importtime, so it
+reflects what a cold CLI run or a newly scaled API replica pays before it
+can do any work. Besides timing, it checks that heavy SDKs stay out of
+the import path of modules that are meant to load them lazily; those
+checks are deterministic and fail regardless of machine speed.
+
+Run from the repository root:
+    python -m benchmarks.import_time --output import_times.json
+    python -m benchmarks.import_time --compare import_times.json
+
+Exits with status 1 if a lazily imported module was loaded eagerly or, with
+--compare, if an import got slower than the threshold.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry points and the modules each must not import eagerly
+LAZY_IMPORTS = {
+    'api': ('requests', 'google.genai', 'googlesearch'),
+    'analytics': ('requests', 'google.genai', 'fastapi'),
+    'extract': ('requests', 'google.genai', 'google.api_core', 'googlesearch'),
+    'batch_reports': ('requests', 'google.genai', 'fastapi'),
+}
+RESULTS_FORMAT_VERSION = 1
+
+
+def run_importtime(module: str) -> Tuple[List[Tuple[int, int, str]], List[str]]:
+    """
+    Import a module in a fresh interpreter.
+
+    Returns:
+        Tuple of (importtime rows as (self_us, cumulative_us, name with indentation),
+        names of all modules loaded afterwards)
+    """
+    code = f"import sys, json; import {module}; print(json.dumps(sorted(sys.modules)))"
+    env = {**os.environ, 'PYTHONPATH': REPO_ROOT}
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=REPO_ROOT, env=env,
+                               capture_output=True, text=True, check=True)
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return rows, json.loads(completed.stdout.splitlines()[-1])
+
+
+def measure_module(module: str, repeats: int, top: int) -> Dict[str, Any]:
+    """Best-of-repeats import time of a module, its slowest direct imports and any eager lazy imports"""
+    def indent(name: str) -> int:
+        return len(name) - len(name.lstrip())
+
+    timings = []
+    rows, loaded, position = [], [], 0
+    for _ in range(repeats):
+        rows, loaded = run_importtime(module)
+        # The module itself is the least indented row with its name
+        position = min((index for index, row in enumerate(rows) if row[2].strip() == module),
+                       key=lambda index: indent(rows[index][2]))
+        timings.append(rows[position][1])
+
+    # Rows are printed children first, so the direct imports are the rows one
+    # level deeper than the module that precede it
+    module_indent = indent(rows[position][2])
+    children = []
+    for _, cumulative, name in reversed(rows[:position]):
+        if indent(name) <= module_indent:
+            break
+        if indent(name) == module_indent + 2:
+            children.append((cumulative, name.strip()))
+    loaded_set = set(loaded)
+    eager = [name for name in LAZY_IMPORTS.get(module, ()) if name in loaded_set]
+
+    return {
+        'module': module,
+        'best_ms': min(timings) / 1000,
+        'repeats': repeats,
+        'modules_loaded': len(loaded),
+        'slowest_imports': [{'module': name, 'ms': cumulative / 1000} for cumulative, name in sorted(children, reverse=True)[:top]],
+        'eager_lazy_imports': eager
+    }
+
+
+def compare_results(current: List[Dict[str, Any]], baseline_path: str, threshold: float) -> int:
+    """Print modules whose import got slower than the baseline by more than threshold; return the count"""
+    with open(baseline_path, "r") as f:
+        baseline = {entry['module']: entry for entry in json.load(f)['results']}
+
+    regressions = 0
+    for entry in current:
+        previous = baseline.get(entry['module'])
+        if previous is None or previous['best_ms'] <= 0:
+            continue
+        ratio = entry['best_ms'] / previous['best_ms']
+        if ratio > 1 + threshold:
+            regressions += 1
+            print(f"REGRESSION import {entry['module']}: {previous['best_ms']:.1f} ms -> {entry['best_ms']:.1f} ms ({ratio:.2f}x)")
+    print(f"{regressions} regression(s) against {baseline_path}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time of the API and CLI entry points")
+    parser.add_argument("--modules", nargs="+", default=list(LAZY_IMPORTS), help="Modules to import")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=5, help="Slowest direct imports to list per module")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    parser.add_argument("--regression-threshold", type=float, default=0.3, help="Relative slowdown reported by --compare")
+    args = parser.parse_args()
+
+    results = []
+    failures = 0
+    for module in args.modules:
+        entry = measure_module(module, args.repeats, args.top)
+        results.append(entry)
+        slowest = ", ".join(f"{item['module']} {item['ms']:.0f} ms" for item in entry['slowest_imports'])
+        print(f"{module:<16} {entry['best_ms']:>8.1f} ms  {entry['modules_loaded']:>5} modules  ({slowest})")
+        if entry['eager_lazy_imports']:
+            failures += 1
+            print(f"  EAGER IMPORT: {module} loads {entry['eager_lazy_imports']} at import time")
+
+    if args.output:
+        report = {
+            'format_version': RESULTS_FORMAT_VERSION,
+            'created_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            'python': sys.version.split()[0],
+            'results': results
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        failures += compare_results(results, args.compare, args.regression_threshold)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Measure the resident size of a loaded dataset with compact CitationRecords
+versus the plain {'citations': [...], 'contents': [...]} dict layout.
+
+Run from the repository root:
+    python -m benchmarks.record_memory --query-rows 10000
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+from typing import Any, Callable, Dict
+
+from analytics import aggregate_experiment_searches
+from benchmarks.synthetic import generate_experiments
+from records import CitationRecord
+from snippets import SnippetStore
+
+
+def as_dict_records(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a dataset to the dict-of-lists record layout, keeping the same snippet lists"""
+    return {
+        prompt: {
+            query: {
+                domain: {'citations': list(record.ranks), 'contents': record.contents}
+                for domain, record in domains.items()
+            }
+            for query, domains in queries.items()
+        }
+        for prompt, queries in data.items()
+    }
+
+
+def traced_size(build: Callable[[], Any]) -> int:
+    """Bytes still allocated by build() once it returns (the result is kept alive)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare dataset memory with dict and CitationRecord records")
+    parser.add_argument("--query-rows", type=int, default=10000, help="Synthetic (prompt, query) pairs to load")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    experiments = list(generate_experiments(args.query_rows, seed=args.seed))
+    store = SnippetStore()
+
+    def load() -> Dict[str, Any]:
+        data = {}
+        for experiment in experiments:
+            prompt_data = data.setdefault(experiment['prompt'], {})
+            for query, domains in aggregate_experiment_searches(experiment, store).items():
+                prompt_data.setdefault(query, {}).update(domains)
+        return data
+
+    data = load()
+    records = sum(len(domains) for queries in data.values() for domains in queries.values())
+
+    # Measure only the record layer: both layouts share the already interned snippet store
+    record_bytes = traced_size(lambda: {
+        prompt: {query: {domain: CitationRecord(record.ranks, record.contents) for domain, record in domains.items()}
+                 for query, domains in queries.items()}
+        for prompt, queries in data.items()
+    })
+    dict_bytes = traced_size(lambda: as_dict_records(data))
+
+    print(json.dumps({
+        'query_rows': args.query_rows,
+        'citation_records': records,
+        'dict_records_bytes': dict_bytes,
+        'citation_records_bytes': record_bytes,
+        'bytes_per_record': {'dict': round(dict_bytes / records, 1), 'citation_record': round(record_bytes / records, 1)},
+        'reduction': round(1 - record_bytes / dict_bytes, 3)
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Scaling benchmarks for the loaders and every SearchAnalytics analysis.
+
+For each dataset size a synthetic log is generated (see synthetic.py), then
+each benchmark is timed over several repeats and run once more under
+tracemalloc for its peak allocation. Analyses run on a fresh SearchAnalytics
+per repeat, so lazily built indexes are included in the timings. Results are
+written as JSON for regression tracking; pass --compare with an earlier
+result file to print slowdowns.
+
+Run from the repository root:
+    python -m benchmarks.suite --sizes 1000 10000 100000 1000000 --output benchmark_results.json
+
+The Gemini calls of analyze_poor_performance are not benchmarked; the
+prompt selection that feeds them (_select_poor_performers) is.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from analytics import (
+    DEFAULT_WORST_PROMPTS,
+    SearchAnalytics,
+    load_and_process_experiment_results,
+    load_multiple_experiment_files
+)
+from benchmarks.synthetic import write_experiment_files
+from cache import get_processed_cache_path
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+RESULTS_FORMAT_VERSION = 1
+
+
+def measure(func: Callable[[], Any], repeats: int, setup: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """
+    Time func over several repeats, then run it once more under tracemalloc.
+
+    Args:
+        func: Benchmark body
+        repeats: Number of timed runs
+        setup: Called before every run, outside the timed region
+
+    Returns:
+        Dictionary with best/median seconds, repeats and peak traced bytes
+    """
+    timings = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+
+    if setup:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'best_seconds': min(timings),
+        'median_seconds': statistics.median(timings),
+        'repeats': repeats,
+        'peak_bytes': peak
+    }
+
+
+def analysis_benchmarks(domain: str) -> List[Tuple[str, Callable[[SearchAnalytics], Any]]]:
+    """Return (name, body) pairs covering every SearchAnalytics analysis"""
+    return [
+        ('calculate_overview', lambda analytics: analytics.calculate_overview()),
+        ('calculate_domain_stats', lambda analytics: analytics.calculate_domain_stats(domain)),
+        ('calculate_query_frequency_stats', lambda analytics: analytics.calculate_query_frequency_stats()),
+        ('calculate_prompt_stats', lambda analytics: analytics.calculate_prompt_stats()),
+        ('analyze_queries_with_target_domain', lambda analytics: analytics.analyze_queries_with_target_domain(domain)),
+        ('analyze_intersecting_queries', lambda analytics: analytics.analyze_intersecting_queries()),
+        ('calculate_query_cluster_stats', lambda analytics: analytics.calculate_query_cluster_stats()),
+        ('analyze_intersecting_query_clusters', lambda analytics: analytics.analyze_intersecting_query_clusters()),
+        ('analyze_response_chunks', lambda analytics: analytics.analyze_response_chunks(domain)),
+        ('cooccurrence_outranked_by', lambda analytics: analytics.get_cooccurrence_index().outranked_by(domain)),
+        ('snippet_search', lambda analytics: analytics.get_snippet_index().search("bike berlin")),
+        ('select_poor_performers', lambda analytics: analytics._select_poor_performers(domain, DEFAULT_WORST_PROMPTS)),
+        ('generate_comprehensive_report',
+         lambda analytics: analytics.generate_comprehensive_report(domain, include_gemini=False)),
+    ]
+
+
+def most_retrieved_domain(data: Dict[str, Any]) -> str:
+    """The domain retrieved for the most prompt/query pairs, used as the target domain"""
+    counts = Counter(domain for queries in data.values() for domains in queries.values() for domain in domains)
+    return counts.most_common(1)[0][0]
+
+
+def run_size(query_rows: int, repeats: int, shards: int, workdir: str, options: Dict[str, Any],
+             only: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Generate a dataset of the given size and run every benchmark on it"""
+    results = []
+
+    def record(name: str, measurement: Dict[str, Any]) -> None:
+        entry = {'name': name, 'query_rows': query_rows, **measurement}
+        results.append(entry)
+        print(f"{query_rows:>9} {name:<38} {entry['best_seconds'] * 1000:>11.2f} ms {entry['peak_bytes'] / 2**20:>9.1f} MiB")
+
+    def wanted(name: str) -> bool:
+        return not only or name in only
+
+    single_path = os.path.join(workdir, f"experiments_{query_rows}.json")
+    shard_paths = [os.path.join(workdir, f"experiments_{query_rows}_part{i}.json") for i in range(shards)]
+
+    started = time.perf_counter()
+    experiments = write_experiment_files([single_path], query_rows, **options)
+    write_experiment_files(shard_paths, query_rows, **options)
+    print(f"{query_rows:>9} generated {experiments} experiment records in {time.perf_counter() - started:.1f} s")
+
+    def drop_processed_caches() -> None:
+        for path in [single_path] + shard_paths:
+            cache_path = get_processed_cache_path(path)
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+
+    if wanted('load_experiment_file'):
+        record('load_experiment_file', measure(
+            lambda: load_and_process_experiment_results(single_path, use_cache=False), repeats))
+    if wanted('load_experiment_file_cached'):
+        load_and_process_experiment_results(single_path)
+        record('load_experiment_file_cached', measure(lambda: load_and_process_experiment_results(single_path), repeats))
+    if wanted('load_multiple_experiment_files'):
+        record('load_multiple_experiment_files', measure(
+            lambda: load_multiple_experiment_files(shard_paths), repeats, setup=drop_processed_caches))
+    drop_processed_caches()
+
+    data, response_chunks = load_and_process_experiment_results(single_path, use_cache=False)
+    domain = most_retrieved_domain(data)
+    for name, body in analysis_benchmarks(domain):
+        if wanted(name):
+            record(name, measure(lambda: body(SearchAnalytics(data, response_chunks)), repeats))
+
+    for path in [single_path] + shard_paths:
+        os.remove(path)
+    return results
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare_results(current: List[Dict[str, Any]], baseline_path: str, threshold: float) -> int:
+    """
+    Print benchmarks that got slower than the baseline by more than threshold (e.g. 0.2 = 20%).
+
+    Returns:
+        Number of regressions found
+    """
+    with open(baseline_path, "r") as f:
+        baseline = {(entry['name'], entry['query_rows']): entry for entry in json.load(f)['results']}
+
+    regressions = 0
+    for entry in current:
+        previous = baseline.get((entry['name'], entry['query_rows']))
+        if previous is None or previous['best_seconds'] <= 0:
+            continue
+        ratio = entry['best_seconds'] / previous['best_seconds']
+        if ratio > 1 + threshold:
+            regressions += 1
+            print(f"REGRESSION {entry['name']} @ {entry['query_rows']} rows: "
+                  f"{previous['best_seconds'] * 1000:.2f} ms -> {entry['best_seconds'] * 1000:.2f} ms ({ratio:.2f}x)")
+    print(f"{regressions} regression(s) against {baseline_path}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loaders and SearchAnalytics analyses on synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Query rows per dataset")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per benchmark")
+    parser.add_argument("--shards", type=int, default=4, help="Files the log is split into for load_multiple_experiment_files")
+    parser.add_argument("--only", nargs="+", help="Run only these benchmarks")
+    parser.add_argument("--queries-per-prompt", type=int, default=5)
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent for query, domain and snippet popularity")
+    parser.add_argument("--citation-probability", type=float, default=0.35)
+    parser.add_argument("--runs-per-model", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    parser.add_argument("--regression-threshold", type=float, default=0.2, help="Relative slowdown reported by --compare")
+    args = parser.parse_args()
+
+    options = {
+        'queries_per_prompt': args.queries_per_prompt,
+        'zipf_s': args.zipf,
+        'citation_probability': args.citation_probability,
+        'runs_per_model': args.runs_per_model,
+        'seed': args.seed
+    }
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="search-analytics-bench-")
+    try:
+        for size in args.sizes:
+            results.extend(run_size(size, args.repeats, args.shards, workdir, options, args.only))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'options': {**options, 'repeats': args.repeats, 'shards': args.shards, 'sizes': args.sizes},
+        'results': results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        compare_results(results, args.compare, args.regression_threshold)
+
+
+if __name__ == "__main__":
+    main()
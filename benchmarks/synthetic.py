@@ -0,0 +1,166 @@
+"""
+Synthetic experiment logs in the format written by extract.py.
+
+Queries, domains and snippets are drawn from Zipf distributions, so a few
+of each dominate the way they do in real runs. Output is deterministic for
+a given seed and is written record by record, so logs with millions of
+query rows never have to fit in memory.
+"""
+import json
+import math
+import random
+from bisect import bisect
+from itertools import accumulate
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+WORDS = (
+    "bike bicycle city berlin price euro warranty shop used new repair test ride frame gear "
+    "helmet road gravel electric cargo delivery store offer advice size budget cheap best"
+).split()
+
+
+class ZipfSampler:
+    """Draw ranks 0..n-1 with probability proportional to 1 / (rank + 1) ** s"""
+
+    def __init__(self, n: int, s: float, rng: random.Random):
+        self.n = n
+        self.rng = rng
+        self._cumulative = list(accumulate(1.0 / (rank + 1) ** s for rank in range(n)))
+        self._total = self._cumulative[-1]
+
+    def sample(self) -> int:
+        return min(bisect(self._cumulative, self.rng.random() * self._total), self.n - 1)
+
+    def sample_distinct(self, count: int) -> List[int]:
+        """Draw count different ranks (count must not exceed n)"""
+        seen = {}
+        while len(seen) < count:
+            seen[self.sample()] = None
+        return list(seen)
+
+
+def generate_experiments(query_rows: int, queries_per_prompt: int = 5, unique_queries: Optional[int] = None,
+                         domains: Optional[int] = None, snippets: Optional[int] = None,
+                         models: Sequence[str] = ("gemini-2.5-flash",), runs_per_model: int = 1,
+                         domains_per_query: Tuple[int, int] = (3, 10), citation_probability: float = 0.35,
+                         max_citations: int = 3, max_rank: int = 20, snippets_per_citation: Tuple[int, int] = (1, 2),
+                         response_sentences: int = 6, zipf_s: float = 1.1, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    Yield synthetic experiment records.
+
+    Args:
+        query_rows: Total (prompt, query) pairs to generate
+        queries_per_prompt: Distinct queries per prompt; the prompt count is query_rows / queries_per_prompt
+        unique_queries: Size of the query vocabulary (defaults to a quarter of the rows, at least 10x queries_per_prompt)
+        domains: Number of distinct domains (defaults to scale with the rows)
+        snippets: Number of distinct snippet texts (defaults to scale with the rows)
+        models: Model names each prompt is run on
+        runs_per_model: Runs per model; repeated runs re-retrieve the same queries
+        domains_per_query: Inclusive range of domains retrieved per query and run
+        citation_probability: Chance that a retrieved domain is cited
+        max_citations: Maximum citation ranks per cited domain
+        max_rank: Highest citation rank
+        snippets_per_citation: Inclusive range of snippets stored per cited domain
+        response_sentences: Cited sentences in each run's response (citation_index segments)
+        zipf_s: Zipf exponent for query, domain and snippet popularity; 0 is uniform
+        seed: Random seed
+
+    Yields:
+        Experiment records ({'prompt': ..., 'results': {model: [run, ...]}})
+    """
+    rng = random.Random(seed)
+    prompts = max(1, math.ceil(query_rows / queries_per_prompt))
+    unique_queries = unique_queries or max(queries_per_prompt * 10, query_rows // 4)
+    domains = domains or max(50, int(query_rows ** 0.75))
+    snippets = snippets or max(100, query_rows // 2)
+
+    query_sampler = ZipfSampler(unique_queries, zipf_s, rng)
+    domain_sampler = ZipfSampler(domains, zipf_s, rng)
+    snippet_sampler = ZipfSampler(snippets, zipf_s, rng)
+
+    def snippet_text(snippet_id: int) -> str:
+        # Derived from the id so the vocabulary never has to be held in memory
+        words = random.Random(snippet_id).choices(WORDS, k=18)
+        return f"Snippet {snippet_id}: " + " ".join(words) + "."
+
+    remaining = query_rows
+    for prompt_id in range(prompts):
+        count = min(queries_per_prompt, remaining)
+        remaining -= count
+        queries = [f"synthetic query {query_id}" for query_id in query_sampler.sample_distinct(count)]
+
+        results = {}
+        for model in models:
+            runs = []
+            for _ in range(runs_per_model):
+                web_searches = {}
+                cited_urls = []
+                for query in queries:
+                    retrieved = {}
+                    for domain_id in domain_sampler.sample_distinct(min(domains, rng.randint(*domains_per_query))):
+                        url = f"https://www.domain{domain_id}.com/page{rng.randrange(5)}"
+                        citations, contents = [], []
+                        if rng.random() < citation_probability:
+                            citations = sorted(rng.sample(range(1, max_rank + 1), rng.randint(1, max_citations)))
+                            contents = [snippet_text(snippet_sampler.sample())
+                                        for _ in range(rng.randint(*snippets_per_citation))]
+                            cited_urls.append(url)
+                        retrieved[url] = {"citations": citations, "contents": contents}
+                    web_searches[query] = retrieved
+
+                response, citation_index = _make_response(rng, cited_urls, response_sentences)
+                runs.append({
+                    "success": True,
+                    "response": response,
+                    "web_searches": web_searches,
+                    "citation_index": citation_index
+                })
+            results[model] = runs
+
+        yield {"prompt": f"synthetic prompt {prompt_id}", "results": results}
+
+
+def _make_response(rng: random.Random, cited_urls: List[str], sentence_count: int) -> Tuple[str, Dict[str, Any]]:
+    """Build a response text and a citation_index pointing its sentences at cited URLs"""
+    sources = list(dict.fromkeys(cited_urls))
+    sentences, segments = [], []
+    offset = 0
+    for _ in range(sentence_count):
+        sentence = " ".join(rng.choices(WORDS, k=12)).capitalize() + "."
+        length = len(sentence.encode("utf-8"))
+        if sources:
+            ids = sorted(set(rng.randrange(len(sources)) for _ in range(rng.randint(1, 2))))
+            segments.append([offset, offset + length, ids])
+        sentences.append(sentence)
+        offset += length + 1
+    return " ".join(sentences), {"sources": sources, "segments": segments}
+
+
+def write_experiment_files(paths: Sequence[str], query_rows: int, **options: Any) -> int:
+    """
+    Write one synthetic log split across the given files, prompts assigned round-robin.
+
+    Args:
+        paths: Output files; a single path writes the whole log to one file
+        query_rows: Total (prompt, query) pairs across all files
+        **options: Passed to generate_experiments
+
+    Returns:
+        Number of experiment records written
+    """
+    files = [open(path, "w") for path in paths]
+    try:
+        for f in files:
+            f.write("[")
+        count = 0
+        for count, experiment in enumerate(generate_experiments(query_rows, **options), 1):
+            f = files[(count - 1) % len(files)]
+            if (count - 1) >= len(files):
+                f.write(",")
+            f.write(json.dumps(experiment))
+        for f in files:
+            f.write("]")
+        return count
+    finally:
+        for f in files:
+            f.close()
@@ -0,0 +1,380 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import stat
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Bump whenever the processed (search_data, response_chunks) layout changes so
+# stale cache files written by an older loader are ignored
+PROCESSED_CACHE_VERSION = 4
+PROCESSED_CACHE_SUFFIX = ".processed.pkl"
+# Processed datasets are pickles, so they are only ever read from a directory
+# owned by this process's user and not writable by anyone else; never from
+# next to the (possibly request-supplied) experiment files
+PROCESSED_CACHE_DIR = os.getenv(
+    'PROCESSED_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'search-analytics', 'processed')
+)
+
+# absolute path -> (size, mtime_ns, sha256) of its latest stat, so an unchanged file is hashed once per process
+_file_hash_memo: Dict[str, Tuple[int, int, str]] = {}
+_file_hash_lock = threading.Lock()
+
+
+def compute_file_hash(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Compute the sha256 hex digest of a file's contents.
+
+    Args:
+        file_path: Path to the file to hash
+        chunk_size: Number of bytes read per iteration
+
+    Returns:
+        Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_file_fingerprint(file_path: str) -> Dict[str, Any]:
+    """
+    Build a fingerprint that changes whenever the file changes.
+
+    Args:
+        file_path: Path to an experiment results file
+
+    Returns:
+        Dictionary with the absolute path, size, mtime (ns) and sha256 of the contents
+    """
+    path = os.path.abspath(file_path)
+    file_stat = os.stat(path)
+
+    with _file_hash_lock:
+        memo = _file_hash_memo.get(path)
+
+    if memo is not None and memo[:2] == (file_stat.st_size, file_stat.st_mtime_ns):
+        content_hash = memo[2]
+    else:
+        content_hash = compute_file_hash(path)
+        with _file_hash_lock:
+            _file_hash_memo[path] = (file_stat.st_size, file_stat.st_mtime_ns, content_hash)
+
+    return {
+        'path': path,
+        'size': file_stat.st_size,
+        'mtime_ns': file_stat.st_mtime_ns,
+        'sha256': content_hash
+    }
+
+
+def get_processed_cache_path(file_path: str) -> str:
+    """Return the path of an experiment file's processed-dataset cache inside PROCESSED_CACHE_DIR"""
+    path = os.path.abspath(file_path)
+    path_hash = hashlib.sha256(path.encode('utf-8')).hexdigest()[:32]
+    return os.path.join(PROCESSED_CACHE_DIR, f"{os.path.basename(path)}.{path_hash}{PROCESSED_CACHE_SUFFIX}")
+
+
+def _is_private(path: str) -> bool:
+    """Whether path is owned by the current user and not writable by group or others"""
+    try:
+        path_stat = os.lstat(path)
+    except OSError:
+        return False
+    return (
+        path_stat.st_uid == os.getuid()
+        and not stat.S_ISLNK(path_stat.st_mode)
+        and not path_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+    )
+
+
+def load_processed_dataset(file_path: str, fingerprint: Dict[str, Any]) -> Optional[Any]:
+    """
+    Load a cached processed dataset if it was built from the exact same file.
+
+    The cache file holds two consecutive pickles: a small header with the
+    fingerprint of the source file, then the processed dataset itself. The
+    header is checked before the (much larger) payload is unpickled. Since
+    unpickling runs code, nothing is read unless both the cache file and
+    PROCESSED_CACHE_DIR are owned by the current user and not writable by
+    anyone else.
+
+    Args:
+        file_path: Path to the source experiment file
+        fingerprint: Current fingerprint of the source file
+
+    Returns:
+        The cached dataset, or None when there is no valid cache entry
+    """
+    cache_path = get_processed_cache_path(file_path)
+    if not os.path.exists(cache_path):
+        return None
+    if not (_is_private(PROCESSED_CACHE_DIR) and _is_private(cache_path)):
+        print(f"Ignoring processed cache {cache_path}: it or {PROCESSED_CACHE_DIR} is not private to this user")
+        return None
+
+    try:
+        with open(cache_path, 'rb') as f:
+            header = pickle.load(f)
+            if header.get('version') != PROCESSED_CACHE_VERSION or header.get('fingerprint') != fingerprint:
+                return None
+            return pickle.load(f)
+    except Exception as e:
+        print(f"Ignoring unreadable processed cache {cache_path}: {e}")
+        return None
+
+
+def save_processed_dataset(file_path: str, fingerprint: Dict[str, Any], dataset: Any) -> None:
+    """
+    Store a processed dataset in PROCESSED_CACHE_DIR (created with mode 0700).
+
+    The cache is written to a temporary file and atomically renamed so that
+    concurrent readers never see a partially written cache.
+
+    Args:
+        file_path: Path to the source experiment file
+        fingerprint: Fingerprint of the source file the dataset was built from
+        dataset: Processed dataset to store
+    """
+    cache_path = get_processed_cache_path(file_path)
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    try:
+        os.makedirs(PROCESSED_CACHE_DIR, mode=0o700, exist_ok=True)
+        if not _is_private(PROCESSED_CACHE_DIR):
+            print(f"Not writing processed cache: {PROCESSED_CACHE_DIR} is not private to this user")
+            return
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as f:
+            header = {'version': PROCESSED_CACHE_VERSION, 'fingerprint': fingerprint}
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(dataset, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        print(f"Could not write processed cache {cache_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class TTLLRUCache:
+    """
+    Thread-safe LRU cache whose entries also expire after a time-to-live.
+
+    Hit, miss, eviction and expiration counters are kept so callers can
+    report cache effectiveness.
+    """
+
+    def __init__(self, max_entries: int = 8, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading_locks: Dict[Any, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _is_expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds
+
+    def _lookup(self, key: Any) -> Optional[Any]:
+        """Return the live value for key without counting a hit or miss; caller holds self._lock"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        stored_at, value = entry
+        if self._is_expired(stored_at):
+            del self._entries[key]
+            self.expirations += 1
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, key: Any) -> Optional[Any]:
+        """Return the cached value for key, or None if absent or expired"""
+        with self._lock:
+            value = self._lookup(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key: Any, value: Any) -> None:
+        """Store value under key, evicting the least recently used entries if full"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_create(self, key: Any, factory: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Return the cached value for key, building it with factory on a miss.
+
+        Concurrent callers asking for the same missing key wait for a single
+        factory call instead of each building their own copy. A factory
+        result of None is returned but not cached.
+
+        Returns:
+            Tuple of (value, was_cache_hit)
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value, True
+            loading_lock = self._loading_locks.setdefault(key, threading.Lock())
+
+        with loading_lock:
+            # Another caller may have finished loading while we waited; only
+            # the caller that runs the factory counts a miss
+            with self._lock:
+                value = self._lookup(key)
+                if value is not None:
+                    self.hits += 1
+                    return value, True
+                self.misses += 1
+
+            try:
+                value = factory()
+                if value is not None:
+                    self.put(key, value)
+                return value, False
+            finally:
+                with self._lock:
+                    self._loading_locks.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every cached entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class PersistentResultCache:
+    """
+    Persistent key/value cache for expensive results such as LLM responses, backed by SQLite.
+
+    Entries expire after ttl_seconds. Once more than max_entries are stored,
+    the least recently used entries are evicted.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: Optional[float] = None, max_entries: int = 10000):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Hash arbitrary JSON-serializable parts into a stable cache key"""
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    connection.execute(
+                        "CREATE TABLE IF NOT EXISTS results ("
+                        "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                        "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                    )
+                    connection.execute("CREATE INDEX IF NOT EXISTS idx_results_accessed_at ON results (accessed_at)")
+                    connection.commit()
+                    self._initialized = True
+        return connection
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if absent or expired"""
+        try:
+            with closing(self._connect()) as connection:
+                row = connection.execute("SELECT value, created_at FROM results WHERE key = ?", (key,)).fetchone()
+                now = time.time()
+
+                if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                    connection.execute("DELETE FROM results WHERE key = ?", (key,))
+                    connection.commit()
+                    row = None
+
+                if row is None:
+                    self.misses += 1
+                    return None
+
+                connection.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+                connection.commit()
+                self.hits += 1
+                return json.loads(row[0])
+        except sqlite3.Error as e:
+            print(f"Result cache read failed ({self.db_path}): {e}")
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value, evicting expired and least recently used entries"""
+        try:
+            with closing(self._connect()) as connection:
+                now = time.time()
+                connection.execute(
+                    "INSERT OR REPLACE INTO results (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now, now)
+                )
+                if self.ttl_seconds is not None:
+                    connection.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl_seconds,))
+                connection.execute(
+                    "DELETE FROM results WHERE key IN ("
+                    "SELECT key FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                connection.commit()
+        except sqlite3.Error as e:
+            print(f"Result cache write failed ({self.db_path}): {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size and hit/miss counters"""
+        size = None
+        try:
+            with closing(self._connect()) as connection:
+                size = connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        except sqlite3.Error:
+            pass
+
+        lookups = self.hits + self.misses
+        return {
+            'path': self.db_path,
+            'size': size,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0.0
+        }
@@ -0,0 +1,161 @@
+import heapq
+import threading
+from bisect import bisect_left
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from records import citation_ranks
+
+
+class DomainCooccurrenceIndex:
+    """
+    Sparse domain x domain co-occurrence and "out-ranked-by" index over a dataset.
+
+    The dataset is scanned once to build postings (domain -> prompt/query pairs
+    it was retrieved for) and per-prompt lists of cited domains sorted by best
+    rank. Matrix rows are derived from the postings on first request and
+    memoized, so only the rows that are actually asked for are ever built.
+    """
+
+    def __init__(self, data: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]]):
+        self.data = data
+        # (prompt, query, domain -> best citation rank or None) per prompt/query pair, in dataset order
+        self._pairs: List[Tuple[str, str, Dict[str, Optional[int]]]] = []
+        self._postings: Dict[str, List[int]] = {}
+        # prompt -> (best rank, position, query, domain) of every cited domain, sorted by rank
+        self._prompt_cited: Dict[str, List[Tuple[int, int, str, str]]] = {}
+
+        for prompt, queries in data.items():
+            cited = []
+            for query, domains in queries.items():
+                best_ranks = {}
+                for domain, citation_data in domains.items():
+                    citations = citation_ranks(citation_data)
+                    best_ranks[domain] = min(citations) if citations else None
+                    self._postings.setdefault(domain, []).append(len(self._pairs))
+                    if citations:
+                        cited.append((best_ranks[domain], len(cited), query, domain))
+                self._pairs.append((prompt, query, best_ranks))
+
+            cited.sort()
+            self._prompt_cited[prompt] = cited
+
+        self._lock = threading.Lock()
+        self._cooccurrence_rows: Dict[str, Dict[str, int]] = {}
+        self._outranked_rows: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def domain_frequency(self, domain: str) -> int:
+        """Number of prompt/query pairs the domain was retrieved for"""
+        return len(self._postings.get(domain, ()))
+
+    def iter_pairs(self) -> Iterator[Tuple[str, str, Dict[str, Optional[int]]]]:
+        """Yield (prompt, query, domain -> best citation rank or None) for every prompt/query pair, in dataset order"""
+        return iter(self._pairs)
+
+    def iter_appearances(self, domain: str) -> Iterator[Tuple[str, str]]:
+        """Yield the (prompt, query) pairs the domain was retrieved for, in dataset order"""
+        for pair_index in self._postings.get(domain, ()):
+            prompt, query, _ = self._pairs[pair_index]
+            yield prompt, query
+
+    def top_competitors(self, target_domain: str, limit: int = 5) -> List[Tuple[str, int]]:
+        """
+        Return the domains retrieved for the most prompt/query pairs, excluding the target.
+
+        Ties keep the order in which the domains first appear in the dataset.
+        """
+        return heapq.nlargest(
+            limit,
+            ((domain, len(postings)) for domain, postings in self._postings.items() if domain != target_domain),
+            key=lambda item: item[1]
+        )
+
+    def cooccurrence(self, domain: str) -> Dict[str, int]:
+        """
+        Return the domain's co-occurrence row: other domain -> number of prompt/query pairs both were retrieved for
+        """
+        row = self._cooccurrence_rows.get(domain)
+        if row is None:
+            row = {}
+            for pair_index in self._postings.get(domain, ()):
+                for other in self._pairs[pair_index][2]:
+                    if other != domain:
+                        row[other] = row.get(other, 0) + 1
+            with self._lock:
+                self._cooccurrence_rows[domain] = row
+        return row
+
+    def outranked_by(self, domain: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Return the domains that out-ranked the given domain, most frequent first.
+
+        A competitor out-ranks the domain on a prompt/query pair where both were
+        retrieved and the competitor was cited, either ahead of the domain's
+        best citation or while the domain was not cited at all.
+
+        Returns:
+            Dictionary of competitor -> {
+                'count': pairs where it out-ranked the domain,
+                'avg_rank_delta': mean positions it was ahead by when the domain was cited (None if never),
+                'queries': query -> {'count': ..., 'rank_deltas': [...]} (delta None when the domain was not cited)
+            }
+        """
+        row = self._outranked_rows.get(domain)
+        if row is not None:
+            return row
+
+        row = {}
+        for pair_index in self._postings.get(domain, ()):
+            _, query, best_ranks = self._pairs[pair_index]
+            own_rank = best_ranks[domain]
+
+            for competitor, competitor_rank in best_ranks.items():
+                if competitor == domain or competitor_rank is None:
+                    continue
+                if own_rank is not None and competitor_rank >= own_rank:
+                    continue
+
+                entry = row.get(competitor)
+                if entry is None:
+                    entry = row[competitor] = {'count': 0, 'avg_rank_delta': None, 'queries': {}}
+                entry['count'] += 1
+                query_entry = entry['queries'].setdefault(query, {'count': 0, 'rank_deltas': []})
+                query_entry['count'] += 1
+                query_entry['rank_deltas'].append(own_rank - competitor_rank if own_rank is not None else None)
+
+        for entry in row.values():
+            deltas = [
+                delta for query_entry in entry['queries'].values()
+                for delta in query_entry['rank_deltas'] if delta is not None
+            ]
+            entry['avg_rank_delta'] = sum(deltas) / len(deltas) if deltas else None
+
+        row = dict(sorted(row.items(), key=lambda item: item[1]['count'], reverse=True))
+        with self._lock:
+            self._outranked_rows[domain] = row
+        return row
+
+    def prompt_competitors(self, prompt: str, exclude_domain: str, better_than: float) -> List[Tuple[str, str, int]]:
+        """
+        Return the cited domains of a prompt whose best rank is below better_than.
+
+        Args:
+            prompt: Prompt whose queries to look at
+            exclude_domain: Domain to leave out (usually the target domain)
+            better_than: Exclusive rank threshold; float('inf') returns every cited domain
+
+        Returns:
+            List of (query, domain, best_rank) in dataset order
+        """
+        cited = self._prompt_cited.get(prompt, [])
+        better = cited[:bisect_left(cited, (better_than,))]
+        better = sorted(better, key=lambda entry: entry[1])
+        return [(query, domain, best_rank) for best_rank, _, query, domain in better if domain != exclude_domain]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return index sizes"""
+        return {
+            'pairs': len(self._pairs),
+            'domains': len(self._postings),
+            'cooccurrence_rows': len(self._cooccurrence_rows),
+            'outranked_rows': len(self._outranked_rows)
+        }
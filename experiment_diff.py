@@ -0,0 +1,380 @@
+import math
+from collections import Counter
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from analytics import SearchAnalytics
+
+DEFAULT_SIGNIFICANCE_LEVEL = 0.05
+# Smaller samples are reported but never flagged as significant changes
+DEFAULT_MIN_SAMPLES = 5
+
+# Metrics of a domain entry that are tested for significance
+DOMAIN_METRICS = ('retrieval_rate', 'usage_rate', 'avg_best_rank')
+
+
+def two_proportion_z(successes_before: int, trials_before: int, successes_after: int, trials_after: int) -> Optional[float]:
+    """
+    z statistic of a two-proportion test (pooled variance) for after - before.
+
+    Returns:
+        The z score, 0.0 if both proportions are 0 or 1, or None without trials on either side
+    """
+    if not trials_before or not trials_after:
+        return None
+    pooled = (successes_before + successes_after) / (trials_before + trials_after)
+    variance = pooled * (1 - pooled) * (1 / trials_before + 1 / trials_after)
+    if variance <= 0:
+        return 0.0
+    return (successes_after / trials_after - successes_before / trials_before) / math.sqrt(variance)
+
+
+def mean_difference_z(total_before: float, squares_before: float, count_before: int,
+                      total_after: float, squares_after: float, count_after: int) -> Optional[float]:
+    """
+    z statistic for the difference of two means (Welch standard error), after - before.
+
+    Returns:
+        The z score, None with fewer than two observations on a side, and with zero
+        variance on both sides 0.0 for equal means or +/-inf for different ones
+    """
+    if count_before < 2 or count_after < 2:
+        return None
+    mean_before = total_before / count_before
+    mean_after = total_after / count_after
+    variance_before = max(0.0, (squares_before - total_before * mean_before) / (count_before - 1))
+    variance_after = max(0.0, (squares_after - total_after * mean_after) / (count_after - 1))
+    standard_error = math.sqrt(variance_before / count_before + variance_after / count_after)
+    if standard_error == 0:
+        if mean_before == mean_after:
+            return 0.0
+        return math.copysign(math.inf, mean_after - mean_before)
+    return (mean_after - mean_before) / standard_error
+
+
+class _SignificanceTest:
+    """Turns z scores into two-sided p-values and significance flags"""
+
+    def __init__(self, significance_level: float, min_samples: int):
+        self.significance_level = significance_level
+        self.min_samples = min_samples
+        self._normal = NormalDist()
+
+    def metric(self, before: Optional[float], after: Optional[float], z: Optional[float],
+               samples_before: int, samples_after: int) -> Dict[str, Any]:
+        """Build a {before, after, delta, z, p_value, significant} entry"""
+        p_value = 2 * (1 - self._normal.cdf(abs(z))) if z is not None else None
+        return {
+            'before': before,
+            'after': after,
+            'delta': after - before if before is not None and after is not None else None,
+            # An infinite z (zero variance, different means) is not valid JSON; p_value 0.0 and delta carry it
+            'z': z if z is None or math.isfinite(z) else None,
+            'p_value': p_value,
+            'significant': (
+                p_value is not None
+                and p_value < self.significance_level
+                and min(samples_before, samples_after) >= self.min_samples
+            )
+        }
+
+    def rate(self, successes_before: int, trials_before: int, successes_after: int, trials_after: int) -> Dict[str, Any]:
+        """Metric entry for a rate such as retrieval or usage rate"""
+        return self.metric(
+            successes_before / trials_before if trials_before else None,
+            successes_after / trials_after if trials_after else None,
+            two_proportion_z(successes_before, trials_before, successes_after, trials_after),
+            trials_before,
+            trials_after
+        )
+
+    def mean_rank(self, ranks_before: List[float], ranks_after: List[float]) -> Dict[str, Any]:
+        """Metric entry for a mean citation rank, from [count, total, sum of squares] accumulators"""
+        count_before, total_before, squares_before = ranks_before
+        count_after, total_after, squares_after = ranks_after
+        return self.metric(
+            total_before / count_before if count_before else None,
+            total_after / count_after if count_after else None,
+            mean_difference_z(total_before, squares_before, count_before, total_after, squares_after, count_after),
+            count_before,
+            count_after
+        )
+
+
+class _SideTotals:
+    """Per-domain, per-query and per-prompt counters for one side of the diff"""
+
+    def __init__(self, target_domain: Optional[str]):
+        self.target_domain = target_domain
+        self.pairs = 0
+        # Pairs each domain was retrieved / cited for, and [cited count, best rank total, best rank squares]
+        self.retrieved = Counter()
+        self.cited = Counter()
+        self.ranks: Dict[str, List[float]] = {}
+        # query / prompt -> [pairs, target retrieved, target cited, target best rank or None, cited domains]
+        self.queries: Dict[str, list] = {}
+        self.prompts: Dict[str, list] = {}
+        self.prompt_queries: Dict[str, List[str]] = {}
+
+    def add_pair(self, prompt: str, query: str, best_ranks: Dict[str, Optional[int]]) -> None:
+        self.pairs += 1
+        self.retrieved.update(best_ranks.keys())
+        cited = [domain for domain, rank in best_ranks.items() if rank is not None]
+        self.cited.update(cited)
+        for domain in cited:
+            rank = best_ranks[domain]
+            ranks = self.ranks.get(domain)
+            if ranks is None:
+                ranks = self.ranks[domain] = [0, 0.0, 0.0]
+            ranks[0] += 1
+            ranks[1] += rank
+            ranks[2] += rank * rank
+
+        self.prompt_queries.setdefault(prompt, []).append(query)
+        target_rank = best_ranks.get(self.target_domain) if self.target_domain else None
+        for key, groups in ((query, self.queries), (prompt, self.prompts)):
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [0, 0, 0, None, set()]
+            group[0] += 1
+            if self.target_domain in best_ranks:
+                group[1] += 1
+                if target_rank is not None:
+                    group[2] += 1
+                    if group[3] is None or target_rank < group[3]:
+                        group[3] = target_rank
+            group[4].update(cited)
+
+
+def _status(in_before: bool, in_after: bool, added: str = 'new', removed: str = 'lost') -> str:
+    if in_before and in_after:
+        return 'both'
+    return added if in_after else removed
+
+
+def _compare_pair(target_domain: str, before: Dict[str, Optional[int]], after: Dict[str, Optional[int]],
+                  displacement: Dict[str, Any]) -> None:
+    """Record how the target's best rank moved in one prompt/query pair present in both sets, and who moved past it"""
+    target_before = before.get(target_domain)
+    target_after = after.get(target_domain)
+
+    if target_before is not None and (target_after is None or target_after > target_before):
+        displacement['pairs_target_worsened'] += 1
+        # Competitors now ahead of the target that were not ahead before
+        for domain, rank in after.items():
+            if domain == target_domain or rank is None or (target_after is not None and rank >= target_after):
+                continue
+            rank_before = before.get(domain)
+            if rank_before is None or rank_before >= target_before:
+                displacement['displaced_by'][domain] = displacement['displaced_by'].get(domain, 0) + 1
+
+    elif target_after is not None and (target_before is None or target_after < target_before):
+        displacement['pairs_target_improved'] += 1
+        # Competitors that were ahead of the target and no longer are
+        for domain, rank in before.items():
+            if domain == target_domain or rank is None or (target_before is not None and rank >= target_before):
+                continue
+            rank_after = after.get(domain)
+            if rank_after is None or rank_after >= target_after:
+                displacement['displaced'][domain] = displacement['displaced'].get(domain, 0) + 1
+
+
+def _group_diff(key_before: Optional[list], key_after: Optional[list], tests: _SignificanceTest,
+                target_domain: Optional[str]) -> Dict[str, Any]:
+    """Diff entry shared by queries and prompts: pair counts, new/lost cited domains and target metrics"""
+    empty = [0, 0, 0, None, set()]
+    before = key_before or empty
+    after = key_after or empty
+    entry = {
+        'status': _status(key_before is not None, key_after is not None, 'added', 'removed'),
+        'pairs': {'before': before[0], 'after': after[0]},
+        'new_citations': sorted(after[4] - before[4]),
+        'lost_citations': sorted(before[4] - after[4])
+    }
+    if target_domain:
+        entry['target_retrieval_rate'] = tests.rate(before[1], before[0], after[1], after[0])
+        entry['target_usage_rate'] = tests.rate(before[2], before[1], after[2], after[1])
+        entry['target_best_rank'] = {
+            'before': before[3],
+            'after': after[3],
+            'shift': after[3] - before[3] if before[3] is not None and after[3] is not None else None
+        }
+    return entry
+
+
+def _is_changed(entry: Dict[str, Any]) -> bool:
+    if entry['status'] != 'both' or entry['new_citations'] or entry['lost_citations']:
+        return True
+    if entry['pairs']['before'] != entry['pairs']['after'] or entry.get('queries_added') or entry.get('queries_removed'):
+        return True
+    return any(
+        isinstance(value, dict) and (value.get('delta') or value.get('shift'))
+        for value in entry.values()
+    )
+
+
+def diff_experiment_sets(before: SearchAnalytics, after: SearchAnalytics, target_domain: Optional[str] = None,
+                         significance_level: float = DEFAULT_SIGNIFICANCE_LEVEL,
+                         min_samples: int = DEFAULT_MIN_SAMPLES, max_domains: Optional[int] = None,
+                         max_queries: Optional[int] = None, max_prompts: Optional[int] = None,
+                         include_queries: bool = True, include_prompts: bool = True,
+                         include_unchanged: bool = False, max_competitors: int = 20) -> Dict[str, Any]:
+    """
+    Compare two experiment sets, e.g. runs of the same prompts before and after a content change.
+
+    Both sides are read from their co-occurrence indexes (prompt/query pairs
+    with each domain's best citation rank), which SearchAnalytics builds once
+    per dataset. The before side is scanned into totals and a pair map; the
+    after side is then streamed against it, so each dataset is scanned once.
+
+    Rates are compared with a two-proportion z-test and mean best citation
+    ranks with a Welch z-test; a change is flagged significant when its
+    two-sided p-value is below significance_level and both sides have at
+    least min_samples observations. Negative rank deltas are improvements.
+
+    Args:
+        before: Analytics of the earlier experiment set
+        after: Analytics of the later experiment set
+        target_domain: Domain to report per-query/per-prompt metrics and competitor displacement for
+        significance_level: Two-sided significance level of the tests
+        min_samples: Minimum observations per side before a change can be flagged
+        max_domains: Keep only this many domains, most significant changes first
+        max_queries: Keep only this many changed queries, largest changes first
+        max_prompts: Keep only this many changed prompts, largest changes first
+        include_queries: Include per-query deltas
+        include_prompts: Include per-prompt deltas
+        include_unchanged: Also list queries and prompts with no change
+        max_competitors: Competitors listed in each displacement ranking
+
+    Returns:
+        Dictionary with 'summary', 'domains', optional 'queries' and 'prompts',
+        and 'target' (when target_domain is given)
+    """
+    tests = _SignificanceTest(significance_level, min_samples)
+    before_totals = _SideTotals(target_domain)
+    after_totals = _SideTotals(target_domain)
+
+    # Pass over the before set: totals, plus a map from (prompt, query) to its best ranks
+    before_pairs: Dict[Tuple[str, str], Dict[str, Optional[int]]] = {}
+    for prompt, query, best_ranks in before.get_cooccurrence_index().iter_pairs():
+        before_totals.add_pair(prompt, query, best_ranks)
+        before_pairs[(prompt, query)] = best_ranks
+
+    # Pass over the after set, joining each pair with its before counterpart
+    citations_gained: Dict[str, int] = {}
+    citations_lost: Dict[str, int] = {}
+    displacement = {'pairs_target_worsened': 0, 'pairs_target_improved': 0, 'displaced_by': {}, 'displaced': {}}
+    common_pairs = 0
+    for prompt, query, best_ranks in after.get_cooccurrence_index().iter_pairs():
+        after_totals.add_pair(prompt, query, best_ranks)
+        previous = before_pairs.get((prompt, query))
+        if previous is None:
+            continue
+        common_pairs += 1
+        for domain, rank in best_ranks.items():
+            if rank is not None and previous.get(domain) is None:
+                citations_gained[domain] = citations_gained.get(domain, 0) + 1
+        for domain, rank in previous.items():
+            if rank is not None and best_ranks.get(domain) is None:
+                citations_lost[domain] = citations_lost.get(domain, 0) + 1
+        if target_domain:
+            _compare_pair(target_domain, previous, best_ranks, displacement)
+
+    # Per-domain deltas
+    no_ranks = [0, 0.0, 0.0]
+    domains = {}
+    for domain in list(before_totals.retrieved) + [d for d in after_totals.retrieved if d not in before_totals.retrieved]:
+        retrieved_before, retrieved_after = before_totals.retrieved[domain], after_totals.retrieved[domain]
+        cited_before, cited_after = before_totals.cited[domain], after_totals.cited[domain]
+        domains[domain] = {
+            'status': _status(retrieved_before > 0, retrieved_after > 0),
+            'retrieved_pairs': {'before': retrieved_before, 'after': retrieved_after},
+            'cited_pairs': {'before': cited_before, 'after': cited_after},
+            'retrieval_rate': tests.rate(retrieved_before, before_totals.pairs, retrieved_after, after_totals.pairs),
+            'usage_rate': tests.rate(cited_before, retrieved_before, cited_after, retrieved_after),
+            'avg_best_rank': tests.mean_rank(before_totals.ranks.get(domain, no_ranks),
+                                             after_totals.ranks.get(domain, no_ranks)),
+            'citations_gained': citations_gained.get(domain, 0),
+            'citations_lost': citations_lost.get(domain, 0)
+        }
+
+    def is_significant(entry: Dict[str, Any]) -> bool:
+        return any(entry[name]['significant'] for name in DOMAIN_METRICS)
+
+    def strength(metric: Dict[str, Any]) -> float:
+        # z is reported as None when infinite; its p-value is then 0.0
+        if metric['z'] is None:
+            return math.inf if metric['p_value'] == 0.0 else 0.0
+        return abs(metric['z'])
+
+    # Significant changes first, then by the largest |z| of any metric
+    ranked_domains = sorted(domains.items(), key=lambda item: (
+        not is_significant(item[1]),
+        -max(strength(item[1][name]) for name in DOMAIN_METRICS)
+    ))
+    significant_domains = sum(1 for entry in domains.values() if is_significant(entry))
+
+    result = {
+        'summary': {
+            'pairs': {'before': before_totals.pairs, 'after': after_totals.pairs, 'common': common_pairs},
+            'prompts': {'before': len(before_totals.prompts), 'after': len(after_totals.prompts)},
+            'queries': {'before': len(before_totals.queries), 'after': len(after_totals.queries)},
+            'domains': {
+                'before': len(before_totals.retrieved),
+                'after': len(after_totals.retrieved),
+                'new': sum(1 for entry in domains.values() if entry['status'] == 'new'),
+                'lost': sum(1 for entry in domains.values() if entry['status'] == 'lost')
+            },
+            'significant_domain_changes': significant_domains,
+            'significance_level': significance_level,
+            'min_samples': min_samples
+        },
+        'domains': dict(ranked_domains[:max_domains] if max_domains is not None else ranked_domains)
+    }
+
+    def diff_groups(name: str, limit: Optional[int]) -> Dict[str, Any]:
+        groups_before = getattr(before_totals, name)
+        groups_after = getattr(after_totals, name)
+        keys = list(groups_before) + [key for key in groups_after if key not in groups_before]
+        entries = []
+        for key in keys:
+            entry = _group_diff(groups_before.get(key), groups_after.get(key), tests, target_domain)
+            if name == 'prompts':
+                queries_before: Set[str] = set(before_totals.prompt_queries.get(key, ()))
+                queries_after: Set[str] = set(after_totals.prompt_queries.get(key, ()))
+                entry['queries_added'] = sorted(queries_after - queries_before)
+                entry['queries_removed'] = sorted(queries_before - queries_after)
+            if include_unchanged or _is_changed(entry):
+                entries.append((key, entry))
+        result['summary'][f'{name}_changed'] = len(entries)
+
+        # Significant target changes first, then by how many cited domains came and went
+        entries.sort(key=lambda item: (
+            not any(isinstance(value, dict) and value.get('significant') for value in item[1].values()),
+            -(len(item[1]['new_citations']) + len(item[1]['lost_citations']))
+        ))
+        return dict(entries[:limit] if limit is not None else entries)
+
+    if include_queries:
+        result['queries'] = diff_groups('queries', max_queries)
+    if include_prompts:
+        result['prompts'] = diff_groups('prompts', max_prompts)
+
+    if target_domain:
+        def ranking(counts: Dict[str, int]) -> List[Dict[str, Any]]:
+            ordered = sorted(counts.items(), key=lambda item: -item[1])[:max_competitors]
+            return [{'domain': domain, 'pairs': pairs} for domain, pairs in ordered]
+
+        result['target'] = {
+            'domain': target_domain,
+            **domains.get(target_domain, {'status': 'absent'}),
+            'displacement': {
+                'pairs_compared': common_pairs,
+                'pairs_target_worsened': displacement['pairs_target_worsened'],
+                'pairs_target_improved': displacement['pairs_target_improved'],
+                'displaced_by': ranking(displacement['displaced_by']),
+                'displaced': ranking(displacement['displaced'])
+            }
+        }
+
+    return result
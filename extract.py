@@ -1,20 +1,42 @@
-from google import genai
-from google.genai import types
-from google.api_core.client_options import ClientOptions
-
+# google.genai, google.api_core, googlesearch and requests are imported where they
+# are used: together they take about a second to import, which every short-lived
+# run paid even when it never reached them
 # from google.cloud import discoveryengine_v1 as discoveryengine
 import warnings
 import json
 import re
 import os
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Tuple
 import time
 import random
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from googlesearch import search
 from urllib.parse import urlparse
 import traceback as tb
-import requests
+
+# Start index used for grounding supports that come without one, so they sort after every positioned support
+MISSING_START_INDEX = 1_000_000
+
+# Gemini clients by API key, built once and shared by all threads
+_genai_clients: Dict[str, Any] = {}
+_genai_clients_lock = threading.Lock()
+
+
+def get_genai_client(api_key: str):
+    """
+    Return the Gemini client for api_key, creating it (and importing the SDK) on first use.
+
+    Clients are thread-safe and keep their HTTP connection pool, so one client
+    per key serves every call instead of a new one per request.
+    """
+    client = _genai_clients.get(api_key)
+    if client is None:
+        with _genai_clients_lock:
+            client = _genai_clients.get(api_key)
+            if client is None:
+                from google import genai
+                client = _genai_clients[api_key] = genai.Client(api_key=api_key)
+    return client
 
 
 def decode_uri(uri: str):
@@ -23,6 +45,8 @@ def decode_uri(uri: str):
         uri = uri.replace("gs://", "https://storage.googleapis.com/", 1).replace(
             " ", "%20"
         )
+    import requests
+
     url = uri
     for i in range(3):
         try:
@@ -63,6 +87,8 @@ def search_and_match_domains(
     query: str, target_domains: List[str], target_uris: List[str]
 ) -> Dict[str, str]:
     """Search Google for query and match results to target domains"""
+    from googlesearch import search
+
     try:
         # Search Google for the query
         search_results = search(query)
@@ -112,9 +138,67 @@ def search_and_match_domains(
         return {}
 
 
-def extract_searches_and_citations(response: Any) -> Dict[str, Dict[str, List[int]]]:
+def support_start_index(support: Any) -> int:
+    """Start index of a grounding support's segment, or MISSING_START_INDEX when it has none"""
+    start_index = support.segment.start_index
+    return start_index if isinstance(start_index, int) else MISSING_START_INDEX
+
+
+def build_citation_index(
+    response_text: str, supports: List[Any], chunk_uris: List[str]
+) -> Dict[str, Any]:
     """
+    Build a compact index linking the cited segments of a response to their sources.
+
     The output structure:
+    {
+        "sources": ["https://probably-spam.com/page", ...], # cited chunk URIs, each stored once
+        "segments": [[0, 57, [0, 2]], ...], # UTF-8 byte offsets into the response text and source ids
+    }
+    A segment gets its text appended as a fourth element when the offsets do
+    not reproduce it (e.g. for multi-part responses).
+    """
+    sources = []
+    source_ids = {}
+    segments = []
+    encoded_text = (response_text or "").encode("utf-8")
+
+    for support in sorted(supports, key=support_start_index):
+        ids = []
+        for chunk_idx in support.grounding_chunk_indices or []:
+            if chunk_idx < len(chunk_uris):
+                uri = chunk_uris[chunk_idx]
+                if uri not in source_ids:
+                    source_ids[uri] = len(sources)
+                    sources.append(uri)
+                ids.append(source_ids[uri])
+        if not ids:
+            continue
+
+        segment = support.segment
+        text = segment.text if isinstance(segment.text, str) else ""
+        start = support_start_index(support)
+        end = (
+            segment.end_index
+            if isinstance(segment.end_index, int) and start != MISSING_START_INDEX
+            else start + len(text.encode("utf-8"))
+        )
+
+        entry = [start, end, ids]
+        if encoded_text[start:end].decode("utf-8", errors="replace") != text:
+            entry.append(text)
+        segments.append(entry)
+
+    return {"sources": sources, "segments": segments}
+
+
+def extract_searches_and_citations(
+    response: Any,
+) -> Tuple[Dict[str, Dict[str, Dict[str, List[Any]]]], Dict[str, Any]]:
+    """
+    Returns (web_searches, citation_index).
+
+    The web_searches structure:
     {
         "best ai SEO companies": {
             "https://probably-spam.com": [1,3], # 1,3 are citation indexing ordered by the when it is cited in the response
@@ -122,6 +206,7 @@ def extract_searches_and_citations(response: Any) -> Dict[str, Dict[str, List[in
         },
         ...
     }
+    citation_index is described in build_citation_index.
     """
     try:
         grounding_metadata = response.candidates[0].grounding_metadata
@@ -150,12 +235,7 @@ def extract_searches_and_citations(response: Any) -> Dict[str, Dict[str, List[in
         chunk_contents = {}
 
         # Sort supports by start index to get citation order
-        sorted_supports = sorted(
-            supports,
-            key=lambda s: s.segment.start_index
-            if isinstance(s.segment.start_index, int)
-            else 1_000_000,
-        )
+        sorted_supports = sorted(supports, key=support_start_index)
 
         for citation_idx, support in enumerate(sorted_supports, 1):
             if support.grounding_chunk_indices:
@@ -164,7 +244,7 @@ def extract_searches_and_citations(response: Any) -> Dict[str, Dict[str, List[in
                         if chunk_idx not in chunk_citations:
                             chunk_citations[chunk_idx] = []
                             chunk_contents[chunk_idx] = []
-                        if support.segment.start_index != 1_000_000:
+                        if support.segment.start_index != MISSING_START_INDEX:
                             chunk_citations[chunk_idx].append(citation_idx)
                             chunk_contents[chunk_idx].append(
                                 support.segment.text
@@ -172,6 +252,8 @@ def extract_searches_and_citations(response: Any) -> Dict[str, Dict[str, List[in
                                 else ""
                             )
 
+        citation_index = build_citation_index(response.text, supports, chunk_uri)
+
         # Now attribute domains to queries by searching (parallelized)
         result = {}
 
@@ -221,17 +303,19 @@ def extract_searches_and_citations(response: Any) -> Dict[str, Dict[str, List[in
                     time.sleep(delay)
                     result[query] = {}
 
-        return result
+        return result, citation_index
 
     except Exception as e:
         print(f"Error extracting searches and citations: {tb.format_exception(e)}")
-        return {}
+        return {}, {}
 
 
 def call_google_search_model(
     prompt: str, project_id: str, location: str, engine_id: str
 ) -> Dict[str, Any]:
     """Call Google Search model using Discovery Engine to extract summaries."""
+    from google.api_core.client_options import ClientOptions
+
     try:
         client_options = (
             ClientOptions(api_endpoint=f"{location}-discoveryengine.googleapis.com")
@@ -301,9 +385,13 @@ def call_google_search_model(
 
 def call_gemini_model(model_name: str, prompt: str, api_key: str) -> Dict[str, Any]:
     """Call a specific Gemini model with the given prompt."""
+    # Clients created from the environment later in this process, such as the
+    # analytics Gemini client, use the same key as the experiment
+    os.environ["GEMINI_API_KEY"] = api_key
     try:
-        os.environ["GEMINI_API_KEY"] = api_key
-        client = genai.Client()
+        from google.genai import types
+
+        client = get_genai_client(api_key)
 
         grounding_tool = types.Tool(google_search=types.GoogleSearch())
 
@@ -328,9 +416,12 @@ def call_gemini_model(model_name: str, prompt: str, api_key: str) -> Dict[str, A
             pass
 
         search_citations = {}
+        citation_index = {}
         for i in range(5):
             try:
-                search_citations = extract_searches_and_citations(response)
+                search_citations, citation_index = extract_searches_and_citations(
+                    response
+                )
                 break
             except Exception as e:
                 warnings.warn(f"FUCK FUCK FUCK FUCK with {e}")
@@ -340,6 +431,7 @@ def call_gemini_model(model_name: str, prompt: str, api_key: str) -> Dict[str, A
             "model": model_name,
             "response": response.text,
             "web_searches": search_citations,
+            "citation_index": citation_index,
             "success": True,
         }
 
@@ -405,6 +497,8 @@ def run_all_gemini_models(
             futures = []
 
             for run_num in range(runs_per_model):
+                # Unix time the run was started, recorded with its result so runs can be sliced by date
+                started_at = time.time()
                 if model_name == "Google Search":
                     future = executor.submit(
                         call_google_search_model,
@@ -417,13 +511,14 @@ def run_all_gemini_models(
                     future = executor.submit(
                         call_gemini_model, model_name, prompt, api_key
                     )
-                futures.append((future, run_num))
+                futures.append((future, run_num, started_at))
 
-            for future, run_num in futures:
+            for future, run_num, started_at in futures:
                 for attempt_idx in range(3):
                     try:
                         result = future.result(timeout=120)
                         result["run_number"] = run_num + 1
+                        result["timestamp"] = started_at
                         model_results.append(result)
 
                         print(f"{prompt}:")
@@ -448,6 +543,7 @@ def run_all_gemini_models(
                             {
                                 "model": model_name,
                                 "run_number": run_num + 1,
+                                "timestamp": started_at,
                                 "response_text": "",
                                 "web_searches": [],
                                 "success": False,
@@ -497,6 +593,12 @@ def respond(prompts):
     location = "global"  # os.getenv("GOOGLE_CLOUD_LOCATION", "global")
     engine_id = None  # os.getenv("GOOGLE_CLOUD_ENGINE_ID")
 
+    # Build the shared Gemini client before the worker threads start, so they
+    # do not all wait on the SDK import and client setup at once
+    api_key = os.getenv("GEMINI_API_KEY")
+    if api_key:
+        get_genai_client(api_key)
+
     def process_prompt(prompt):
         for i in range(3):
             try:
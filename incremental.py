@@ -0,0 +1,335 @@
+import json
+import os
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Tuple
+
+from analytics import SearchAnalytics, aggregate_experiment_searches, extract_experiment_response_chunks
+from records import citation_ranks
+from snippets import SnippetStore
+
+
+class IncrementalAnalytics:
+    """
+    Analytics aggregates that are updated in place as new experiment records arrive.
+
+    Records are ingested with the same merge rules as load_and_process_experiment_results.
+    Each ingested (prompt, query) pair first has its old contribution retracted from
+    the counters, then its merged contribution added back, so the cost of an
+    ingest() is proportional to the new records only.
+
+    The calculate_* / analyze_* methods return the same structures as their
+    SearchAnalytics counterparts. List orders follow ingestion order; they match
+    a batch rebuild exactly when each prompt appears once, and only the order
+    of those lists may differ when a prompt is re-run later in the log.
+    """
+
+    def __init__(self):
+        # Merged dataset in the SearchAnalytics layout
+        self.data: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]] = {}
+        self.response_chunks: Dict[str, Dict[str, List[str]]] = {}
+        self.snippet_store = SnippetStore()
+
+        self.total_queries = 0
+        self.records_ingested = 0
+        # Number of records already ingested per source file, so appended records can be picked up
+        self.file_offsets: Dict[str, int] = {}
+
+        # Per domain: (prompt, query) -> citation ranks, plus running counters and a rank histogram
+        self._domain_pairs: Dict[str, Dict[Tuple[str, str], List[int]]] = {}
+        self._domain_totals: Dict[str, Counter] = {}
+        self._domain_ranks: Dict[str, Counter] = {}
+
+        # Per query: prompts using it, sources seen, domains retrieved and cited ranks per domain
+        self._query_prompts: Dict[str, Dict[str, None]] = {}
+        self._query_sources: Counter = Counter()
+        self._query_domains: Dict[str, Counter] = {}
+        self._query_cited_ranks: Dict[str, Dict[str, Counter]] = {}
+
+        # Per prompt: domains retrieved, domains cited and total citations
+        self._prompt_domains: Dict[str, Counter] = {}
+        self._prompt_cited_domains: Dict[str, Counter] = {}
+        self._prompt_citations: Counter = Counter()
+
+    def ingest(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        Merge new experiment records into the aggregates.
+
+        Args:
+            records: Experiment result entries as written by extract.py ({'prompt': ..., 'results': {...}})
+
+        Returns:
+            Number of records ingested
+        """
+        count = 0
+        for experiment in records:
+            prompt = experiment.get('prompt', '')
+            prompt_data = self.data.setdefault(prompt, {})
+
+            for query, domains in aggregate_experiment_searches(experiment, self.snippet_store).items():
+                query_data = prompt_data.get(query)
+                if query_data is None:
+                    query_data = prompt_data[query] = {}
+                    self.total_queries += 1
+                    self._query_prompts.setdefault(query, {})[prompt] = None
+                else:
+                    self._apply_pair(prompt, query, query_data, -1)
+
+                query_data.update(domains)
+                self._apply_pair(prompt, query, query_data, 1)
+
+            prompt_chunks = self.response_chunks.setdefault(prompt, {})
+            for sentence, domains in extract_experiment_response_chunks(experiment).items():
+                prompt_chunks.setdefault(sentence, []).extend(domains)
+
+            count += 1
+
+        self.records_ingested += count
+        return count
+
+    def ingest_file(self, file_path: str) -> int:
+        """
+        Ingest the records of an experiment file that have not been ingested yet.
+
+        Experiment files are append-only lists, so only entries past the
+        number already read from this file are processed.
+
+        Args:
+            file_path: Path to a JSON file generated by extract.py
+
+        Returns:
+            Number of new records ingested
+        """
+        try:
+            with open(file_path, 'r') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error loading experiment results from {file_path}: {e}")
+            return 0
+
+        if not isinstance(data, list):
+            data = [data]
+
+        path = os.path.abspath(file_path)
+        offset = self.file_offsets.get(path, 0)
+        if offset > len(data):
+            # The file shrank, so it was rewritten rather than appended to; ingest it from scratch
+            offset = 0
+
+        count = self.ingest(data[offset:])
+        self.file_offsets[path] = len(data)
+        return count
+
+    def _apply_pair(self, prompt: str, query: str, domains: Dict[str, Dict[str, Any]], sign: int) -> None:
+        """Add (sign=1) or retract (sign=-1) the contribution of one prompt/query pair"""
+        self._query_sources[query] += sign * len(domains)
+        query_domains = self._query_domains.setdefault(query, Counter())
+        query_cited = self._query_cited_ranks.setdefault(query, {})
+        prompt_domains = self._prompt_domains.setdefault(prompt, Counter())
+        prompt_cited = self._prompt_cited_domains.setdefault(prompt, Counter())
+
+        for domain, citation_data in domains.items():
+            citations = citation_ranks(citation_data)
+            ranks = Counter(citations)
+
+            query_domains[domain] += sign
+            prompt_domains[domain] += sign
+
+            totals = self._domain_totals.setdefault(domain, Counter())
+            totals['appearances'] += sign
+            domain_ranks = self._domain_ranks.setdefault(domain, Counter())
+            pairs = self._domain_pairs.setdefault(domain, {})
+
+            if sign > 0:
+                pairs[(prompt, query)] = citations
+            else:
+                pairs.pop((prompt, query), None)
+
+            if citations:
+                totals['cited_appearances'] += sign
+                totals['citations'] += sign * len(citations)
+                totals['rank_sum'] += sign * sum(citations)
+                self._prompt_citations[prompt] += sign * len(citations)
+                prompt_cited[domain] += sign
+                cited = query_cited.setdefault(domain, Counter())
+                if sign > 0:
+                    domain_ranks.update(ranks)
+                    cited.update(ranks)
+                else:
+                    domain_ranks.subtract(ranks)
+                    cited.subtract(ranks)
+
+        # Drop entries of this pair's domains that fell to zero so sizes and key sets stay exact
+        for domain in domains:
+            for counter in (query_domains, prompt_domains, prompt_cited):
+                if counter.get(domain, 1) <= 0:
+                    del counter[domain]
+            for counter in (self._domain_ranks.get(domain), query_cited.get(domain)):
+                if counter is not None:
+                    for rank in [rank for rank, value in counter.items() if value <= 0]:
+                        del counter[rank]
+            if not query_cited.get(domain, True):
+                del query_cited[domain]
+            if not self._domain_pairs.get(domain, True):
+                del self._domain_pairs[domain]
+                del self._domain_totals[domain]
+                del self._domain_ranks[domain]
+
+    def to_search_analytics(self) -> SearchAnalytics:
+        """Wrap the merged dataset for the analyses that are not maintained incrementally"""
+        return SearchAnalytics(self.data, self.response_chunks)
+
+    def calculate_overview(self) -> Dict[str, Any]:
+        """
+        Calculate dataset-level totals for prompts, queries and domains
+        """
+        return {
+            'total_prompts': len(self.data),
+            'total_queries': self.total_queries,
+            'total_unique_domains': len(self._domain_pairs)
+        }
+
+    def domain_summary(self, domain_of_interest: str) -> Dict[str, Any]:
+        """
+        Return the running counters for a domain without building any per-appearance lists
+        """
+        totals = self._domain_totals.get(domain_of_interest, Counter())
+        ranks = self._domain_ranks.get(domain_of_interest)
+        appearances = totals['appearances']
+
+        return {
+            'total_appearances': appearances,
+            'total_citations': totals['citations'],
+            'retrieval_rate': appearances / self.total_queries if self.total_queries > 0 else 0,
+            'usage_rate': totals['cited_appearances'] / appearances if appearances > 0 else 0,
+            'avg_citation_rank': totals['rank_sum'] / totals['citations'] if totals['citations'] else None,
+            'min_citation_rank': min(ranks) if ranks else None
+        }
+
+    def calculate_domain_stats(self, domain_of_interest: str) -> Dict[str, Any]:
+        """
+        Calculate statistics for a specific domain of interest
+        """
+        stats = self.domain_summary(domain_of_interest)
+
+        prompt_appearances = {}
+        query_appearances = []
+        citation_positions = []
+        for (prompt, query), citations in self._domain_pairs.get(domain_of_interest, {}).items():
+            prompt_appearances[prompt] = None
+            query_appearances.append(query)
+            citation_positions.extend(citations)
+
+        stats['prompt_appearances'] = list(prompt_appearances)
+        stats['query_appearances'] = query_appearances
+        stats['citation_positions'] = citation_positions
+        return stats
+
+    def calculate_query_frequency_stats(self) -> Dict[str, Any]:
+        """
+        Calculate frequency statistics for all queries
+        """
+        query_counter = Counter({query: len(prompts) for query, prompts in self._query_prompts.items()})
+
+        query_stats = {}
+        for query, prompts in self._query_prompts.items():
+            query_stats[query] = {
+                'frequency': len(prompts),
+                'frequency_rate': len(prompts) / self.total_queries,
+                'prompts': list(prompts),
+                'unique_prompts': len(prompts)
+            }
+
+        return {
+            'total_queries': self.total_queries,
+            'unique_queries': len(query_counter),
+            'query_details': query_stats,
+            'most_common_queries': query_counter.most_common(10)
+        }
+
+    def calculate_prompt_stats(self) -> Dict[str, Any]:
+        """
+        Calculate statistics for each prompt
+        """
+        prompt_stats = {}
+        for prompt, queries in self.data.items():
+            total_citations = self._prompt_citations[prompt]
+            prompt_stats[prompt] = {
+                'total_queries': len(queries),
+                'unique_domains': len(self._prompt_domains.get(prompt, ())),
+                'total_citations': total_citations,
+                'domains_with_citations': len(self._prompt_cited_domains.get(prompt, ())),
+                'avg_citations_per_query': total_citations / len(queries) if queries else 0
+            }
+        return prompt_stats
+
+    def analyze_queries_with_target_domain(self, domain_of_interest: str) -> Dict[str, Any]:
+        """
+        Analyze each query to show target domain retrieval status, total sources, and prompt counts
+        """
+        # Target domain citations per query, in ingestion order
+        target_citations: Dict[str, List[int]] = {}
+        for (prompt, query), citations in self._domain_pairs.get(domain_of_interest, {}).items():
+            target_citations.setdefault(query, []).extend(citations)
+
+        query_analysis = {}
+        for query, prompts in self._query_prompts.items():
+            citations = target_citations.get(query)
+            prompt_count = len(prompts)
+
+            stats = {
+                'target_domain_retrieved': citations is not None,
+                'target_domain_cited': bool(citations),
+                'total_sources': self._query_sources[query],
+                'prompts_using_query': list(prompts),
+                'all_domains': list(self._query_domains.get(query, ())),
+                'target_domain_citations': citations or [],
+                'prompt_count': prompt_count,
+                'unique_prompts': prompt_count,
+                'total_unique_sources': len(self._query_domains.get(query, ())),
+                'avg_sources_per_prompt': self._query_sources[query] / prompt_count
+            }
+
+            # Target domain citation statistics
+            if citations:
+                stats['best_citation_rank'] = min(citations)
+                stats['avg_citation_rank'] = sum(citations) / len(citations)
+                stats['total_citations'] = len(citations)
+            else:
+                stats['best_citation_rank'] = None
+                stats['avg_citation_rank'] = None
+                stats['total_citations'] = 0
+
+            query_analysis[query] = stats
+
+        return query_analysis
+
+    def analyze_intersecting_queries(self) -> Dict[str, Any]:
+        """
+        Analyze queries that appear across multiple prompts
+        """
+        intersecting_analysis = {}
+        for query, prompts in self._query_prompts.items():
+            if len(prompts) <= 1:
+                continue
+
+            cited = self._query_cited_ranks.get(query, {})
+            intersecting_analysis[query] = {
+                'frequency': len(prompts),
+                'unique_prompts': len(prompts),
+                'prompts': list(prompts),
+                'total_domains': len(cited),
+                'domains_with_citations': {domain: list(set(ranks)) for domain, ranks in cited.items()}
+            }
+
+        return intersecting_analysis
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the size of the maintained aggregates"""
+        return {
+            'records_ingested': self.records_ingested,
+            'prompts': len(self.data),
+            'queries': self.total_queries,
+            'unique_queries': len(self._query_prompts),
+            'domains': len(self._domain_pairs),
+            'unique_snippets': len(self.snippet_store)
+        }
@@ -0,0 +1,147 @@
+import asyncio
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+# Signature of the progress callback handed to a job's coroutine: (event_type, data)
+ProgressCallback = Callable[[str, Dict[str, Any]], None]
+
+
+class AnalysisJob:
+    """
+    A background analysis with its progress events and final result.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.events: List[Dict[str, Any]] = []
+        self.result: Optional[Any] = None
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def add_event(self, event_type: str, data: Optional[Dict[str, Any]] = None) -> None:
+        """Record a progress event and wake up every listener"""
+        self.events.append({
+            'id': len(self.events),
+            'type': event_type,
+            'timestamp': time.time(),
+            'data': data or {}
+        })
+        # Swap in a fresh event so listeners that grabbed the old one are released exactly once
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def iter_events(self, start: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield the job's events from index start, waiting for new ones until the job finishes.
+        """
+        position = start
+        while True:
+            changed = self._changed
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+
+            if self.is_finished:
+                return
+            await changed.wait()
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        """Summarize the job for API responses"""
+        summary = {
+            'job_id': self.job_id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'event_count': len(self.events),
+            'last_event': self.events[-1] if self.events else None,
+            'error': self.error
+        }
+        if include_result and self.status == "completed":
+            summary['result'] = self.result
+        return summary
+
+
+class JobManager:
+    """
+    Runs analyses as background asyncio tasks and keeps finished jobs for a TTL.
+
+    A submitted coroutine factory receives a progress callback; every call to
+    it becomes an event that listeners can stream while the job runs.
+    """
+
+    def __init__(self, result_ttl_seconds: float = 3600, max_jobs: int = 1000):
+        self.result_ttl_seconds = result_ttl_seconds
+        self.max_jobs = max_jobs
+        self._jobs: Dict[str, AnalysisJob] = {}
+
+    def submit(self, job_factory: Callable[[ProgressCallback], Awaitable[Any]]) -> AnalysisJob:
+        """
+        Start a new background job. Must be called from within the running event loop.
+
+        Args:
+            job_factory: Called with the job's progress callback, returns the awaitable to run
+
+        Returns:
+            The queued job
+        """
+        self.purge_expired()
+
+        job = AnalysisJob(uuid.uuid4().hex)
+        self._jobs[job.job_id] = job
+        job.add_event("queued")
+        job.task = asyncio.create_task(self._run(job, job_factory))
+        return job
+
+    async def _run(self, job: AnalysisJob, job_factory: Callable[[ProgressCallback], Awaitable[Any]]) -> None:
+        job.status = "running"
+        job.add_event("started")
+        try:
+            job.result = await job_factory(job.add_event)
+            job.status = "completed"
+            job.finished_at = time.time()
+            job.add_event("completed")
+        except Exception as e:
+            # HTTPException carries its message in detail rather than str()
+            job.error = str(getattr(e, 'detail', None) or e)
+            job.status = "failed"
+            job.finished_at = time.time()
+            job.add_event("failed", {'error': job.error})
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        """Return the job with the given id, or None if unknown or expired"""
+        self.purge_expired()
+        return self._jobs.get(job_id)
+
+    def purge_expired(self) -> None:
+        """Drop finished jobs older than the TTL, then the oldest finished jobs beyond max_jobs"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.is_finished and now - job.finished_at > self.result_ttl_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+        if len(self._jobs) > self.max_jobs:
+            finished = sorted(
+                (job for job in self._jobs.values() if job.is_finished),
+                key=lambda job: job.finished_at
+            )
+            for job in finished[:len(self._jobs) - self.max_jobs]:
+                del self._jobs[job.job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """Count jobs by status"""
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {'total': len(self._jobs), 'by_status': counts}
@@ -0,0 +1,344 @@
+import asyncio
+import contextvars
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Histogram buckets for durations (seconds) and payload sizes (bytes)
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = tuple(256 * 4 ** power for power in range(10))  # 256 B .. 64 MiB
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Opt-in sampling profiler: requests slower than the threshold get their folded stacks written out
+PROFILE_SLOW_REQUESTS_MS = os.getenv('PROFILE_SLOW_REQUESTS_MS')
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+PROFILE_OUTPUT_DIR = os.getenv('PROFILE_OUTPUT_DIR', 'profiles')
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class MetricCounter:
+    """Monotonic counter with labels, rendered as <name>_total"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name}_total {self.documentation}", f"# TYPE {self.name}_total counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, in the Prometheus exposition layout"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Label values -> [per-bucket counts (last is +Inf), sum]
+        self._series: Dict[LabelValues, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        label_names = self.labelnames + ('le',)
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    labels = _format_labels(label_names, key + (_format_value(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds the process's metrics and renders them in the Prometheus text format.
+
+    Collectors are callables run at scrape time that return extra gauge
+    samples as (name, documentation, {label tuple: value}) entries, for values
+    that already live elsewhere (e.g. queue depth).
+    """
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], List[Tuple[str, str, Sequence[str], Dict[LabelValues, float]]]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> MetricCounter:
+        metric = MetricCounter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[Tuple[str, str, Sequence[str], Dict[LabelValues, float]]]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, documentation, labelnames, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} gauge")
+                for key, value in samples.items():
+                    lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+request_duration = registry.histogram(
+    "search_analytics_http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+)
+response_size = registry.histogram(
+    "search_analytics_http_response_size_bytes", "HTTP response body size as sent", ("route",), SIZE_BUCKETS
+)
+stage_duration = registry.histogram(
+    "search_analytics_stage_duration_seconds",
+    "Time spent in each analysis stage (file validation, loading, report sections, Gemini calls, serialization)",
+    ("stage",)
+)
+payload_size = registry.histogram(
+    "search_analytics_payload_size_bytes", "Encoded JSON payload size before compression", (), SIZE_BUCKETS
+)
+cache_requests = registry.counter(
+    "search_analytics_cache_requests", "Cache lookups by cache and outcome", ("cache", "outcome")
+)
+profiles_written = registry.counter("search_analytics_profiles_written", "Slow-request profiles written to disk")
+
+
+class RequestTimings:
+    """Stage timings collected for one request, reported in its Server-Timing header"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        with self._lock:
+            return ", ".join(
+                f"{stage.replace('.', '-')};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()
+            )
+
+
+_current_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar(
+    'search_analytics_request_timings', default=None
+)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    """Timings of the request being handled in this context, if any"""
+    return _current_timings.get()
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration in the histogram and in the current request's timings"""
+    stage_duration.observe(seconds, stage=stage)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as an analysis stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def record_cache_outcome(cache: str, hit: bool) -> None:
+    """Count a cache lookup as a hit or a miss"""
+    cache_requests.inc(cache=cache, outcome="hit" if hit else "miss")
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread at a fixed interval from a background thread.
+
+    Samples are aggregated as folded stacks ("thread;outer;...;inner count"),
+    the input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval_seconds):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency, response size and stage timings.
+
+    Each request gets a RequestTimings in a context variable, so stage() calls
+    made while handling it (including in executor threads that copy the
+    context) show up in its Server-Timing header. Latency is labelled with the
+    route template rather than the raw path to keep label cardinality bounded.
+
+    With PROFILE_SLOW_REQUESTS_MS set, requests are sampled by a
+    SamplingProfiler (one request at a time) and those slower than the
+    threshold have their folded stacks written to PROFILE_OUTPUT_DIR. Stopping
+    the profiler and writing the file run through run_blocking (asyncio.to_thread
+    by default) so the event loop never waits on them.
+    """
+
+    def __init__(self, app: Any, slow_request_ms: Optional[float] = None,
+                 run_blocking: Optional[Callable[..., Awaitable[Any]]] = None):
+        self.app = app
+        self.run_blocking = run_blocking or asyncio.to_thread
+        if slow_request_ms is None and PROFILE_SLOW_REQUESTS_MS:
+            slow_request_ms = float(PROFILE_SLOW_REQUESTS_MS)
+        self.slow_request_ms = slow_request_ms
+        self._profiler_lock = threading.Lock()
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        status = {"code": 500}
+        sent_bytes = 0
+
+        profiler = None
+        if self.slow_request_ms is not None and self._profiler_lock.acquire(blocking=False):
+            profiler = SamplingProfiler(PROFILE_SAMPLE_INTERVAL_MS / 1000)
+            profiler.start()
+
+        async def send_with_metrics(message: Dict[str, Any]) -> None:
+            nonlocal sent_bytes
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                server_timing = timings.server_timing()
+                if server_timing:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", server_timing.encode("latin-1"))
+                    ]
+            elif message["type"] == "http.response.body":
+                sent_bytes += len(message.get("body", b""))
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            request_duration.observe(elapsed, method=scope.get("method", ""), route=route_path, status=str(status["code"]))
+            response_size.observe(sent_bytes, route=route_path)
+            _current_timings.reset(token)
+
+            if profiler is not None:
+                await self.run_blocking(self._finish_profile, profiler, route_path, elapsed)
+
+    def _finish_profile(self, profiler: SamplingProfiler, route_path: str, elapsed: float) -> None:
+        """Stop the profiler and write its samples if the request was slow; blocking"""
+        try:
+            profiler.stop()
+        finally:
+            self._profiler_lock.release()
+        if elapsed * 1000 >= self.slow_request_ms and profiler.samples:
+            self._write_profile(profiler, route_path, elapsed)
+
+    def _write_profile(self, profiler: SamplingProfiler, route_path: str, elapsed: float) -> None:
+        try:
+            os.makedirs(PROFILE_OUTPUT_DIR, exist_ok=True)
+            name = route_path.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+            path = os.path.join(PROFILE_OUTPUT_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-{name}-{elapsed * 1000:.0f}ms.folded")
+            with open(path, "w") as f:
+                f.write(profiler.folded())
+            profiles_written.inc()
+        except OSError as e:
+            print(f"Could not write request profile: {e}")
@@ -0,0 +1,177 @@
+import random
+import re
+import unicodedata
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Mersenne prime used as the modulus of the MinHash permutations
+MINHASH_PRIME = (1 << 61) - 1
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.7
+DEFAULT_SHINGLE_SIZE = 3
+DEFAULT_NUM_PERMUTATIONS = 96
+DEFAULT_BANDS = 24
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query for near-duplicate detection.
+
+    Args:
+        query: Raw query string (e.g., "Best bikes, Berlin!")
+
+    Returns:
+        Lower-cased query with accents folded, punctuation removed and
+        whitespace collapsed (e.g., "best bikes berlin")
+    """
+    text = unicodedata.normalize('NFKD', query.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text).split())
+
+
+def query_shingles(query: str, size: int = DEFAULT_SHINGLE_SIZE) -> Set[str]:
+    """Return the set of character shingles of a normalized query"""
+    if len(query) <= size:
+        return {query}
+    return {query[i:i + size] for i in range(len(query) - size + 1)}
+
+
+def jaccard_similarity(first: Set[str], second: Set[str]) -> float:
+    """Jaccard similarity of two shingle sets"""
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+class QueryClusterIndex:
+    """
+    Clusters near-duplicate queries with MinHash signatures and LSH banding.
+
+    Each query's character shingles are hashed with crc32 and reduced to a
+    MinHash signature using seeded random permutations, so signatures are
+    deterministic across processes. Signatures are split into bands; queries
+    sharing any band bucket become candidate pairs, which are verified with
+    the exact Jaccard similarity of their shingles before being merged with
+    union-find. Only candidates are compared, so clustering stays
+    sub-quadratic on realistic query sets.
+
+    Clustering is single-linkage: two queries below the threshold can end up
+    in one cluster through a chain of similar queries.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_SIMILARITY_THRESHOLD, shingle_size: int = DEFAULT_SHINGLE_SIZE,
+                 num_permutations: int = DEFAULT_NUM_PERMUTATIONS, bands: int = DEFAULT_BANDS, seed: int = 1):
+        if num_permutations % bands != 0:
+            raise ValueError(f"num_permutations ({num_permutations}) must be a multiple of bands ({bands})")
+
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.num_permutations = num_permutations
+        self.bands = bands
+        self.rows_per_band = num_permutations // bands
+
+        rng = random.Random(seed)
+        self._permutations = [
+            (rng.randrange(1, MINHASH_PRIME), rng.randrange(0, MINHASH_PRIME))
+            for _ in range(num_permutations)
+        ]
+
+        # Normalized form -> id; several raw queries may share one normalized form
+        self._normalized_ids: Dict[str, int] = {}
+        self._normalized: List[str] = []
+        # First raw query added for each normalized form, used as the cluster label
+        self._first_queries: List[str] = []
+        self._shingles: List[Set[str]] = []
+        self._parents: List[int] = []
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+        self._query_ids: Dict[str, int] = {}
+        self.candidate_pairs = 0
+
+    def _signature(self, shingles: Set[str]) -> List[int]:
+        hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingles]
+        return [min((a * h + b) % MINHASH_PRIME for h in hashes) for a, b in self._permutations]
+
+    def _find(self, node: int) -> int:
+        parents = self._parents
+        while parents[node] != node:
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+
+    def _union(self, first: int, second: int) -> None:
+        first_root, second_root = self._find(first), self._find(second)
+        if first_root != second_root:
+            # Keep the earlier query as root so cluster labels are stable
+            if second_root < first_root:
+                first_root, second_root = second_root, first_root
+            self._parents[second_root] = first_root
+
+    def add(self, query: str) -> None:
+        """Add a query to the index, merging it into the clusters of similar queries"""
+        if query in self._query_ids:
+            return
+
+        normalized = normalize_query(query)
+        node = self._normalized_ids.get(normalized)
+        if node is not None:
+            self._query_ids[query] = node
+            return
+
+        node = len(self._normalized)
+        self._normalized_ids[normalized] = node
+        self._normalized.append(normalized)
+        self._first_queries.append(query)
+        shingles = query_shingles(normalized, self.shingle_size)
+        self._shingles.append(shingles)
+        self._parents.append(node)
+        self._query_ids[query] = node
+
+        signature = self._signature(shingles)
+        candidates = set()
+        for band in range(self.bands):
+            start = band * self.rows_per_band
+            bucket = self._buckets.setdefault((band, tuple(signature[start:start + self.rows_per_band])), [])
+            candidates.update(bucket)
+            bucket.append(node)
+
+        for candidate in candidates:
+            self.candidate_pairs += 1
+            if self._find(candidate) != self._find(node) and \
+                    jaccard_similarity(shingles, self._shingles[candidate]) >= self.threshold:
+                self._union(candidate, node)
+
+    def add_all(self, queries: Iterable[str]) -> None:
+        """Add several queries in order"""
+        for query in queries:
+            self.add(query)
+
+    def cluster_of(self, query: str) -> Optional[str]:
+        """
+        Return the cluster label of an indexed query, or None if it was never added.
+
+        The label is the first added query of the cluster.
+        """
+        node = self._query_ids.get(query)
+        if node is None:
+            return None
+        # Roots are the earliest node of their cluster, so this is the cluster's first query
+        return self._first_queries[self._find(node)]
+
+    def clusters(self) -> Dict[str, List[str]]:
+        """
+        Return every cluster as label -> member queries, in the order queries were added
+        """
+        clusters: Dict[str, List[str]] = {}
+        for query, node in self._query_ids.items():
+            clusters.setdefault(self._first_queries[self._find(node)], []).append(query)
+        return clusters
+
+    def stats(self) -> Dict[str, int]:
+        """Return index sizes and the number of candidate comparisons made"""
+        return {
+            'queries': len(self._query_ids),
+            'normalized_queries': len(self._normalized),
+            'clusters': len({self._find(node) for node in range(len(self._parents))}),
+            'buckets': len(self._buckets),
+            'candidate_pairs': self.candidate_pairs
+        }
@@ -0,0 +1,97 @@
+from array import array
+from collections.abc import Mapping
+from typing import Any, Iterable, Iterator, Sequence, Union
+
+RECORD_KEYS = ('citations', 'contents')
+
+# Packed citation ranks: bytes while every rank fits in one byte (the norm), else an unsigned int array
+PackedRanks = Union[bytes, array]
+
+
+def pack_ranks(ranks: Iterable[int]) -> PackedRanks:
+    """
+    Pack citation ranks into the smallest typed sequence that holds them.
+
+    Empty rank lists all share the interpreter's single empty bytes object,
+    so domains that were retrieved but never cited cost nothing extra.
+    """
+    ranks = list(ranks)
+    if all(0 <= rank < 256 for rank in ranks):
+        return bytes(ranks)
+    return array('I', ranks)
+
+
+class CitationRecord(Mapping):
+    """
+    Compact (prompt, query, domain) citation record.
+
+    Replaces the {'citations': [...], 'contents': [...]} dict: ranks are
+    packed by pack_ranks and contents are a SnippetList, held in a slotted
+    object rather than a dict. It is a read-only Mapping with the same two
+    keys, and record['citations'] returns a fresh list of ints, so callers
+    written against the dict layout keep working. Use .ranks to read the
+    packed ranks without copying them.
+    """
+
+    __slots__ = ('ranks', 'contents')
+
+    def __init__(self, citations: Iterable[int], contents: Sequence[str]):
+        self.ranks = pack_ranks(citations)
+        self.contents = contents
+
+    def __getitem__(self, key: str) -> Any:
+        if key == 'citations':
+            return list(self.ranks)
+        if key == 'contents':
+            return self.contents
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        # Kept for callers that reassign a field, e.g. after deduplicating ranks
+        if key == 'citations':
+            self.ranks = pack_ranks(value)
+        elif key == 'contents':
+            self.contents = value
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(RECORD_KEYS)
+
+    def __len__(self) -> int:
+        return len(RECORD_KEYS)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in RECORD_KEYS
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Mapping):
+            return self['citations'] == list(other.get('citations', ())) and \
+                list(self.contents) == list(other.get('contents', ()))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"CitationRecord(citations={list(self.ranks)!r}, contents={list(self.contents)!r})"
+
+    def __reduce__(self):
+        return (_rebuild_citation_record, (self.ranks, self.contents))
+
+    def to_dict(self) -> dict:
+        """Return the record in the plain dict layout, with list copies of both fields"""
+        return {'citations': list(self.ranks), 'contents': list(self.contents)}
+
+
+def _rebuild_citation_record(ranks: PackedRanks, contents: Sequence[str]) -> CitationRecord:
+    record = CitationRecord.__new__(CitationRecord)
+    record.ranks = ranks
+    record.contents = contents
+    return record
+
+
+def citation_ranks(citation_data: Mapping) -> Sequence[int]:
+    """Return a record's ranks without copying them when it is a CitationRecord (plain dicts are accepted too)"""
+    if isinstance(citation_data, CitationRecord):
+        return citation_data.ranks
+    return citation_data['citations']
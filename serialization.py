@@ -0,0 +1,134 @@
+import asyncio
+import gzip
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from pydantic_core import to_json
+
+from metrics import payload_size, stage
+
+try:
+    import brotli
+except ImportError:  # brotli is a listed dependency, but gzip keeps working without it
+    brotli = None
+
+if TYPE_CHECKING:
+    # Imported in json_response so CLIs that only need encode_json do not load FastAPI
+    from fastapi.responses import Response
+
+# Bodies smaller than this are sent uncompressed; compression would not pay for itself
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def encode_json(payload: Any) -> bytes:
+    """
+    Serialize a payload to JSON bytes.
+
+    Uses pydantic-core's Rust encoder, which is several times faster than the
+    stdlib json module on large nested dicts. Non-finite floats become null,
+    matching what the Pydantic response models produced.
+    """
+    return to_json(payload)
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """
+    Parse an Accept-Encoding header into an encoding -> quality mapping.
+
+    Args:
+        header: Raw header value, e.g. "gzip, deflate, br;q=0.9"
+
+    Returns:
+        Mapping of lower-cased encodings to their q-values
+    """
+    accepted = {}
+    for part in (header or "").split(","):
+        encoding, _, params = part.strip().partition(";")
+        if not encoding:
+            continue
+
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[encoding.strip().lower()] = quality
+    return accepted
+
+
+def choose_encoding(header: Optional[str]) -> Optional[str]:
+    """Pick the best supported content encoding the client accepts, preferring brotli"""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_quality = None, 0.0
+    for encoding in candidates:
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def encode_body(payload: Any, accept_encoding: Optional[str] = None) -> Tuple[bytes, Optional[str]]:
+    """
+    Encode a payload as JSON and compress it according to the client's Accept-Encoding.
+
+    Args:
+        payload: JSON-serializable response body
+        accept_encoding: Value of the request's Accept-Encoding header
+
+    Returns:
+        Tuple of (body, content encoding); the encoding is None for bodies
+        below MIN_COMPRESS_BYTES or when the client accepts no supported encoding
+    """
+    with stage("serialize"):
+        body = encode_json(payload)
+        payload_size.observe(len(body))
+
+        encoding = choose_encoding(accept_encoding) if len(body) >= MIN_COMPRESS_BYTES else None
+        if encoding == "br":
+            body = brotli.compress(body, quality=BROTLI_QUALITY)
+        elif encoding == "gzip":
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body, encoding
+
+
+async def json_response(payload: Any, accept_encoding: Optional[str] = None, status_code: int = 200,
+                        headers: Optional[Dict[str, str]] = None,
+                        run_blocking: Optional[Callable[..., Awaitable[Any]]] = None) -> "Response":
+    """
+    Build a JSON response, compressed according to the client's Accept-Encoding.
+
+    The payload is encoded directly without going through a response model,
+    so large report dicts are not validated and copied a second time.
+    Encoding and compressing a multi-megabyte report is CPU work, so it runs
+    through run_blocking (a worker thread by default) instead of on the event loop.
+
+    Args:
+        payload: JSON-serializable response body
+        accept_encoding: Value of the request's Accept-Encoding header
+        status_code: HTTP status code
+        headers: Extra response headers
+        run_blocking: Awaits a blocking call off the event loop; defaults to asyncio.to_thread
+
+    Returns:
+        Response with the (possibly compressed) JSON body
+    """
+    from fastapi.responses import Response
+
+    body, encoding = await (run_blocking or asyncio.to_thread)(encode_body, payload, accept_encoding)
+
+    response_headers = {"Vary": "Accept-Encoding", **(headers or {})}
+    if encoding is not None:
+        response_headers["Content-Encoding"] = encoding
+
+    return Response(
+        content=body,
+        status_code=status_code,
+        headers=response_headers,
+        media_type="application/json"
+    )
@@ -0,0 +1,560 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from array import array
+from collections.abc import Mapping, Sequence
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from records import CitationRecord, citation_ranks
+
+try:
+    import fcntl
+except ImportError:  # flock is POSIX-only; without it concurrent publishers may both build the dataset
+    fcntl = None
+
+DATASET_MAGIC = b"SADS"
+DATASET_FORMAT_VERSION = 1
+
+# Arrays stored in a dataset file, in file order, with their array typecodes
+SECTIONS = (
+    ('string_offsets', 'Q'),        # Byte offset of every string in the blob, plus the end offset
+    ('string_blob', 'B'),           # UTF-8 text of all strings
+    ('prompt_ids', 'I'),            # String id of each prompt
+    ('prompt_pair_start', 'I'),     # First (prompt, query) pair of each prompt
+    ('pair_query_ids', 'I'),        # String id of each pair's query
+    ('pair_entry_start', 'I'),      # First domain entry of each pair
+    ('entry_domain_ids', 'I'),      # String id of each entry's domain
+    ('entry_rank_start', 'I'),      # First citation rank of each entry
+    ('entry_content_start', 'I'),   # First snippet of each entry
+    ('ranks', 'I'),                 # Citation ranks
+    ('content_ids', 'I'),           # String ids of snippets
+    ('chunk_prompt_ids', 'I'),      # String id of each prompt with response chunks
+    ('chunk_prompt_start', 'I'),    # First sentence of each of those prompts
+    ('sentence_ids', 'I'),          # String id of each cited sentence
+    ('sentence_domain_start', 'I'), # First cited domain of each sentence
+    ('sentence_domain_ids', 'I'),   # String ids of cited domains
+)
+
+HEADER = struct.Struct('<4sIQII')
+SECTION_ENTRY = struct.Struct('<QQ')
+ALIGNMENT = 8
+
+
+class _StringTable:
+    """Interns strings to dense ids while a dataset file is being written"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.strings: List[str] = []
+
+    def add(self, text: str) -> int:
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = self.ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+
+def write_dataset_file(path: str, data: Dict[str, Dict[str, Dict[str, Any]]],
+                       response_chunks: Dict[str, Dict[str, List[str]]], generation: int) -> None:
+    """
+    Write a processed dataset as a flat file of typed arrays plus a string table.
+
+    Prompts, queries and domains get the lowest string ids so readers can
+    decode just those eagerly; snippets and sentences follow and are only
+    decoded when accessed. Dictionary order is preserved throughout.
+
+    Args:
+        path: Output file (written in place; callers publish it by renaming)
+        data: prompt -> query -> domain -> citation record, as returned by the loaders
+        response_chunks: prompt -> sentence -> cited domains
+        generation: Generation number stored in the header
+    """
+    table = _StringTable()
+    for prompt, queries in data.items():
+        table.add(prompt)
+        for query, domains in queries.items():
+            table.add(query)
+            for domain in domains:
+                table.add(domain)
+    for prompt, chunks in response_chunks.items():
+        table.add(prompt)
+        for domains in chunks.values():
+            for domain in domains:
+                table.add(domain)
+    key_count = len(table.strings)
+
+    arrays = {name: array(typecode) for name, typecode in SECTIONS}
+    for prompt, queries in data.items():
+        arrays['prompt_ids'].append(table.ids[prompt])
+        arrays['prompt_pair_start'].append(len(arrays['pair_query_ids']))
+        for query, domains in queries.items():
+            arrays['pair_query_ids'].append(table.ids[query])
+            arrays['pair_entry_start'].append(len(arrays['entry_domain_ids']))
+            for domain, citation_data in domains.items():
+                arrays['entry_domain_ids'].append(table.ids[domain])
+                arrays['entry_rank_start'].append(len(arrays['ranks']))
+                arrays['entry_content_start'].append(len(arrays['content_ids']))
+                arrays['ranks'].extend(citation_ranks(citation_data))
+                arrays['content_ids'].extend(table.add(text) for text in citation_data.get('contents', []))
+    arrays['prompt_pair_start'].append(len(arrays['pair_query_ids']))
+    arrays['pair_entry_start'].append(len(arrays['entry_domain_ids']))
+    arrays['entry_rank_start'].append(len(arrays['ranks']))
+    arrays['entry_content_start'].append(len(arrays['content_ids']))
+
+    for prompt, chunks in response_chunks.items():
+        arrays['chunk_prompt_ids'].append(table.ids[prompt])
+        arrays['chunk_prompt_start'].append(len(arrays['sentence_ids']))
+        for sentence, domains in chunks.items():
+            arrays['sentence_ids'].append(table.add(sentence))
+            arrays['sentence_domain_start'].append(len(arrays['sentence_domain_ids']))
+            arrays['sentence_domain_ids'].extend(table.ids[domain] for domain in domains)
+    arrays['chunk_prompt_start'].append(len(arrays['sentence_ids']))
+    arrays['sentence_domain_start'].append(len(arrays['sentence_domain_ids']))
+
+    blob = bytearray()
+    offsets = arrays['string_offsets']
+    for text in table.strings:
+        offsets.append(len(blob))
+        blob.extend(text.encode('utf-8'))
+    offsets.append(len(blob))
+    arrays['string_blob'] = array('B', blob)
+
+    header_size = HEADER.size + SECTION_ENTRY.size * len(SECTIONS)
+    position = header_size
+    entries = []
+    for name, _ in SECTIONS:
+        position += -position % ALIGNMENT
+        entries.append((position, len(arrays[name])))
+        position += len(arrays[name]) * arrays[name].itemsize
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(DATASET_MAGIC, DATASET_FORMAT_VERSION, generation, key_count, len(table.strings)))
+        for offset, count in entries:
+            f.write(SECTION_ENTRY.pack(offset, count))
+        for (name, _), (offset, _) in zip(SECTIONS, entries):
+            f.write(b'\0' * (offset - f.tell()))
+            arrays[name].tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class SharedDataset:
+    """
+    Read-only view of a dataset file mapped into memory.
+
+    The file's pages are shared by every process that maps it, so N workers
+    hold one copy of the arrays and snippet text. Each process decodes only
+    the prompt, query and domain strings (for key lookups); everything else
+    is read from the mapping on access. data and response_chunks behave like
+    the nested dicts returned by the loaders and can be passed straight to
+    SearchAnalytics.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+
+        magic, version, self.generation, self.key_count, self.string_count = HEADER.unpack_from(buffer, 0)
+        if magic != DATASET_MAGIC or version != DATASET_FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {DATASET_FORMAT_VERSION} shared dataset file")
+
+        self._arrays: Dict[str, memoryview] = {}
+        for index, (name, typecode) in enumerate(SECTIONS):
+            offset, count = SECTION_ENTRY.unpack_from(buffer, HEADER.size + index * SECTION_ENTRY.size)
+            itemsize = array(typecode).itemsize
+            section = buffer[offset:offset + count * itemsize]
+            self._arrays[name] = section if typecode == 'B' else section.cast(typecode)
+            # Also exposed as attributes, which the views read on every access
+            setattr(self, name, self._arrays[name])
+
+        self._offsets = self._arrays['string_offsets']
+        self._blob = self._arrays['string_blob']
+        # Keys are decoded once per process; they are few compared to the snippets
+        self.keys: List[str] = [self._decode(string_id) for string_id in range(self.key_count)]
+        self.key_ids: Dict[str, int] = {key: string_id for string_id, key in enumerate(self.keys)}
+
+        self.data = _PromptsView(self)
+        self.response_chunks = _ChunkPromptsView(self)
+
+    def _decode(self, string_id: int) -> str:
+        return str(self._blob[self._offsets[string_id]:self._offsets[string_id + 1]], 'utf-8')
+
+    def string(self, string_id: int) -> str:
+        """Return a string of the table, decoding it from the mapping unless it is a key"""
+        if string_id < self.key_count:
+            return self.keys[string_id]
+        return self._decode(string_id)
+
+    def close(self) -> None:
+        """
+        Release the mapping; the dataset and its views must not be used afterwards.
+
+        If slices of the mapping are still referenced elsewhere, it is unmapped
+        once the last of them is garbage collected instead.
+        """
+        for section in self._arrays.values():
+            section.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the file's generation, size and record counts"""
+        return {
+            'path': self.path,
+            'generation': self.generation,
+            'file_bytes': len(self._mmap),
+            'strings': self.string_count,
+            'decoded_keys': self.key_count,
+            'prompts': len(self._arrays['prompt_ids']),
+            'query_pairs': len(self._arrays['pair_query_ids']),
+            'citation_records': len(self._arrays['entry_domain_ids'])
+        }
+
+
+class _StringSequence(Sequence):
+    """Lazily decoded sequence of strings given by their ids"""
+
+    __slots__ = ('_dataset', '_ids')
+
+    def __init__(self, dataset: SharedDataset, ids: memoryview):
+        self._dataset = dataset
+        self._ids = ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._dataset.string(string_id) for string_id in self._ids[index]]
+        return self._dataset.string(self._ids[index])
+
+    def __iter__(self) -> Iterator[str]:
+        string = self._dataset.string
+        for string_id in self._ids:
+            yield string(string_id)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (Sequence, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+
+class _KeyedRangeView(Mapping):
+    """
+    Mapping over a contiguous range of records whose keys are string ids.
+
+    Subclasses say which array holds the key ids and how to build a value.
+    A key -> position dict is only built if the view is used for lookups.
+    """
+
+    key_array = ''
+
+    def __init__(self, dataset: SharedDataset, start: int, end: int):
+        self._dataset = dataset
+        self._start = start
+        self._end = end
+        self._positions: Optional[Dict[int, int]] = None
+
+    def _value(self, position: int) -> Any:
+        raise NotImplementedError
+
+    def _key_ids(self) -> List[int]:
+        return getattr(self._dataset, self.key_array)[self._start:self._end].tolist()
+
+    def _position(self, key: Any) -> Optional[int]:
+        string_id = self._dataset.key_ids.get(key) if isinstance(key, str) else None
+        if string_id is None:
+            return None
+        if self._positions is None:
+            if self._end - self._start <= 16:
+                # Small ranges (a query's domains) are cheaper to scan than to index
+                try:
+                    return self._start + self._key_ids().index(string_id)
+                except ValueError:
+                    return None
+            self._positions = {key_id: self._start + offset for offset, key_id in enumerate(self._key_ids())}
+        return self._positions.get(string_id)
+
+    def __getitem__(self, key: Any) -> Any:
+        position = self._position(key)
+        if position is None:
+            raise KeyError(key)
+        return self._value(position)
+
+    def __contains__(self, key: Any) -> bool:
+        return self._position(key) is not None
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def keys(self) -> List[str]:
+        # Plain lists rather than Mapping views: callers only iterate them
+        keys = self._dataset.keys
+        return [keys[key_id] for key_id in self._key_ids()]
+
+    def items(self) -> List[Tuple[str, Any]]:
+        keys = self._dataset.keys
+        return [(keys[key_id], self._value(self._start + offset)) for offset, key_id in enumerate(self._key_ids())]
+
+    def values(self) -> List[Any]:
+        return [self._value(position) for position in range(self._start, self._end)]
+
+
+class _DomainsView(_KeyedRangeView):
+    """domain -> citation record for one (prompt, query) pair"""
+
+    key_array = 'entry_domain_ids'
+
+    def _value(self, position: int) -> CitationRecord:
+        return self._record(position, position + 1)
+
+    def _record(self, position: int, following: int) -> CitationRecord:
+        dataset = self._dataset
+        rank_start = dataset.entry_rank_start
+        content_start = dataset.entry_content_start
+        record = CitationRecord.__new__(CitationRecord)
+        record.ranks = dataset.ranks[rank_start[position]:rank_start[following]]
+        record.contents = _StringSequence(dataset, dataset.content_ids[content_start[position]:content_start[following]])
+        return record
+
+    def items(self) -> List[Tuple[str, CitationRecord]]:
+        keys = self._dataset.keys
+        record = self._record
+        return [(keys[key_id], record(position, position + 1))
+                for position, key_id in enumerate(self._key_ids(), self._start)]
+
+
+class _QueriesView(_KeyedRangeView):
+    """query -> domains for one prompt"""
+
+    key_array = 'pair_query_ids'
+
+    def _value(self, position: int) -> _DomainsView:
+        entry_start = self._dataset.pair_entry_start
+        return _DomainsView(self._dataset, entry_start[position], entry_start[position + 1])
+
+
+class _PromptsView(_KeyedRangeView):
+    """prompt -> queries for the whole dataset; per-prompt views are kept once built"""
+
+    key_array = 'prompt_ids'
+
+    def __init__(self, dataset: SharedDataset):
+        super().__init__(dataset, 0, len(dataset.prompt_ids))
+        self._views: Dict[int, _QueriesView] = {}
+
+    def _value(self, position: int) -> _QueriesView:
+        view = self._views.get(position)
+        if view is None:
+            pair_start = self._dataset.prompt_pair_start
+            view = self._views[position] = _QueriesView(self._dataset, pair_start[position], pair_start[position + 1])
+        return view
+
+
+class _SentencesView(Mapping):
+    """sentence -> cited domains for one prompt; sentences are decoded on access"""
+
+    def __init__(self, dataset: SharedDataset, start: int, end: int):
+        self._dataset = dataset
+        self._start = start
+        self._end = end
+        self._positions: Optional[Dict[str, int]] = None
+
+    def _value(self, position: int) -> List[str]:
+        domain_start = self._dataset.sentence_domain_start
+        keys = self._dataset.keys
+        ids = self._dataset.sentence_domain_ids[domain_start[position]:domain_start[position + 1]]
+        return [keys[domain_id] for domain_id in ids]
+
+    def __getitem__(self, sentence: str) -> List[str]:
+        if self._positions is None:
+            self._positions = {text: self._start + offset for offset, text in enumerate(self)}
+        return self._value(self._positions[sentence])
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(_StringSequence(self._dataset, self._dataset.sentence_ids[self._start:self._end]))
+
+    def items(self) -> List[Tuple[str, List[str]]]:
+        return [(sentence, self._value(self._start + offset)) for offset, sentence in enumerate(self)]
+
+
+class _ChunkPromptsView(_KeyedRangeView):
+    """prompt -> sentences for the response chunks"""
+
+    key_array = 'chunk_prompt_ids'
+
+    def __init__(self, dataset: SharedDataset):
+        super().__init__(dataset, 0, len(dataset.chunk_prompt_ids))
+
+    def _value(self, position: int) -> _SentencesView:
+        sentence_start = self._dataset.chunk_prompt_start
+        return _SentencesView(self._dataset, sentence_start[position], sentence_start[position + 1])
+
+
+class SharedDatasetStore:
+    """
+    Publishes processed datasets to a directory once and lets every worker map them.
+
+    Each set of source files (identified by their sorted absolute paths) has a
+    control file holding its current generation, dataset file and the
+    fingerprints it was built from. The first worker to need a dataset builds
+    it, writes a new generation under an exclusive flock and atomically swaps
+    the control file; workers that find a current control file just map the
+    named file. A dataset is republished with the next generation if its
+    sources' fingerprints or the file format change. The previous
+    generation's file is kept for workers still attaching to it; older ones
+    are deleted. A replaced mapping is never closed here, since analyses may
+    still be reading it: the store drops its reference and the pages are
+    unmapped once the last view of that generation is garbage collected.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._attached: Dict[str, SharedDataset] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.attached = 0
+
+    @staticmethod
+    def dataset_key(sources: List[Dict[str, Any]]) -> str:
+        """Stable name for a set of source files: a hash of their sorted absolute paths, not their contents"""
+        paths = sorted(os.path.abspath(source['path']) for source in sources)
+        return hashlib.sha256(json.dumps(paths).encode('utf-8')).hexdigest()[:32]
+
+    def _control_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read_control(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._control_path(key), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @contextmanager
+    def _publish_lock(self, key: str) -> Iterator[None]:
+        with open(os.path.join(self.directory, f"{key}.lock"), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _normalize_sources(sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Sorted by path like the key, so listing the same files in another order
+        # maps the same generation instead of republishing (and closing) it
+        return sorted(json.loads(json.dumps(sources)), key=lambda source: os.path.abspath(source['path']))
+
+    def _is_current(self, control: Optional[Dict[str, Any]], sources: List[Dict[str, Any]]) -> bool:
+        return (
+            control is not None
+            and control.get('format_version') == DATASET_FORMAT_VERSION
+            and control.get('sources') == self._normalize_sources(sources)
+            and os.path.exists(os.path.join(self.directory, control['file']))
+        )
+
+    def _attach(self, key: str, control: Dict[str, Any]) -> SharedDataset:
+        with self._lock:
+            dataset = self._attached.get(key)
+            if dataset is None or dataset.generation != control['generation']:
+                # The superseded dataset is only dereferenced: requests and cached
+                # SearchAnalytics instances may still hold views into it
+                dataset = SharedDataset(os.path.join(self.directory, control['file']))
+                self._attached[key] = dataset
+                self.attached += 1
+            return dataset
+
+    def get_or_publish(self, sources: List[Dict[str, Any]],
+                       build: Callable[[], Tuple[Dict[str, Any], Dict[str, Any]]]) -> Optional[SharedDataset]:
+        """
+        Map the published dataset for these sources, building and publishing it first if needed.
+
+        A dataset handed out earlier for the same source paths stays readable
+        after a newer generation is attached; it is unmapped once its last
+        reference is gone.
+
+        Args:
+            sources: Fingerprints of the input files (see cache.get_file_fingerprint); the paths
+                name the dataset and any other change publishes a new generation
+            build: Returns (data, response_chunks) when the dataset has to be built
+
+        Returns:
+            The mapped dataset, or None if build() produced no data
+        """
+        key = self.dataset_key(sources)
+        control = self._read_control(key)
+        if self._is_current(control, sources):
+            return self._attach(key, control)
+
+        with self._publish_lock(key):
+            # Another worker may have published while we waited for the lock
+            control = self._read_control(key)
+            if self._is_current(control, sources):
+                return self._attach(key, control)
+
+            data, response_chunks = build()
+            if not data:
+                return None
+
+            generation = (control or {}).get('generation', 0) + 1
+            file_name = f"{key}-{generation}.dataset"
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            os.close(fd)
+            try:
+                write_dataset_file(temp_path, data, response_chunks, generation)
+                os.replace(temp_path, os.path.join(self.directory, file_name))
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+            control = {
+                'format_version': DATASET_FORMAT_VERSION,
+                'generation': generation,
+                'file': file_name,
+                'sources': self._normalize_sources(sources)
+            }
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, 'w') as f:
+                json.dump(control, f)
+            os.replace(temp_path, self._control_path(key))
+            self.published += 1
+
+            # Generations older than the previous one can no longer be attached to;
+            # processes that already mapped them keep their pages until they let go
+            stale = os.path.join(self.directory, f"{key}-{generation - 2}.dataset")
+            if os.path.exists(stale):
+                os.remove(stale)
+
+            return self._attach(key, control)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return publish/attach counters and the generations this process has mapped"""
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'published': self.published,
+                'attached': self.attached,
+                'datasets': {key: dataset.stats() for key, dataset in self._attached.items()}
+            }
@@ -0,0 +1,164 @@
+import heapq
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+from query_clustering import normalize_query
+
+# (prompt, query, domain, best citation rank of the record) of one citation record holding a snippet
+SnippetOccurrence = Tuple[str, str, str, Optional[int]]
+
+
+def tokenize_snippet(text: str) -> List[str]:
+    """Split a snippet or search string into normalized terms"""
+    return normalize_query(text).split()
+
+
+class SnippetSearchIndex:
+    """
+    Inverted full-text index over the citation snippets of a dataset.
+
+    Each distinct snippet is tokenized once, however many citation records
+    hold it. Terms map to sorted lists of snippet ids, and every snippet
+    keeps the (prompt, query, domain, record's best citation rank) records it
+    was cited in, so a search is a postings intersection plus a lookup.
+    Ranks belong to the citation record, not to the snippet: a record's
+    contents are not paired with its ranks once loaded.
+    """
+
+    def __init__(self, data: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]]):
+        self._snippet_ids: Dict[str, int] = {}
+        self._snippets: List[str] = []
+        self._occurrences: List[List[SnippetOccurrence]] = []
+        self._postings: Dict[str, List[int]] = {}
+        self._sorted_terms: Optional[List[str]] = None
+
+        for prompt, queries in data.items():
+            for query, domains in queries.items():
+                for domain, citation_data in domains.items():
+                    citations = citation_data.get('citations', [])
+                    record_best_rank = min(citations) if citations else None
+                    # A snippet listed twice for one record is still one occurrence
+                    seen = set()
+                    for text in citation_data.get('contents', []):
+                        snippet_id = self._add_snippet(text)
+                        if snippet_id not in seen:
+                            seen.add(snippet_id)
+                            self._occurrences[snippet_id].append((prompt, query, domain, record_best_rank))
+
+    def _add_snippet(self, text: str) -> int:
+        snippet_id = self._snippet_ids.get(text)
+        if snippet_id is None:
+            snippet_id = self._snippet_ids[text] = len(self._snippets)
+            self._snippets.append(text)
+            self._occurrences.append([])
+            # Ids grow monotonically, so every postings list stays sorted
+            for term in set(tokenize_snippet(text)):
+                self._postings.setdefault(term, []).append(snippet_id)
+        return snippet_id
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        terms = []
+        for term in self._sorted_terms[bisect_left(self._sorted_terms, prefix):]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def matching_snippets(self, text: str, prefix: bool = False) -> List[int]:
+        """
+        Return the ids of the snippets containing every term of the search text.
+
+        Args:
+            text: Search text; it is normalized the same way as the snippets
+            prefix: Treat the last term as a prefix (for search-as-you-type)
+
+        Returns:
+            Sorted snippet ids; empty if the text has no terms
+        """
+        terms = tokenize_snippet(text)
+        if not terms:
+            return []
+
+        postings = []
+        for term in terms[:-1]:
+            postings.append(self._postings.get(term, []))
+        if prefix:
+            expanded = set()
+            for term in self._expand_prefix(terms[-1]):
+                expanded.update(self._postings[term])
+            postings.append(sorted(expanded))
+        else:
+            postings.append(self._postings.get(terms[-1], []))
+
+        # Intersect starting from the rarest term
+        postings.sort(key=len)
+        matches = set(postings[0])
+        for ids in postings[1:]:
+            if not matches:
+                break
+            matches.intersection_update(ids)
+        return sorted(matches)
+
+    def search(self, text: str, domain: Optional[str] = None, prompt: Optional[str] = None,
+               limit: int = 20, prefix: bool = False) -> Dict[str, Any]:
+        """
+        Find the cited snippets that mention every term of a search text.
+
+        Args:
+            text: Search text, e.g. "warranty 6 months"
+            domain: Only count citations of this domain
+            prompt: Only count citations made for this prompt
+            limit: Maximum number of snippets to return
+            prefix: Treat the last term as a prefix
+
+        Returns:
+            Dictionary with the search terms, the total number of matching
+            snippets and the top results, most cited first. Each result holds
+            the snippet, its citation count, the best rank of the records
+            citing it, its domains and the (prompt, query, domain,
+            record_best_rank) records citing it.
+        """
+        hits = []
+        for snippet_id in self.matching_snippets(text, prefix):
+            occurrences = [
+                occurrence for occurrence in self._occurrences[snippet_id]
+                if (domain is None or occurrence[2] == domain) and (prompt is None or occurrence[0] == prompt)
+            ]
+            if occurrences:
+                hits.append((snippet_id, occurrences))
+
+        def sort_key(hit: Tuple[int, List[SnippetOccurrence]]) -> Tuple[int, float, int]:
+            snippet_id, occurrences = hit
+            ranks = [occurrence[3] for occurrence in occurrences if occurrence[3] is not None]
+            return (-len(occurrences), min(ranks) if ranks else float('inf'), snippet_id)
+
+        results = []
+        for snippet_id, occurrences in heapq.nsmallest(limit, hits, key=sort_key):
+            ranks = [occurrence[3] for occurrence in occurrences if occurrence[3] is not None]
+            results.append({
+                'snippet': self._snippets[snippet_id],
+                'citation_count': len(occurrences),
+                'best_record_rank': min(ranks) if ranks else None,
+                'domains': list(dict.fromkeys(occurrence[2] for occurrence in occurrences)),
+                'citations': [
+                    {'prompt': p, 'query': q, 'domain': d, 'record_best_rank': rank}
+                    for p, q, d, rank in occurrences
+                ]
+            })
+
+        return {
+            'terms': tokenize_snippet(text),
+            'total_snippets': len(hits),
+            'results': results
+        }
+
+    def stats(self) -> Dict[str, int]:
+        """Return index sizes"""
+        return {
+            'snippets': len(self._snippets),
+            'terms': len(self._postings),
+            'postings': sum(len(ids) for ids in self._postings.values()),
+            'occurrences': sum(len(occurrences) for occurrences in self._occurrences)
+        }
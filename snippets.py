@@ -0,0 +1,155 @@
+import hashlib
+import threading
+from array import array
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+
+def snippet_digest(text: str) -> bytes:
+    """Content address of a snippet: a 16-byte BLAKE2b digest of its UTF-8 text"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+class SnippetStore:
+    """
+    Content-addressed store that keeps every distinct citation snippet once.
+
+    Snippets are keyed by the digest of their text and given a dense integer
+    id on first sight. Citation records then hold arrays of those ids instead
+    of their own copies of the text, so a snippet repeated across runs,
+    models, queries and files costs 4 bytes per repetition.
+    """
+
+    def __init__(self):
+        self._ids: Dict[bytes, int] = {}
+        self._texts: List[str] = []
+        self._lock = threading.Lock()
+        self.references = 0
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def intern(self, text: str) -> int:
+        """Return the id of a snippet, adding it to the store if it is new"""
+        digest = snippet_digest(text)
+        with self._lock:
+            self.references += 1
+            snippet_id = self._ids.get(digest)
+            if snippet_id is None:
+                snippet_id = self._ids[digest] = len(self._texts)
+                self._texts.append(text)
+            return snippet_id
+
+    def get(self, snippet_id: int) -> str:
+        """Return the text of a snippet id"""
+        return self._texts[snippet_id]
+
+    def lookup(self, text: str) -> Optional[int]:
+        """Return the id of a snippet without adding it, or None if it is not stored"""
+        return self._ids.get(snippet_digest(text))
+
+    def key(self, snippet_id: int) -> str:
+        """Return the hex content address of a snippet id, stable across stores and processes"""
+        return snippet_digest(self._texts[snippet_id]).hex()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of distinct snippets, references to them and the text they hold"""
+        return {
+            'unique_snippets': len(self._texts),
+            'references': self.references,
+            'deduplication_factor': self.references / len(self._texts) if self._texts else 0.0,
+            'stored_characters': sum(len(text) for text in self._texts)
+        }
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # The digest map is rebuilt on load, keeping cache files small
+        return {'texts': self._texts, 'references': self.references}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self._texts = state['texts']
+        self._ids = {snippet_digest(text): snippet_id for snippet_id, text in enumerate(self._texts)}
+        self._lock = threading.Lock()
+        self.references = state['references']
+
+
+def _check_snippet(text: Any) -> str:
+    if not isinstance(text, str):
+        raise TypeError(f"snippets must be str, not {type(text).__name__}")
+    return text
+
+
+class SnippetList(Sequence):
+    """
+    Read-mostly list of snippet texts backed by an array of ids into a SnippetStore.
+
+    Behaves like the plain list of strings it replaces in citation records
+    (indexing, iteration, len, truthiness, equality with lists) and supports
+    extend/append for the loaders that merge contents.
+    """
+
+    __slots__ = ('store', 'ids')
+
+    def __init__(self, store: SnippetStore, texts: Iterable[str] = ()):
+        self.store = store
+        self.ids = array('I')
+        self.extend(texts)
+
+    def extend(self, texts: Iterable[str]) -> None:
+        """
+        Append snippets, reusing the ids directly when they come from the same store.
+
+        Raises:
+            TypeError: If any item is not a str; nothing is appended in that case
+        """
+        if isinstance(texts, SnippetList) and texts.store is self.store:
+            self.ids.extend(texts.ids)
+            return
+        texts = list(texts)
+        for text in texts:
+            _check_snippet(text)
+        intern = self.store.intern
+        self.ids.extend(intern(text) for text in texts)
+
+    def append(self, text: str) -> None:
+        """
+        Append one snippet.
+
+        Raises:
+            TypeError: If text is not a str
+        """
+        self.ids.append(self.store.intern(_check_snippet(text)))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return [self.store.get(snippet_id) for snippet_id in self.ids[index]]
+        return self.store.get(self.ids[index])
+
+    def __iter__(self) -> Iterator[str]:
+        get = self.store.get
+        for snippet_id in self.ids:
+            yield get(snippet_id)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, SnippetList) and other.store is self.store:
+            return self.ids == other.ids
+        if isinstance(other, (SnippetList, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"SnippetList({list(self)!r})"
+
+    def __reduce__(self):
+        # Pickle as (store, ids) so the store is written once per pickled dataset
+        return (_rebuild_snippet_list, (self.store, self.ids))
+
+
+def _rebuild_snippet_list(store: SnippetStore, ids: array) -> SnippetList:
+    snippets = SnippetList(store)
+    snippets.ids = ids
+    return snippets
@@ -0,0 +1,763 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from analytics import SearchAnalytics, extract_domain_from_url
+from cache import get_file_fingerprint
+
+# Multiplier placing the prompt id above the prompt_queries id in combined ordering keys
+ORDER_KEY_STRIDE = 1 << 32
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    sha256 TEXT NOT NULL,
+    ingested_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prompts (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS queries (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS domains (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    prompt_id INTEGER NOT NULL REFERENCES prompts (id),
+    source_id INTEGER REFERENCES sources (id),
+    model TEXT NOT NULL,
+    run_number INTEGER,
+    success INTEGER NOT NULL,
+    ingested_at REAL NOT NULL,
+    record_id INTEGER,
+    run_at REAL
+);
+CREATE TABLE IF NOT EXISTS prompt_queries (
+    id INTEGER PRIMARY KEY,
+    prompt_id INTEGER NOT NULL REFERENCES prompts (id),
+    query_id INTEGER NOT NULL REFERENCES queries (id),
+    UNIQUE (prompt_id, query_id)
+);
+CREATE TABLE IF NOT EXISTS appearances (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    query_id INTEGER NOT NULL REFERENCES queries (id),
+    domain_id INTEGER NOT NULL REFERENCES domains (id),
+    UNIQUE (run_id, query_id, domain_id)
+);
+CREATE TABLE IF NOT EXISTS citations (
+    appearance_id INTEGER NOT NULL REFERENCES appearances (id) ON DELETE CASCADE,
+    rank INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS latest_appearances (
+    source_key INTEGER NOT NULL,
+    prompt_id INTEGER NOT NULL,
+    query_id INTEGER NOT NULL,
+    domain_id INTEGER NOT NULL,
+    record_id INTEGER NOT NULL,
+    PRIMARY KEY (source_key, prompt_id, query_id, domain_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_runs_prompt ON runs (prompt_id);
+CREATE INDEX IF NOT EXISTS idx_runs_model ON runs (model);
+CREATE INDEX IF NOT EXISTS idx_runs_ingested_at ON runs (ingested_at);
+CREATE INDEX IF NOT EXISTS idx_runs_source ON runs (source_id);
+CREATE INDEX IF NOT EXISTS idx_runs_record ON runs (record_id);
+CREATE INDEX IF NOT EXISTS idx_runs_run_at ON runs (run_at);
+CREATE INDEX IF NOT EXISTS idx_appearances_domain ON appearances (domain_id, query_id);
+CREATE INDEX IF NOT EXISTS idx_appearances_query ON appearances (query_id);
+CREATE INDEX IF NOT EXISTS idx_citations_appearance ON citations (appearance_id);
+CREATE INDEX IF NOT EXISTS idx_latest_domain ON latest_appearances (domain_id);
+"""
+# PRAGMA user_version of the schema above; 2 added runs.record_id, 3 runs.run_at and latest_appearances
+SCHEMA_VERSION = 3
+
+# Rebuilds latest_appearances from the stored runs (source_key 0 stands for runs without a source file)
+REBUILD_LATEST_APPEARANCES = """
+    INSERT OR REPLACE INTO latest_appearances (source_key, prompt_id, query_id, domain_id, record_id)
+    SELECT COALESCE(r.source_id, 0), r.prompt_id, a.query_id, a.domain_id, MAX(r.record_id)
+    FROM appearances a
+    JOIN runs r ON r.id = a.run_id
+    WHERE r.success = 1
+    GROUP BY 1, 2, 3, 4
+"""
+
+
+class SQLiteAnalyticsStore:
+    """
+    Experiment results loaded into an indexed SQLite database.
+
+    Runs are stored individually with their model, source file, run time and
+    the experiment record they belong to, so every analysis can be restricted
+    to a subset of runs. The selected runs are merged with the
+    loaders' rules: within a source, the latest experiment record that
+    retrieved a domain for a prompt/query pair replaces earlier ones (as
+    load_and_process_experiment_results does for re-run prompts), and its
+    citation ranks are the distinct ranks across that record's runs; across
+    sources a domain counts if any source retrieved it, with the union of
+    their ranks, as in load_multiple_experiment_files. Runs ingested without
+    a source file form one stream of their own.
+
+    The latest record of every (source, prompt, query, domain) is kept in
+    latest_appearances as records are ingested, so analyses that select runs
+    by source file only read it instead of ranking every appearance; model and
+    time filters can change which record is latest and rank the selected runs
+    instead.
+
+    The analyses mirror their SearchAnalytics counterparts but are computed by
+    SQL, so the dataset does not have to fit in memory.
+    """
+
+    def __init__(self, db_path: str = ":memory:"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        if db_path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode = WAL")
+        rebuild_latest = self._migrate()
+        self._connection.executescript(SCHEMA)
+        if rebuild_latest:
+            self._connection.execute(REBUILD_LATEST_APPEARANCES)
+        self._connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._connection.commit()
+
+    def _migrate(self) -> bool:
+        """
+        Bring a database written by an older version up to SCHEMA_VERSION.
+
+        Returns:
+            True if latest_appearances has to be rebuilt from the existing runs
+        """
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(runs)")]
+        if not columns:
+            return False
+        if 'record_id' not in columns:
+            # Older runs cannot be assigned to their experiment records; mark their
+            # sources as changed so ingest_file reloads them
+            self._connection.execute("ALTER TABLE runs ADD COLUMN record_id INTEGER")
+            self._connection.execute("UPDATE sources SET sha256 = ''")
+        if 'run_at' not in columns:
+            # Files ingested before run times were stored are reloaded to pick up
+            # their runs' timestamps; until then their ingestion time stands in
+            self._connection.execute("ALTER TABLE runs ADD COLUMN run_at REAL")
+            self._connection.execute("UPDATE runs SET run_at = ingested_at")
+            self._connection.execute("UPDATE sources SET sha256 = ''")
+        return not self._connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'latest_appearances'"
+        ).fetchone()
+
+    def close(self) -> None:
+        """Close the database connection"""
+        with self._lock:
+            self._connection.close()
+
+    def _intern(self, table: str, column: str, value: str, cache: Dict[str, int]) -> int:
+        """Return the id of value in a lookup table, inserting it if needed"""
+        row_id = cache.get(value)
+        if row_id is None:
+            self._connection.execute(f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", (value,))
+            row_id = self._connection.execute(f"SELECT id FROM {table} WHERE {column} = ?", (value,)).fetchone()[0]
+            cache[value] = row_id
+        return row_id
+
+    def ingest_records(self, records: Iterable[Dict[str, Any]], source_id: Optional[int] = None,
+                       ingested_at: Optional[float] = None) -> int:
+        """
+        Insert experiment records into the database in one transaction.
+
+        Args:
+            records: Experiment result entries as written by extract.py
+            source_id: Id of the source file the records came from, if any
+            ingested_at: Ingestion timestamp stored on every run (defaults to now),
+                and the run time of runs without a timestamp of their own
+
+        Returns:
+            Number of runs inserted
+        """
+        ingested_at = time.time() if ingested_at is None else ingested_at
+        with self._lock, self._write_transaction():
+            return self._insert_records(records, source_id, ingested_at, ingested_at)
+
+    @contextmanager
+    def _write_transaction(self) -> Iterator[None]:
+        """Run the block in a transaction holding SQLite's write lock from the start; caller holds self._lock"""
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._connection.rollback()
+            raise
+        self._connection.commit()
+
+    def _insert_records(self, records: Iterable[Dict[str, Any]], source_id: Optional[int], ingested_at: float,
+                        default_run_at: float) -> int:
+        """
+        Insert experiment records inside the caller's transaction and return the number of runs.
+
+        A run's time is its own 'timestamp' (as written by extract.py), else its
+        record's, else default_run_at.
+        """
+        prompt_ids: Dict[str, int] = {}
+        query_ids: Dict[str, int] = {}
+        domain_ids: Dict[str, int] = {}
+        run_count = 0
+        # Experiment records are numbered in ingestion order, so later ones win the loader's merge
+        record_id = self._connection.execute("SELECT COALESCE(MAX(record_id), 0) FROM runs").fetchone()[0]
+
+        for experiment in records:
+            record_id += 1
+            prompt_id = self._intern("prompts", "text", experiment.get('prompt', ''), prompt_ids)
+            record_run_at = parse_run_timestamp(experiment.get('timestamp'), default_run_at)
+
+            for model_name, model_runs in experiment.get('results', {}).items():
+                for run_result in model_runs:
+                    success = bool(run_result.get('success', False))
+                    run_id = self._connection.execute(
+                        "INSERT INTO runs (prompt_id, source_id, model, run_number, success, ingested_at, record_id, run_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (prompt_id, source_id, run_result.get('model', model_name),
+                         run_result.get('run_number'), int(success), ingested_at, record_id,
+                         parse_run_timestamp(run_result.get('timestamp'), record_run_at))
+                    ).lastrowid
+                    run_count += 1
+
+                    web_searches = run_result.get('web_searches')
+                    if not success or not isinstance(web_searches, dict):
+                        continue
+
+                    for query, domains in web_searches.items():
+                        if not isinstance(domains, dict):
+                            continue
+                        query_id = self._intern("queries", "text", query, query_ids)
+                        # Remember when each query was first used for a prompt, to report in loader order
+                        self._connection.execute(
+                            "INSERT OR IGNORE INTO prompt_queries (prompt_id, query_id) VALUES (?, ?)",
+                            (prompt_id, query_id)
+                        )
+
+                        for domain_url, citations_data in domains.items():
+                            domain_id = self._intern("domains", "name", extract_domain_from_url(domain_url), domain_ids)
+                            if isinstance(citations_data, dict):
+                                citations = citations_data.get('citations', [])
+                            else:
+                                citations = citations_data
+                            if not isinstance(citations, list):
+                                citations = []
+
+                            # URLs of the same domain collapse into one appearance per run
+                            self._connection.execute(
+                                "INSERT OR IGNORE INTO appearances (run_id, query_id, domain_id) VALUES (?, ?, ?)",
+                                (run_id, query_id, domain_id)
+                            )
+                            appearance_id = self._connection.execute(
+                                "SELECT id FROM appearances WHERE run_id = ? AND query_id = ? AND domain_id = ?",
+                                (run_id, query_id, domain_id)
+                            ).fetchone()[0]
+                            self._connection.executemany(
+                                "INSERT INTO citations (appearance_id, rank) VALUES (?, ?)",
+                                [(appearance_id, rank) for rank in citations]
+                            )
+                            self._connection.execute(
+                                "INSERT INTO latest_appearances (source_key, prompt_id, query_id, domain_id, record_id) "
+                                "VALUES (?, ?, ?, ?, ?) "
+                                "ON CONFLICT (source_key, prompt_id, query_id, domain_id) "
+                                "DO UPDATE SET record_id = MAX(record_id, excluded.record_id)",
+                                (source_id or 0, prompt_id, query_id, domain_id, record_id)
+                            )
+
+        return run_count
+
+    def ingest_file(self, file_path: str, ingested_at: Optional[float] = None) -> int:
+        """
+        Load an experiment results file, replacing any earlier version of it.
+
+        Unchanged files (same content hash) are skipped.
+
+        Args:
+            file_path: Path to a JSON file generated by extract.py
+            ingested_at: Ingestion timestamp stored on every run (defaults to now);
+                runs without a timestamp of their own take the file's modification time
+
+        Returns:
+            Number of runs inserted
+        """
+        try:
+            fingerprint = get_file_fingerprint(file_path)
+            if self._source_hash(fingerprint['path']) == fingerprint['sha256']:
+                return 0
+
+            with open(file_path, 'r') as f:
+                data = json.load(f)
+            if not isinstance(data, list):
+                data = [data]
+            modified_at = os.path.getmtime(file_path)
+        except Exception as e:
+            print(f"Error loading experiment results from {file_path}: {e}")
+            return 0
+
+        ingested_at = time.time() if ingested_at is None else ingested_at
+        # The check and the replacement share one write transaction, so concurrent
+        # ingests of the same file (from any process) load it once
+        with self._lock, self._write_transaction():
+            row = self._connection.execute(
+                "SELECT id, sha256 FROM sources WHERE path = ?", (fingerprint['path'],)
+            ).fetchone()
+            if row is not None and row[1] == fingerprint['sha256']:
+                return 0
+
+            if row is not None:
+                # The file changed; drop the runs of its previous version
+                self._connection.execute("DELETE FROM runs WHERE source_id = ?", (row[0],))
+                self._connection.execute("DELETE FROM latest_appearances WHERE source_key = ?", (row[0],))
+                self._connection.execute(
+                    "UPDATE sources SET sha256 = ?, ingested_at = ? WHERE id = ?",
+                    (fingerprint['sha256'], ingested_at, row[0])
+                )
+                source_id = row[0]
+            else:
+                source_id = self._connection.execute(
+                    "INSERT INTO sources (path, sha256, ingested_at) VALUES (?, ?, ?)",
+                    (fingerprint['path'], fingerprint['sha256'], ingested_at)
+                ).lastrowid
+
+            return self._insert_records(data, source_id, ingested_at, modified_at)
+
+    def _source_hash(self, path: str) -> Optional[str]:
+        """Content hash the file at path was last ingested with, if any"""
+        with self._lock:
+            row = self._connection.execute("SELECT sha256 FROM sources WHERE path = ?", (path,)).fetchone()
+        return row[0] if row is not None else None
+
+    @staticmethod
+    def _run_filter(models: Optional[Sequence[str]] = None, since: Optional[float] = None,
+                    until: Optional[float] = None, source_files: Optional[Sequence[str]] = None) -> Tuple[str, List[Any]]:
+        """Build the WHERE clause (over the runs alias r) selecting the runs to analyze"""
+        clauses = ["r.success = 1"]
+        params: List[Any] = []
+        if models:
+            clauses.append(f"r.model IN ({', '.join('?' * len(models))})")
+            params.extend(models)
+        if since is not None:
+            clauses.append("r.run_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("r.run_at < ?")
+            params.append(until)
+        if source_files:
+            paths = [os.path.abspath(path) for path in source_files]
+            clauses.append(f"r.source_id IN (SELECT id FROM sources WHERE path IN ({', '.join('?' * len(paths))}))")
+            params.extend(paths)
+        return " AND ".join(clauses), params
+
+    def _query(self, sql: str, params: Sequence[Any]) -> List[Tuple]:
+        with self._lock:
+            return self._connection.execute(sql, params).fetchall()
+
+    def _pairs_cte(self, filters: Dict[str, Any], domain: Optional[str] = None) -> Tuple[str, List[Any]]:
+        """
+        SQL and parameters for the selected (prompt, query, domain) triples and
+        their distinct citation ranks, merged with the loaders' rules: per
+        source, only the appearances of the latest experiment record that
+        retrieved the domain for the prompt/query pair count. order_key sorts
+        pairs prompt by prompt, then by first use of the query within the
+        prompt, which is the order of the dict loader.
+
+        Args:
+            filters: Run selection (models, since, until, source_files)
+            domain: Only select appearances of this domain
+        """
+        if filters.get('models') or filters.get('since') is not None or filters.get('until') is not None:
+            # The latest record among the selected runs may be older than the
+            # stored one, so rank the selected appearances instead
+            where, params = self._run_filter(**filters)
+            if domain is not None:
+                where += " AND a.domain_id = (SELECT id FROM domains WHERE name = ?)"
+                params.append(domain)
+            merged = f"""
+            selected AS (
+                SELECT a.id AS appearance_id, r.prompt_id, a.query_id, a.domain_id, r.record_id,
+                       MAX(r.record_id) OVER (PARTITION BY r.source_id, r.prompt_id, a.query_id, a.domain_id) AS latest_record_id
+                FROM appearances a
+                JOIN runs r ON r.id = a.run_id
+                WHERE {where}
+            ),
+            merged AS (
+                SELECT appearance_id, prompt_id, query_id, domain_id
+                FROM selected
+                WHERE record_id = latest_record_id
+            ),"""
+        else:
+            clauses = ["r.success = 1"]
+            params = []
+            if filters.get('source_files'):
+                paths = [os.path.abspath(path) for path in filters['source_files']]
+                clauses.append(f"l.source_key IN (SELECT id FROM sources WHERE path IN ({', '.join('?' * len(paths))}))")
+                params.extend(paths)
+            if domain is not None:
+                clauses.append("l.domain_id = (SELECT id FROM domains WHERE name = ?)")
+                params.append(domain)
+            merged = f"""
+            merged AS (
+                SELECT a.id AS appearance_id, l.prompt_id, l.query_id, l.domain_id
+                FROM latest_appearances l
+                JOIN runs r ON r.record_id = l.record_id AND r.prompt_id = l.prompt_id
+                JOIN appearances a ON a.run_id = r.id AND a.query_id = l.query_id AND a.domain_id = l.domain_id
+                WHERE {" AND ".join(clauses)}
+            ),"""
+        return "\n            WITH" + merged + f"""
+            triples AS (
+                SELECT m.prompt_id, m.query_id, m.domain_id, m.prompt_id * {ORDER_KEY_STRIDE} + pq.id AS order_key
+                FROM merged m
+                JOIN prompt_queries pq ON pq.prompt_id = m.prompt_id AND pq.query_id = m.query_id
+                GROUP BY m.prompt_id, m.query_id, m.domain_id
+            ),
+            ranks AS (
+                SELECT DISTINCT m.prompt_id, m.query_id, m.domain_id, c.rank
+                FROM citations c
+                JOIN merged m ON m.appearance_id = c.appearance_id
+            )
+        """, params
+
+    def count_queries(self, **filters) -> int:
+        """Count the selected prompt/query pairs"""
+        where, params = self._run_filter(**filters)
+        return self._query(
+            f"SELECT COUNT(*) FROM (SELECT DISTINCT r.prompt_id, a.query_id "
+            f"FROM appearances a JOIN runs r ON r.id = a.run_id WHERE {where})",
+            params
+        )[0][0]
+
+    def calculate_domain_stats(self, domain_of_interest: str, **filters) -> Dict[str, Any]:
+        """
+        Calculate statistics for a specific domain of interest
+
+        Args:
+            domain_of_interest: Domain to analyze
+            **filters: Run selection (models, since, until, source_files)
+        """
+        cte, cte_params = self._pairs_cte(filters, domain_of_interest)
+
+        pairs = self._query(
+            cte + """
+            SELECT p.text, q.text, t.prompt_id, t.query_id
+            FROM triples t JOIN prompts p ON p.id = t.prompt_id JOIN queries q ON q.id = t.query_id
+            ORDER BY t.order_key
+            """,
+            cte_params
+        )
+        ranks = self._query(
+            cte + """
+            SELECT k.prompt_id, k.query_id, k.rank
+            FROM ranks k JOIN triples t USING (prompt_id, query_id, domain_id)
+            ORDER BY t.order_key, k.rank
+            """,
+            cte_params
+        )
+
+        total_queries = self.count_queries(**filters)
+        citation_positions = [rank for _, _, rank in ranks]
+        cited_pairs = {(prompt_id, query_id) for prompt_id, query_id, _ in ranks}
+        prompt_appearances = list(dict.fromkeys(prompt for prompt, _, _, _ in pairs))
+
+        return {
+            'total_appearances': len(pairs),
+            'total_citations': len(citation_positions),
+            'retrieval_rate': len(pairs) / total_queries if total_queries > 0 else 0,
+            'usage_rate': len(cited_pairs) / len(pairs) if pairs else 0,
+            'avg_citation_rank': sum(citation_positions) / len(citation_positions) if citation_positions else None,
+            'min_citation_rank': min(citation_positions) if citation_positions else None,
+            'prompt_appearances': prompt_appearances,
+            'query_appearances': [query for _, query, _, _ in pairs],
+            'citation_positions': citation_positions
+        }
+
+    def analyze_queries_with_target_domain(self, domain_of_interest: str, **filters) -> Dict[str, Any]:
+        """
+        Analyze each query to show target domain retrieval status, total sources, and prompt counts
+
+        Args:
+            domain_of_interest: Domain to analyze
+            **filters: Run selection (models, since, until, source_files)
+        """
+        cte, params = self._pairs_cte(filters)
+
+        # One row per query: prompts in first-use order, source counts and distinct domains
+        query_rows = self._query(
+            cte + """
+            SELECT q.text, t.query_id, COUNT(*) AS total_sources, MIN(t.order_key) AS order_key
+            FROM triples t JOIN queries q ON q.id = t.query_id
+            GROUP BY t.query_id
+            ORDER BY order_key
+            """,
+            params
+        )
+        prompt_rows = self._query(
+            cte + """
+            SELECT t.query_id, p.text, MIN(t.order_key) AS order_key
+            FROM triples t JOIN prompts p ON p.id = t.prompt_id
+            GROUP BY t.query_id, t.prompt_id
+            ORDER BY order_key
+            """,
+            params
+        )
+        domain_rows = self._query(
+            cte + """
+            SELECT DISTINCT t.query_id, d.name
+            FROM triples t JOIN domains d ON d.id = t.domain_id
+            """,
+            params
+        )
+
+        target_cte, target_params = self._pairs_cte(filters, domain_of_interest)
+        retrieved = {row[0] for row in self._query(target_cte + "SELECT DISTINCT query_id FROM triples", target_params)}
+        target_citations: Dict[int, List[int]] = {}
+        for query_id, rank in self._query(
+            target_cte + """
+            SELECT k.query_id, k.rank
+            FROM ranks k JOIN triples t USING (prompt_id, query_id, domain_id)
+            ORDER BY t.order_key, k.rank
+            """,
+            target_params
+        ):
+            target_citations.setdefault(query_id, []).append(rank)
+
+        prompts_by_query: Dict[int, List[str]] = {}
+        for query_id, prompt, _ in prompt_rows:
+            prompts_by_query.setdefault(query_id, []).append(prompt)
+        domains_by_query: Dict[int, List[str]] = {}
+        for query_id, domain in domain_rows:
+            domains_by_query.setdefault(query_id, []).append(domain)
+
+        query_analysis = {}
+        for query, query_id, total_sources, _ in query_rows:
+            prompts = prompts_by_query.get(query_id, [])
+            citations = target_citations.get(query_id, [])
+            stats = {
+                'target_domain_retrieved': query_id in retrieved,
+                'target_domain_cited': bool(citations),
+                'total_sources': total_sources,
+                'prompts_using_query': prompts,
+                'all_domains': domains_by_query.get(query_id, []),
+                'target_domain_citations': citations,
+                'prompt_count': len(prompts),
+                'unique_prompts': len(prompts),
+                'total_unique_sources': len(domains_by_query.get(query_id, [])),
+                'avg_sources_per_prompt': total_sources / len(prompts)
+            }
+
+            # Target domain citation statistics
+            if citations:
+                stats['best_citation_rank'] = min(citations)
+                stats['avg_citation_rank'] = sum(citations) / len(citations)
+                stats['total_citations'] = len(citations)
+            else:
+                stats['best_citation_rank'] = None
+                stats['avg_citation_rank'] = None
+                stats['total_citations'] = 0
+
+            query_analysis[query] = stats
+
+        return query_analysis
+
+    def analyze_intersecting_queries(self, **filters) -> Dict[str, Any]:
+        """
+        Analyze queries that appear across multiple prompts
+
+        Args:
+            **filters: Run selection (models, since, until, source_files)
+        """
+        cte, params = self._pairs_cte(filters)
+        cte += """,
+            intersecting AS (
+                SELECT query_id, MIN(order_key) AS order_key
+                FROM triples
+                GROUP BY query_id
+                HAVING COUNT(DISTINCT prompt_id) > 1
+            )
+        """
+
+        prompt_rows = self._query(
+            cte + """
+            SELECT q.text, p.text, i.order_key
+            FROM intersecting i
+            JOIN queries q ON q.id = i.query_id
+            JOIN (SELECT DISTINCT query_id, prompt_id FROM triples) qp ON qp.query_id = i.query_id
+            JOIN prompts p ON p.id = qp.prompt_id
+            ORDER BY i.order_key
+            """,
+            params
+        )
+        rank_rows = self._query(
+            cte + """
+            SELECT q.text, d.name, k.rank
+            FROM intersecting i
+            JOIN ranks k ON k.query_id = i.query_id
+            JOIN queries q ON q.id = i.query_id
+            JOIN domains d ON d.id = k.domain_id
+            """,
+            params
+        )
+
+        domain_ranks: Dict[str, Dict[str, set]] = {}
+        for query, domain, rank in rank_rows:
+            domain_ranks.setdefault(query, {}).setdefault(domain, set()).add(rank)
+
+        intersecting_analysis = {}
+        for query, prompt, _ in prompt_rows:
+            entry = intersecting_analysis.get(query)
+            if entry is None:
+                domains = domain_ranks.get(query, {})
+                entry = intersecting_analysis[query] = {
+                    'frequency': 0,
+                    'unique_prompts': 0,
+                    'prompts': [],
+                    'total_domains': len(domains),
+                    'domains_with_citations': {domain: list(ranks) for domain, ranks in domains.items()}
+                }
+            entry['prompts'].append(prompt)
+            entry['frequency'] += 1
+            entry['unique_prompts'] += 1
+
+        return intersecting_analysis
+
+    def top_competitors(self, target_domain: str, limit: int = 5, **filters) -> List[Dict[str, Any]]:
+        """
+        Rank the other domains by the number of prompt/query pairs they were retrieved for
+
+        Args:
+            target_domain: Domain whose competitors to rank
+            limit: Number of competitors to return
+            **filters: Run selection (models, since, until, source_files)
+
+        Returns:
+            List of {"domain": ..., "frequency": ...}, most frequent first
+        """
+        cte, params = self._pairs_cte(filters)
+        rows = self._query(
+            cte + """
+            SELECT d.name, COUNT(*) AS frequency, MIN(t.order_key) AS order_key
+            FROM triples t JOIN domains d ON d.id = t.domain_id
+            WHERE d.name != ?
+            GROUP BY t.domain_id
+            ORDER BY frequency DESC, order_key
+            LIMIT ?
+            """,
+            params + [target_domain, limit]
+        )
+        return [{"domain": domain, "frequency": frequency} for domain, frequency, _ in rows]
+
+    def list_models(self) -> List[str]:
+        """Return the models that have runs in the database"""
+        return [row[0] for row in self._query("SELECT DISTINCT model FROM runs ORDER BY model", ())]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return row counts of the main tables"""
+        counts = {}
+        for table in ("sources", "prompts", "queries", "domains", "runs", "appearances", "citations"):
+            counts[table] = self._query(f"SELECT COUNT(*) FROM {table}", ())[0][0]
+        return counts
+
+
+class SQLiteBackedAnalytics(SearchAnalytics):
+    """
+    SearchAnalytics whose domain, query and intersecting-query analyses are
+    computed by a SQLiteAnalyticsStore over the given experiment files; the
+    remaining report sections use the in-memory data as usual.
+    """
+
+    def __init__(self, data: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]],
+                 response_chunks: Optional[Dict[str, Dict[str, List[str]]]],
+                 store: SQLiteAnalyticsStore, experiment_files: Sequence[str]):
+        super().__init__(data, response_chunks)
+        self.store = store
+        self.source_files = list(experiment_files)
+        for file_path in self.source_files:
+            store.ingest_file(file_path)
+
+    def calculate_domain_stats(self, domain_of_interest: str) -> Dict[str, Any]:
+        """
+        Calculate statistics for a specific domain of interest
+        """
+        return self.store.calculate_domain_stats(domain_of_interest, source_files=self.source_files)
+
+    def analyze_queries_with_target_domain(self, domain_of_interest: str) -> Dict[str, Any]:
+        """
+        Analyze each query to show target domain retrieval status, total sources, and prompt counts
+        """
+        return self.store.analyze_queries_with_target_domain(domain_of_interest, source_files=self.source_files)
+
+    def analyze_intersecting_queries(self) -> Dict[str, Any]:
+        """
+        Analyze queries that appear across multiple prompts
+        """
+        return self.store.analyze_intersecting_queries(source_files=self.source_files)
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[float]:
+    """Parse an ISO date/datetime or a Unix timestamp given on the command line"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def parse_run_timestamp(value: Any, default: float) -> float:
+    """Unix time of a run or record 'timestamp' field (number or ISO string), or default if missing or invalid"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return parse_timestamp(value)
+        except ValueError:
+            pass
+    return default
+
+
+def main():
+    """
+    Ingest experiment files into a SQLite database and print a domain analysis
+    """
+    parser = argparse.ArgumentParser(description="Load experiment results into SQLite and analyze a domain")
+    parser.add_argument("files", nargs="*", help="Experiment result files to ingest")
+    parser.add_argument("--db", default=os.getenv('ANALYTICS_DB_PATH', 'search_analytics.sqlite3'), help="Database path")
+    parser.add_argument("--domain", help="Domain to analyze")
+    parser.add_argument("--model", action="append", dest="models", help="Only use runs of this model (repeatable)")
+    parser.add_argument("--since", help="Only use runs made at or after this date (ISO or Unix time)")
+    parser.add_argument("--until", help="Only use runs made before this date (ISO or Unix time)")
+    args = parser.parse_args()
+
+    store = SQLiteAnalyticsStore(args.db)
+    for file_path in args.files:
+        print(f"Ingested {store.ingest_file(file_path)} runs from {file_path}")
+    print(f"Database: {store.stats()}")
+
+    if args.domain:
+        filters = {'models': args.models, 'since': parse_timestamp(args.since), 'until': parse_timestamp(args.until)}
+        stats = store.calculate_domain_stats(args.domain, **filters)
+        print(f"\n=== DOMAIN ANALYSIS: {args.domain} ===")
+        print(f"Total Appearances: {stats['total_appearances']}")
+        print(f"Retrieval Rate: {stats['retrieval_rate']:.2%}")
+        print(f"Usage Rate: {stats['usage_rate']:.2%}")
+        avg_rank_str = f"{stats['avg_citation_rank']:.2f}" if stats['avg_citation_rank'] is not None else "No citations"
+        print(f"Average Citation Rank: {avg_rank_str}")
+        print(f"Best Citation Rank: {stats['min_citation_rank']}")
+        print(f"Top competitors: {store.top_competitors(args.domain, **filters)}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_slots_are_handed_out_in_fifo_order():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=2, max_queue=4)
+        order = []
+        running = 0
+        peak = 0
+
+        async def analysis(name):
+            nonlocal running, peak
+            async with controller.admit():
+                running += 1
+                peak = max(peak, running)
+                order.append(name)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(analysis(name) for name in range(6)))
+        return controller, order, peak
+
+    controller, order, peak = run(scenario())
+    assert peak == 2
+    assert order == list(range(6))
+    stats = controller.stats()
+    assert (stats['active'], stats['queue_depth'], stats['admitted_total']) == (0, 0, 6)
+    assert stats['max_queue_depth_seen'] == 4
+    assert stats['avg_service_seconds'] is not None
+
+
+def test_full_queue_is_rejected_immediately():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=1)
+        await controller.acquire()
+        queued = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+
+        assert controller.is_saturated()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        with pytest.raises(AdmissionRejected):
+            controller.reject_if_saturated()
+
+        controller.release()
+        await queued
+        controller.release()
+        return controller, rejected.value
+
+    controller, rejection = run(scenario())
+    assert rejection.retry_after >= 1
+    assert controller.rejected_total == 2
+    assert controller.active == 0
+
+
+def test_queue_timeout_frees_the_queue_position():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=2, queue_timeout_seconds=0.01)
+        await controller.acquire()
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire()
+        assert controller.queue_depth == 0
+        controller.release()
+        return controller
+
+    controller = run(scenario())
+    assert controller.timed_out_total == 1
+    assert controller.active == 0
+
+
+def test_cancelled_waiter_passes_its_slot_on():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=2)
+        await controller.acquire()
+        first = asyncio.ensure_future(controller.acquire(timeout=None))
+        second = asyncio.ensure_future(controller.acquire(timeout=None))
+        await asyncio.sleep(0)
+
+        # The slot is handed to the first waiter, which is cancelled before it runs
+        controller.release()
+        first.cancel()
+        await asyncio.sleep(0)
+        await second
+        assert first.cancelled()
+        assert controller.active == 1
+        controller.release()
+        return controller
+
+    controller = run(scenario())
+    assert controller.active == 0
+    assert controller.queue_depth == 0
+
+
+def test_reservations_count_before_anyone_waits():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=1)
+        running = controller.reserve()
+        queued = controller.reserve()
+        assert (controller.active, controller.queue_depth) == (1, 1)
+        with pytest.raises(AdmissionRejected):
+            controller.reserve()
+
+        # A reservation given up before waiting frees its queue position
+        controller.cancel(queued)
+        assert controller.queue_depth == 0
+        queued = controller.reserve()
+
+        assert await controller.wait(running) == 0.0
+        controller.release()
+        assert await controller.wait(queued, timeout=None) >= 0.0
+        controller.release()
+        return controller
+
+    controller = run(scenario())
+    assert (controller.active, controller.queue_depth) == (0, 0)
+    assert (controller.admitted_total, controller.rejected_total) == (2, 1)
+
+
+def test_jobs_reserve_their_slot_before_returning_and_release_it_when_done(monkeypatch):
+    import api
+
+    controller = AdmissionController(max_concurrent=1, max_queue=1)
+    monkeypatch.setattr(api, "admission_controller", controller)
+    finish = threading.Event()
+
+    async def blocked_analysis(request, progress):
+        await api.run_blocking(finish.wait, 5)
+        return {"data": {}, "metadata": {}}
+
+    monkeypatch.setattr(api, "run_analysis", blocked_analysis)
+    with TestClient(api.app) as client:
+        request = {"target_domain": "berlin.de"}
+        job_ids = [client.post("/jobs", json=request).json()["job_id"] for _ in range(2)]
+        # One job holds the slot and one the queue position, whether or not they have started
+        rejected = client.post("/jobs", json=request)
+        assert rejected.status_code == 429
+        assert int(rejected.headers["retry-after"]) >= 1
+
+        finish.set()
+        for job_id in job_ids:
+            for _ in range(200):
+                if client.get(f"/jobs/{job_id}").json()["status"] == "completed":
+                    break
+                time.sleep(0.01)
+            assert client.get(f"/jobs/{job_id}").json()["status"] == "completed"
+
+        assert (controller.active, controller.queue_depth) == (0, 0)
+        assert client.post("/jobs", json=request).status_code == 202
+
+
+def test_api_answers_429_with_retry_after_when_saturated(monkeypatch):
+    import api
+
+    monkeypatch.setattr(api, "admission_controller", AdmissionController(max_concurrent=0, max_queue=0))
+    with TestClient(api.app) as client:
+        for response in (
+            client.post("/analyze", json={"target_domain": "berlin.de"}),
+            client.post("/jobs", json={"target_domain": "berlin.de"}),
+        ):
+            assert response.status_code == 429
+            assert int(response.headers["retry-after"]) >= 1
@@ -0,0 +1,187 @@
+import json
+import os
+import shutil
+import threading
+
+from fastapi.testclient import TestClient
+
+from analytics import REPORT_SECTION_ORDER, SearchAnalytics, load_and_process_experiment_results
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gemini_experiment_results.json")
+
+
+def test_analyze_runs_aggregation_on_the_analysis_executor(monkeypatch):
+    import api
+
+    threads = []
+    calculate_domain_stats = SearchAnalytics.calculate_domain_stats
+
+    def recording_domain_stats(self, *args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return calculate_domain_stats(self, *args, **kwargs)
+
+    monkeypatch.setattr(SearchAnalytics, "calculate_domain_stats", recording_domain_stats)
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+
+    with TestClient(api.app) as client:
+        response = client.post("/analyze", json={"target_domain": "berlin.de"})
+        assert response.status_code == 200
+        data = response.json()["data"]
+        request_threads = list(threads)
+
+        analytics, _ = api.get_analytics([api.DEFAULT_EXPERIMENT_FILE])
+        assert data["domain_analysis"] == analytics.calculate_domain_stats("berlin.de")
+        assert data["intersecting_queries"] == analytics.analyze_intersecting_queries()
+        assert set(data["gemini_analysis"]["poor_performance_analysis"]) <= set(analytics.data)
+
+        assert client.post("/analyze", json={"target_domain": "berlin.de", "experiment_files": ["missing.json"]}).status_code == 400
+
+    assert request_threads and all(name.startswith("analysis") for name in request_threads)
+
+
+def stream_sections(client, request):
+    response = client.post("/analyze/stream", json=request)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_report_sections_match_the_comprehensive_report():
+    analytics = SearchAnalytics(*load_and_process_experiment_results(SAMPLE_FILE, use_cache=False))
+    sections = list(analytics.iter_report_sections("berlin.de", include_gemini=False))
+
+    assert sections[0][0] == "overview"
+    assert [name for name, _ in sections].index("domain_analysis") < [name for name, _ in sections].index("query_analysis")
+    report = analytics.generate_comprehensive_report("berlin.de", include_gemini=False)
+    assert report == dict(sections)
+    assert list(report) == [name for name in REPORT_SECTION_ORDER if name in report]
+
+
+def test_stream_sends_the_analyze_sections_line_by_line(monkeypatch):
+    import api
+
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    request = {"target_domain": "berlin.de"}
+    with TestClient(api.app) as client:
+        expected = client.post("/analyze", json=request).json()
+        lines = stream_sections(client, request)
+
+        assert lines[0]["section"] == "metadata"
+        assert lines[-1] == {"section": "done"}
+        names = [line["section"] for line in lines[1:-1]]
+        assert names.index("overview") < names.index("gemini_analysis") < names.index("recommendations")
+        assert {line["section"]: line["data"] for line in lines[1:-1]} == expected["data"]
+        assert lines[0]["data"] == expected["metadata"] | {"analytics_cache_hit": lines[0]["data"]["analytics_cache_hit"]}
+
+        missing = client.post("/analyze/stream", json={**request, "experiment_files": ["missing.json"]})
+        assert missing.status_code == 400
+
+        def fail():
+            raise RuntimeError("aggregation failed")
+
+        analytics, _ = api.get_analytics([api.DEFAULT_EXPERIMENT_FILE])
+        monkeypatch.setattr(analytics, "analyze_intersecting_queries", fail)
+        lines = stream_sections(client, request)
+        assert lines[0]["section"] == "metadata"
+        assert lines[-1] == {"section": "error", "error": "Internal server error during analysis: aggregation failed"}
+
+
+def test_only_the_requested_sections_are_computed(monkeypatch):
+    import api
+
+    def unexpected(*args, **kwargs):
+        raise AssertionError("section was not requested")
+
+    monkeypatch.setattr(SearchAnalytics, "analyze_intersecting_queries", unexpected)
+    monkeypatch.setattr(SearchAnalytics, "analyze_poor_performance_async", unexpected)
+    monkeypatch.setattr(SearchAnalytics, "calculate_prompt_stats", unexpected)
+
+    request = {
+        "target_domain": "berlin.de",
+        "sections": ["overview", "domain_analysis", "query_analysis"],
+        "fields": ["overview.total_prompts", "query_analysis.total_sources"],
+    }
+    with TestClient(api.app) as client:
+        response = client.post("/analyze", json=request)
+        assert response.status_code == 200
+        data = response.json()["data"]
+
+        analytics, _ = api.get_analytics([api.DEFAULT_EXPERIMENT_FILE])
+        assert list(data) == ["overview", "domain_analysis", "query_analysis"]
+        assert data["overview"] == {"total_prompts": analytics.calculate_overview()["total_prompts"]}
+        assert data["domain_analysis"] == analytics.calculate_domain_stats("berlin.de")
+        query_analysis = analytics.analyze_queries_with_target_domain("berlin.de")
+        assert data["query_analysis"] == {
+            query: {"total_sources": entry["total_sources"]} for query, entry in query_analysis.items()
+        }
+
+        lines = stream_sections(client, request)
+        assert [line["section"] for line in lines] == ["metadata", "overview", "domain_analysis", "query_analysis", "done"]
+
+
+def test_unknown_sections_and_fields_are_rejected():
+    import api
+
+    with TestClient(api.app) as client:
+        assert client.post("/analyze", json={"target_domain": "berlin.de", "sections": ["nope"]}).status_code == 422
+        assert client.post("/analyze", json={"target_domain": "berlin.de", "fields": ["overview"]}).status_code == 422
+        assert client.post("/analyze", json={"target_domain": "berlin.de", "fields": ["nope.total"]}).status_code == 422
+
+
+def gemini_returns(monkeypatch, analysis):
+    async def call_gemini_analysis_async(self, prompt, domain_of_interest, competitor_info):
+        return analysis
+
+    monkeypatch.setattr(SearchAnalytics, "call_gemini_analysis_async", call_gemini_analysis_async)
+
+
+def test_analysis_etag_revalidates_to_304_with_vary(tmp_path, monkeypatch):
+    import api
+
+    gemini_returns(monkeypatch, "Competitors answer the question directly.")
+    experiment_file = str(tmp_path / "experiment.json")
+    shutil.copy(SAMPLE_FILE, experiment_file)
+    request = {"target_domain": "berlin.de", "experiment_files": [experiment_file]}
+
+    with TestClient(api.app) as client:
+        response = client.post("/analyze", json=request)
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+        assert etag.startswith('W/"') and response.headers["cache-control"] == api.ANALYSIS_CACHE_CONTROL
+
+        revalidated = client.post("/analyze", json=request, headers={"If-None-Match": etag})
+        assert revalidated.status_code == 304 and revalidated.content == b""
+        assert revalidated.headers["etag"] == etag and revalidated.headers["vary"] == "Accept-Encoding"
+        assert client.get("/analyze", params=request, headers={"If-None-Match": etag}).status_code == 304
+
+        assert client.post("/analyze", json={**request, "worst_prompts": 1}, headers={"If-None-Match": etag}).status_code == 200
+        with open(experiment_file, "a") as f:
+            f.write("\n")
+        changed = client.post("/analyze", json=request, headers={"If-None-Match": etag})
+        assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+
+def test_reports_with_failed_gemini_calls_are_not_cacheable(monkeypatch):
+    import api
+
+    gemini_returns(monkeypatch, "ERROR: Gemini API call failed - quota exceeded")
+    with TestClient(api.app) as client:
+        response = client.post("/analyze", json={"target_domain": "berlin.de"})
+        assert response.status_code == 200
+        assert response.json()["data"]["gemini_analysis"]["total_poor_performance_cases"] > 0
+        assert "etag" not in response.headers and response.headers["cache-control"] == "no-store"
+
+        # Reports that skip the Gemini sections keep their ETag
+        without_gemini = client.post("/analyze", json={"target_domain": "berlin.de", "sections": ["overview"]})
+        assert "etag" in without_gemini.headers
+
+
+def test_experiment_files_304_keeps_vary():
+    import api
+
+    with TestClient(api.app) as client:
+        listing = client.get("/experiment-files")
+        revalidated = client.get("/experiment-files", headers={"If-None-Match": listing.headers["etag"]})
+
+    assert revalidated.status_code == 304
+    assert revalidated.headers["vary"] == listing.headers["vary"] == "Accept-Encoding"
@@ -0,0 +1,40 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+from analytics import REPORT_SECTION_ORDER, SearchAnalytics, load_and_process_experiment_results
+from batch_reports import DATASET_SECTIONS, DATASET_SECTIONS_FILE
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_FILE = os.path.join(REPO_DIR, "gemini_experiment_results.json")
+
+
+def test_cli_writes_two_domain_reports_from_a_process_pool(tmp_path):
+    experiment_file = str(tmp_path / "experiment.json")
+    shutil.copy(SAMPLE_FILE, experiment_file)
+    output_dir = tmp_path / "reports"
+
+    completed = subprocess.run(
+        [sys.executable, os.path.join(REPO_DIR, "batch_reports.py"), experiment_file,
+         "--domains", "berlin.de", "reddit.com", "--workers", "2", "--output-dir", str(output_dir)],
+        cwd=REPO_DIR, env={**os.environ, "GEMINI_API_KEY": ""}, capture_output=True, text=True, timeout=120
+    )
+    assert completed.returncode == 0, completed.stdout + completed.stderr
+
+    analytics = SearchAnalytics(*load_and_process_experiment_results(SAMPLE_FILE, use_cache=False))
+    dataset_sections = json.loads((output_dir / DATASET_SECTIONS_FILE).read_text())
+    assert dataset_sections == json.loads(json.dumps(dict(analytics.iter_report_sections(sections=DATASET_SECTIONS))))
+
+    for domain in ("berlin.de", "reddit.com"):
+        report = json.loads((output_dir / f"{domain}.json").read_text())
+        assert report["dataset_sections_file"] == DATASET_SECTIONS_FILE
+        assert not set(DATASET_SECTIONS) & set(report)
+        assert list(report)[1:] == [name for name in REPORT_SECTION_ORDER if name in report]
+        assert report["domain_analysis"] == json.loads(json.dumps(analytics.calculate_domain_stats(domain)))
+
+    summary = json.loads((output_dir / "summary.json").read_text())
+    assert summary["reports_written"] == 2 and summary["failures"] == [] and summary["workers"] == 2
+    assert summary["dataset_sections_file"] == str(output_dir / DATASET_SECTIONS_FILE)
+    assert {entry["domain"] for entry in summary["reports"]} == {"berlin.de", "reddit.com"}
@@ -0,0 +1,49 @@
+import json
+
+from analytics import SearchAnalytics, load_and_process_experiment_results, load_multiple_experiment_files
+from benchmarks.suite import analysis_benchmarks, compare_results, most_retrieved_domain, run_size
+from benchmarks.synthetic import generate_experiments, write_experiment_files
+
+
+def test_generated_logs_are_deterministic_and_sized_by_query_rows():
+    experiments = list(generate_experiments(23, queries_per_prompt=5, runs_per_model=2, seed=3))
+    assert experiments == list(generate_experiments(23, queries_per_prompt=5, runs_per_model=2, seed=3))
+    assert experiments != list(generate_experiments(23, queries_per_prompt=5, runs_per_model=2, seed=4))
+
+    assert len(experiments) == 5
+    assert sum(len(experiment["results"]["gemini-2.5-flash"][0]["web_searches"]) for experiment in experiments) == 23
+    for experiment in experiments:
+        for run in experiment["results"]["gemini-2.5-flash"]:
+            encoded = run["response"].encode("utf-8")
+            for start, end, source_ids in run["citation_index"]["segments"]:
+                assert encoded[start:end].decode("utf-8").endswith(".")
+                assert all(source_id < len(run["citation_index"]["sources"]) for source_id in source_ids)
+
+
+def test_sharded_files_hold_the_same_log(tmp_path):
+    single = str(tmp_path / "single.json")
+    shards = [str(tmp_path / f"part{i}.json") for i in range(3)]
+    assert write_experiment_files([single], 60, seed=1) == write_experiment_files(shards, 60, seed=1) == 12
+
+    data, _ = load_and_process_experiment_results(single, use_cache=False)
+    combined, _ = load_multiple_experiment_files(shards)
+    assert combined == data
+
+    domain = most_retrieved_domain(data)
+    for name, body in analysis_benchmarks(domain):
+        body(SearchAnalytics(*load_and_process_experiment_results(single, use_cache=False)))
+
+
+def test_suite_records_results_and_reports_regressions(tmp_path, capsys):
+    results = run_size(50, repeats=1, shards=2, workdir=str(tmp_path), options={"seed": 0},
+                       only=["load_experiment_file", "calculate_overview"])
+    assert [entry["name"] for entry in results] == ["load_experiment_file", "calculate_overview"]
+    assert all(entry["query_rows"] == 50 and entry["best_seconds"] > 0 and entry["peak_bytes"] > 0 for entry in results)
+    assert list(tmp_path.glob("*.json")) == []
+
+    baseline = tmp_path / "baseline.json"
+    slower = [dict(entry, best_seconds=entry["best_seconds"] / 2) for entry in results]
+    baseline.write_text(json.dumps({"results": slower}))
+    assert compare_results(results, str(baseline), threshold=0.5) == 2
+    assert compare_results(results, str(baseline), threshold=1.5) == 0
+    assert "REGRESSION load_experiment_file @ 50 rows" in capsys.readouterr().out
@@ -0,0 +1,220 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+import cache
+from analytics import load_and_process_experiment_results
+from cache import PersistentResultCache, TTLLRUCache, get_file_fingerprint, get_processed_cache_path, load_processed_dataset
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gemini_experiment_results.json")
+
+
+def copy_sample(tmp_path):
+    path = str(tmp_path / "results.json")
+    shutil.copy(SAMPLE_FILE, path)
+    return path
+
+
+def test_fingerprint_hashes_an_unchanged_file_once(tmp_path, monkeypatch):
+    path = copy_sample(tmp_path)
+    hashed = []
+    compute_file_hash = cache.compute_file_hash
+    monkeypatch.setattr(cache, "compute_file_hash", lambda file_path: hashed.append(file_path) or compute_file_hash(file_path))
+
+    first = get_file_fingerprint(path)
+    assert get_file_fingerprint(path) == first
+    assert len(hashed) == 1
+
+    with open(path, 'a') as f:
+        f.write("\n")
+    changed = get_file_fingerprint(path)
+    assert len(hashed) == 2
+    assert changed['size'] == first['size'] + 1
+    assert changed['sha256'] != first['sha256']
+
+
+def test_processed_dataset_is_reused_until_the_file_changes(tmp_path, monkeypatch):
+    path = copy_sample(tmp_path)
+    expected = load_and_process_experiment_results(path, use_cache=False)
+
+    assert load_and_process_experiment_results(path) == expected
+    assert os.path.exists(get_processed_cache_path(path))
+
+    # A cache hit does not parse the source file again
+    def fail(*args, **kwargs):
+        raise AssertionError("source file parsed despite a valid cache")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(json, "load", fail)
+        assert load_and_process_experiment_results(path) == expected
+
+    # Rewriting the file invalidates the cache entry
+    with open(SAMPLE_FILE) as f:
+        records = json.load(f)
+    with open(path, 'w') as f:
+        json.dump(records[:2], f)
+    assert load_processed_dataset(path, get_file_fingerprint(path)) is None
+    rebuilt = load_and_process_experiment_results(path)
+    assert rebuilt == load_and_process_experiment_results(path, use_cache=False)
+    assert rebuilt != expected
+
+
+def test_cache_from_another_loader_version_is_ignored(tmp_path, monkeypatch):
+    path = copy_sample(tmp_path)
+    load_and_process_experiment_results(path)
+    fingerprint = get_file_fingerprint(path)
+    assert load_processed_dataset(path, fingerprint) is not None
+
+    monkeypatch.setattr(cache, "PROCESSED_CACHE_VERSION", cache.PROCESSED_CACHE_VERSION + 1)
+    assert load_processed_dataset(path, fingerprint) is None
+
+
+def test_ttl_lru_cache_evicts_least_recently_used_and_expires(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    lru = TTLLRUCache(max_entries=2, ttl_seconds=10)
+
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1
+    lru.put("c", 3)
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c")) == (1, 3)
+
+    now[0] += 11
+    assert lru.get("a") is None
+    stats = lru.stats()
+    assert (stats['evictions'], stats['expirations'], stats['size']) == (1, 1, 1)
+
+
+def test_get_or_create_locks_per_key():
+    lru = TTLLRUCache(max_entries=4)
+    calls = []
+    both_loading = threading.Barrier(2, timeout=5)
+
+    def factory(key):
+        def build():
+            calls.append(key)
+            # Loads of different keys overlap; a global lock would deadlock here
+            both_loading.wait()
+            time.sleep(0.05)
+            return f"value of {key}"
+        return build
+
+    results = {}
+
+    def worker(index, key):
+        results[index] = lru.get_or_create(key, factory(key))
+
+    threads = [threading.Thread(target=worker, args=(index, key)) for index, key in enumerate("aabba")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(calls) == ["a", "b"]
+    assert {index: value for index, (value, _) in results.items()} == {
+        0: "value of a", 1: "value of a", 2: "value of b", 3: "value of b", 4: "value of a"
+    }
+    assert sorted(hit for _, hit in results.values()) == [False, False, True, True, True]
+
+
+def test_concurrent_get_or_create_builds_once_and_counts_waiters_as_hits():
+    lru = TTLLRUCache(max_entries=4)
+    calls = []
+    results = []
+
+    def factory():
+        calls.append(1)
+        time.sleep(0.1)
+        return "dataset"
+
+    def worker():
+        results.append(lru.get_or_create("key", factory))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(hit for _, hit in results) == [False, True, True, True, True]
+    stats = lru.stats()
+    assert (stats['hits'], stats['misses']) == (4, 1)
+    assert stats['hit_rate'] == 0.8
+
+
+def test_get_or_create_does_not_cache_none():
+    lru = TTLLRUCache()
+    calls = []
+    assert lru.get_or_create("missing", lambda: calls.append(1)) == (None, False)
+    assert lru.get_or_create("missing", lambda: calls.append(1)) == (None, False)
+    assert len(calls) == 2
+    assert lru.stats()['size'] == 0
+    assert lru.get_or_create("present", lambda: 1) == (1, False)
+    assert lru.get_or_create("present", lambda: 2) == (1, True)
+    assert (lru.stats()['hits'], lru.stats()['misses']) == (1, 3)
+
+
+def test_persistent_result_cache_round_trip_and_reopen(tmp_path):
+    db_path = str(tmp_path / "results.sqlite3")
+    key = PersistentResultCache.make_key("prompt", "model", 1024)
+    assert key == PersistentResultCache.make_key("prompt", "model", 1024)
+    assert key != PersistentResultCache.make_key("prompt", "model", 2048)
+
+    results = PersistentResultCache(db_path)
+    assert results.get(key) is None
+    results.put(key, {"analysis": "Competitors list prices", "ranks": [1, 2]})
+    assert results.get(key) == {"analysis": "Competitors list prices", "ranks": [1, 2]}
+
+    # A new instance (e.g. after a restart) reads the same entries
+    reopened = PersistentResultCache(db_path)
+    assert reopened.get(key) == {"analysis": "Competitors list prices", "ranks": [1, 2]}
+    stats = results.stats()
+    assert (stats['size'], stats['hits'], stats['misses']) == (1, 1, 1)
+
+
+def test_persistent_result_cache_expires_and_evicts_least_recently_used(tmp_path, monkeypatch):
+    now = [1000.0]
+
+    def tick():
+        now[0] += 1
+        return now[0]
+
+    monkeypatch.setattr(cache.time, "time", tick)
+    results = PersistentResultCache(str(tmp_path / "results.sqlite3"), ttl_seconds=100, max_entries=2)
+
+    results.put("a", "A")
+    results.put("b", "B")
+    assert results.get("a") == "A"
+    results.put("c", "C")
+    # "b" was used least recently
+    assert [results.get(key) for key in "abc"] == ["A", None, "C"]
+
+    now[0] += 200
+    assert results.get("a") is None
+    assert results.stats()['size'] == 1
+
+
+def test_gemini_analysis_is_served_from_cache_and_errors_are_not_stored(tmp_path, monkeypatch):
+    import analytics
+
+    results = PersistentResultCache(str(tmp_path / "gemini.sqlite3"))
+    monkeypatch.setattr(analytics, "gemini_analysis_cache", results)
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    keys = []
+    get = results.get
+    monkeypatch.setattr(results, "get", lambda key: keys.append(key) or get(key))
+
+    search_analytics = analytics.SearchAnalytics({}, {})
+    answer = search_analytics.call_gemini_analysis("best bikes", "berlin.de", ["decathlon.de (rank 1)"])
+    assert answer.startswith("ERROR")
+    assert results.stats()['size'] == 0
+
+    results.put(keys[0], "Decathlon lists prices and stock")
+    assert search_analytics.call_gemini_analysis("best bikes", "berlin.de", ["decathlon.de (rank 1)"]) == \
+        "Decathlon lists prices and stock"
+    assert keys[1] == keys[0]
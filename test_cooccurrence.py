@@ -0,0 +1,118 @@
+import os
+import random
+from collections import Counter
+
+from fastapi.testclient import TestClient
+
+from analytics import SearchAnalytics, load_and_process_experiment_results
+from cooccurrence import DomainCooccurrenceIndex
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gemini_experiment_results.json")
+
+
+def random_dataset(seed=7, prompts=12, queries=4, domains=9):
+    rng = random.Random(seed)
+    data = {}
+    for p in range(prompts):
+        data[f"prompt {p}"] = {}
+        for q in range(queries):
+            retrieved = rng.sample([f"d{d}.com" for d in range(domains)], rng.randint(1, 5))
+            data[f"prompt {p}"][f"query {q % 3} {p % 2}"] = {
+                domain: {"citations": sorted(rng.sample(range(1, 20), rng.randint(0, 3)))} for domain in retrieved
+            }
+    return data
+
+
+def best_rank(citation_data):
+    return min(citation_data["citations"]) if citation_data["citations"] else None
+
+
+def brute_force_cooccurrence(data, domain):
+    row = {}
+    for queries in data.values():
+        for domains in queries.values():
+            if domain in domains:
+                for other in domains:
+                    if other != domain:
+                        row[other] = row.get(other, 0) + 1
+    return row
+
+
+def brute_force_outranked_by(data, domain):
+    counts = {}
+    for queries in data.values():
+        for query, domains in queries.items():
+            if domain not in domains:
+                continue
+            own = best_rank(domains[domain])
+            for competitor, citation_data in domains.items():
+                rank = best_rank(citation_data)
+                if competitor != domain and rank is not None and (own is None or rank < own):
+                    counts.setdefault(competitor, []).append((query, own - rank if own is not None else None))
+    return counts
+
+
+def test_index_matches_a_brute_force_scan():
+    data = random_dataset()
+    index = DomainCooccurrenceIndex(data)
+
+    for d in range(10):
+        domain = f"d{d}.com"
+        appearances = [(prompt, query) for prompt, queries in data.items() for query, domains in queries.items() if domain in domains]
+        assert list(index.iter_appearances(domain)) == appearances
+        assert index.domain_frequency(domain) == len(appearances)
+        assert index.cooccurrence(domain) == brute_force_cooccurrence(data, domain)
+
+        expected = brute_force_outranked_by(data, domain)
+        outranked_by = index.outranked_by(domain)
+        assert set(outranked_by) == set(expected)
+        counts = [entry["count"] for entry in outranked_by.values()]
+        assert counts == sorted(counts, reverse=True)
+        for competitor, entry in outranked_by.items():
+            assert entry["count"] == len(expected[competitor])
+            assert Counter(
+                (query, delta) for query, query_entry in entry["queries"].items() for delta in query_entry["rank_deltas"]
+            ) == Counter(expected[competitor])
+            deltas = [delta for _, delta in expected[competitor] if delta is not None]
+            assert entry["avg_rank_delta"] == (sum(deltas) / len(deltas) if deltas else None)
+
+    assert index.outranked_by("d0.com") is index.outranked_by("d0.com")
+    assert index.domain_frequency("missing.com") == 0 and index.outranked_by("missing.com") == {}
+
+
+def test_top_competitors_and_prompt_competitors_keep_dataset_order():
+    data = random_dataset(seed=11)
+    index = DomainCooccurrenceIndex(data)
+
+    frequency = {}
+    for queries in data.values():
+        for domains in queries.values():
+            for domain in domains:
+                if domain != "d1.com":
+                    frequency[domain] = frequency.get(domain, 0) + 1
+    assert index.top_competitors("d1.com", 5) == sorted(frequency.items(), key=lambda item: item[1], reverse=True)[:5]
+
+    for prompt, queries in data.items():
+        for threshold in (1, 4, 10, float("inf")):
+            expected = [
+                (query, domain, best_rank(citation_data))
+                for query, domains in queries.items() for domain, citation_data in domains.items()
+                if domain != "d1.com" and citation_data["citations"] and best_rank(citation_data) < threshold
+            ]
+            assert index.prompt_competitors(prompt, "d1.com", threshold) == expected
+
+
+def test_competitors_endpoint_lists_who_outranks_the_domain():
+    import api
+
+    analytics = SearchAnalytics(*load_and_process_experiment_results(SAMPLE_FILE, use_cache=False))
+    expected = analytics.get_cooccurrence_index().outranked_by("berlin.de")
+
+    with TestClient(api.app) as client:
+        response = client.get("/competitors", params={"target_domain": "berlin.de", "limit": 3})
+        assert response.status_code == 200
+        body = response.json()
+
+    assert body["total_appearances"] == analytics.get_cooccurrence_index().domain_frequency("berlin.de")
+    assert [entry["domain"] for entry in body["outranked_by"]] == list(expected)[:3]
+    assert body["outranked_by"][0]["count"] == expected[body["outranked_by"][0]["domain"]]["count"]
@@ -0,0 +1,97 @@
+import math
+import os
+
+import pytest
+
+from analytics import SearchAnalytics, load_and_process_experiment_results
+from experiment_diff import diff_experiment_sets, mean_difference_z, two_proportion_z
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gemini_experiment_results.json")
+
+
+def rank_sums(ranks):
+    return sum(ranks), sum(rank * rank for rank in ranks), len(ranks)
+
+
+def analytics_with_ranks(ranks_by_prompt, domain="example.com"):
+    """One query per prompt, with domain cited at the given rank (None: retrieved but not cited)"""
+    data = {
+        f"prompt {index}": {
+            f"query {index}": {
+                domain: {'citations': [] if rank is None else [rank], 'contents': []},
+                "other.com": {'citations': [], 'contents': []}
+            }
+        }
+        for index, rank in enumerate(ranks_by_prompt)
+    }
+    return SearchAnalytics(data, {})
+
+
+def test_two_proportion_z():
+    assert two_proportion_z(0, 0, 5, 10) is None
+    assert two_proportion_z(5, 10, 0, 0) is None
+    # Both sides all successes or all failures: no variance, no change
+    assert two_proportion_z(10, 10, 20, 20) == 0.0
+    assert two_proportion_z(0, 10, 0, 20) == 0.0
+    assert two_proportion_z(50, 100, 50, 100) == 0.0
+    # Pooled p = 0.5, standard error = sqrt(0.25 * 2 / 100) = 0.0707...
+    assert two_proportion_z(40, 100, 60, 100) == pytest.approx(0.2 / math.sqrt(0.005))
+    assert two_proportion_z(60, 100, 40, 100) == pytest.approx(-0.2 / math.sqrt(0.005))
+
+
+def test_mean_difference_z():
+    assert mean_difference_z(*rank_sums([1]), *rank_sums([2, 3])) is None
+    assert mean_difference_z(*rank_sums([2, 3]), *rank_sums([])) is None
+    # Zero variance on both sides
+    assert mean_difference_z(*rank_sums([3] * 5), *rank_sums([3] * 4)) == 0.0
+    assert mean_difference_z(5, 5, 5, 25, 125, 5) == math.inf
+    assert mean_difference_z(25, 125, 5, 5, 5, 5) == -math.inf
+    # Welch: means 2 and 4, variances 1 and 1, standard error sqrt(1/3 + 1/3)
+    assert mean_difference_z(*rank_sums([1, 2, 3]), *rank_sums([3, 4, 5])) == pytest.approx(2 / math.sqrt(2 / 3))
+
+
+def test_zero_variance_rank_shift_is_significant():
+    before = analytics_with_ranks([1] * 5)
+    after = analytics_with_ranks([5] * 5)
+    rank = diff_experiment_sets(before, after)['domains']['example.com']['avg_best_rank']
+    assert (rank['before'], rank['after'], rank['delta']) == (1.0, 5.0, 4.0)
+    assert rank['p_value'] == 0.0
+    assert rank['significant'] is True
+
+
+def test_small_samples_are_not_flagged():
+    before = analytics_with_ranks([1] * 4)
+    after = analytics_with_ranks([5] * 4)
+    rank = diff_experiment_sets(before, after)['domains']['example.com']['avg_best_rank']
+    assert rank['p_value'] == 0.0
+    assert rank['significant'] is False
+
+
+def test_rates_match_domain_stats_of_each_side():
+    data, response_chunks = load_and_process_experiment_results(SAMPLE_FILE, use_cache=False)
+    before = SearchAnalytics(data, response_chunks)
+    after = analytics_with_ranks([1, 2, None, 4, None, 1], domain="berlin.de")
+    diff = diff_experiment_sets(before, after, target_domain="berlin.de")
+
+    for side, analytics in (('before', before), ('after', after)):
+        stats = analytics.calculate_domain_stats("berlin.de")
+        entry = diff['domains']["berlin.de"]
+        assert entry['retrieved_pairs'][side] == stats['total_appearances']
+        assert entry['retrieval_rate'][side] == pytest.approx(stats['retrieval_rate'])
+        assert entry['usage_rate'][side] == pytest.approx(stats['usage_rate'])
+    assert diff['target']['domain'] == "berlin.de"
+
+
+def test_diff_of_a_set_with_itself_has_no_changes():
+    data, response_chunks = load_and_process_experiment_results(SAMPLE_FILE, use_cache=False)
+    analytics = SearchAnalytics(data, response_chunks)
+    diff = diff_experiment_sets(analytics, analytics, target_domain="berlin.de")
+
+    assert diff['summary']['significant_domain_changes'] == 0
+    assert diff['summary']['queries_changed'] == 0
+    assert diff['summary']['prompts_changed'] == 0
+    for entry in diff['domains'].values():
+        assert entry['status'] == 'both'
+        assert entry['citations_gained'] == entry['citations_lost'] == 0
+        assert entry['retrieval_rate']['delta'] == 0
+    assert diff['target']['displacement']['pairs_target_worsened'] == 0
@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+extract = pytest.importorskip("extract")
+
+
+def test_explicit_api_key_reaches_clients_created_from_the_environment(tmp_path, monkeypatch):
+    import analytics
+    from cache import PersistentResultCache
+
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    monkeypatch.setattr(analytics, "gemini_analysis_cache", PersistentResultCache(str(tmp_path / "gemini.sqlite3")))
+    keys = []
+
+    def fake_client(api_key):
+        keys.append(api_key)
+        raise RuntimeError("no network in tests")
+
+    monkeypatch.setattr(extract, "get_genai_client", fake_client)
+    result = extract.call_gemini_model("gemini-2.5-flash", "best city bikes", "explicit-key")
+
+    assert result["success"] is False
+    assert os.environ["GEMINI_API_KEY"] == "explicit-key"
+    # Without the google-genai SDK installed the call fails before a client is built
+    assert keys in ([], ["explicit-key"])
+    # The analytics Gemini calls find the key instead of reporting it missing
+    answer = analytics.SearchAnalytics({}, {}).call_gemini_analysis("best bikes", "berlin.de", ["decathlon.de (rank 1)"])
+    assert "GEMINI_API_KEY not found" not in answer
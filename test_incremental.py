@@ -0,0 +1,80 @@
+import json
+import os
+
+import pytest
+
+from analytics import SearchAnalytics, load_and_process_experiment_results
+from incremental import IncrementalAnalytics
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gemini_experiment_results.json")
+
+
+def load_records():
+    with open(SAMPLE_FILE) as f:
+        return json.load(f)
+
+
+def all_domains(analytics):
+    return sorted({domain for queries in analytics.data.values() for domains in queries.values() for domain in domains})
+
+
+def normalized_query_analysis(analysis):
+    # SearchAnalytics builds all_domains from a set, so only its contents are comparable
+    return {query: {**stats, 'all_domains': sorted(stats['all_domains'])} for query, stats in analysis.items()}
+
+
+def assert_matches(incremental, analytics):
+    assert incremental.calculate_overview() == analytics.calculate_overview()
+    assert incremental.calculate_prompt_stats() == analytics.calculate_prompt_stats()
+    assert incremental.calculate_query_frequency_stats() == analytics.calculate_query_frequency_stats()
+    assert incremental.analyze_intersecting_queries() == analytics.analyze_intersecting_queries()
+    for domain in all_domains(analytics) + ["nonexistent.example"]:
+        expected = analytics.calculate_domain_stats(domain)
+        assert incremental.calculate_domain_stats(domain) == expected, domain
+        summary = incremental.domain_summary(domain)
+        for key in ('total_appearances', 'total_citations', 'retrieval_rate', 'usage_rate'):
+            assert summary[key] == pytest.approx(expected[key]), (domain, key)
+        positions = expected['citation_positions']
+        assert summary['min_citation_rank'] == (min(positions) if positions else None)
+    for domain in ("berlin.de", "decathlon.de", "nonexistent.example"):
+        assert (normalized_query_analysis(incremental.analyze_queries_with_target_domain(domain))
+                == normalized_query_analysis(analytics.analyze_queries_with_target_domain(domain)))
+
+
+def test_batch_ingest_matches_search_analytics():
+    incremental = IncrementalAnalytics()
+    incremental.ingest_file(SAMPLE_FILE)
+    analytics = SearchAnalytics(*load_and_process_experiment_results(SAMPLE_FILE, use_cache=False))
+    assert_matches(incremental, analytics)
+
+
+def test_appended_records_are_picked_up(tmp_path):
+    records = load_records()
+    path = tmp_path / "experiments.json"
+    path.write_text(json.dumps(records[:len(records) // 2]))
+
+    incremental = IncrementalAnalytics()
+    assert incremental.ingest_file(str(path)) == len(records) // 2
+    assert incremental.ingest_file(str(path)) == 0
+
+    path.write_text(json.dumps(records))
+    assert incremental.ingest_file(str(path)) == len(records) - len(records) // 2
+    assert incremental.records_ingested == len(records)
+    assert_matches(incremental, SearchAnalytics(*load_and_process_experiment_results(str(path), use_cache=False)))
+
+
+def test_rerun_prompt_retracts_the_earlier_contribution():
+    def experiment(searches):
+        return {'prompt': "prompt", 'results': {'model': [{'success': True, 'web_searches': searches}]}}
+
+    incremental = IncrementalAnalytics()
+    incremental.ingest([experiment({"query": {"https://a.com/1": {'citations': [1, 2]}, "https://b.com": {'citations': [3]}}})])
+    incremental.ingest([experiment({"query": {"https://a.com/2": {'citations': [4]}}})])
+
+    a_com = incremental.calculate_domain_stats("a.com")
+    assert (a_com['total_appearances'], a_com['citation_positions']) == (1, [4])
+    assert incremental.domain_summary("a.com")['avg_citation_rank'] == 4
+    assert incremental.calculate_domain_stats("b.com")['citation_positions'] == [3]
+    assert incremental.calculate_prompt_stats()["prompt"]['total_citations'] == 2
+    assert incremental.analyze_intersecting_queries() == {}
+    assert incremental.total_queries == 1
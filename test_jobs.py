@@ -0,0 +1,110 @@
+import asyncio
+import json
+import time
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from jobs import JobManager
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_job_events_stream_until_completion_and_resume():
+    async def scenario():
+        manager = JobManager()
+
+        async def work(progress):
+            progress("section", {'name': 'overview'})
+            await asyncio.sleep(0)
+            progress("section", {'name': 'domain_analysis'})
+            return {'value': 42}
+
+        job = manager.submit(work)
+        streamed = [event async for event in job.iter_events()]
+        resumed = [event async for event in job.iter_events(3)]
+        return job, streamed, resumed
+
+    job, streamed, resumed = run(scenario())
+    assert [event['type'] for event in streamed] == ["queued", "started", "section", "section", "completed"]
+    assert [event['id'] for event in streamed] == list(range(5))
+    assert streamed[2]['data'] == {'name': 'overview'}
+    assert resumed == streamed[3:]
+    assert job.status == "completed"
+    assert job.to_dict()['result'] == {'value': 42}
+
+
+def test_failed_job_reports_the_error():
+    async def scenario():
+        manager = JobManager()
+
+        async def work(progress):
+            raise HTTPException(status_code=400, detail="No valid search data")
+
+        job = manager.submit(work)
+        events = [event async for event in job.iter_events()]
+        return job, events
+
+    job, events = run(scenario())
+    assert job.status == "failed"
+    assert job.error == "No valid search data"
+    assert events[-1]['type'] == "failed"
+    assert events[-1]['data'] == {'error': "No valid search data"}
+    assert 'result' not in job.to_dict()
+
+
+def test_finished_jobs_are_purged_by_ttl_and_count():
+    async def scenario():
+        manager = JobManager(result_ttl_seconds=3600, max_jobs=2)
+
+        async def work(progress):
+            return None
+
+        jobs = []
+        for _ in range(3):
+            job = manager.submit(work)
+            await job.task
+            jobs.append(job)
+        manager.purge_expired()
+        kept_by_count = [manager.get(job.job_id) is not None for job in jobs]
+
+        manager.result_ttl_seconds = 0
+        jobs[-1].finished_at = time.time() - 1
+        return kept_by_count, manager.get(jobs[-1].job_id)
+
+    kept_by_count, expired = run(scenario())
+    assert kept_by_count == [False, True, True]
+    assert expired is None
+
+
+def test_job_result_matches_analyze_and_streams_sse():
+    import api
+
+    request = {"target_domain": "berlin.de", "sections": ["overview", "domain_analysis", "query_analysis"]}
+    with TestClient(api.app) as client:
+        expected = client.post("/analyze", json=request).json()
+
+        submitted = client.post("/jobs", json=request)
+        assert submitted.status_code == 202
+        job_id = submitted.json()["job_id"]
+
+        for _ in range(200):
+            job = client.get(f"/jobs/{job_id}").json()
+            if job["status"] in ("completed", "failed"):
+                break
+            time.sleep(0.01)
+        assert job["status"] == "completed"
+        assert job["result"]["data"] == expected["data"]
+
+        body = client.get(f"/jobs/{job_id}/events").text
+        events = [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+        assert [event["id"] for event in events] == list(range(len(events)))
+        assert events[0]["type"] == "queued" and events[-1]["type"] == "completed"
+        assert "admitted" in [event["type"] for event in events]
+
+        resumed = client.get(f"/jobs/{job_id}/events", headers={"Last-Event-ID": str(len(events) - 2)}).text
+        assert [line for line in resumed.splitlines() if line.startswith("id: ")] == [f"id: {len(events) - 1}"]
+
+        assert client.get("/jobs/unknown").status_code == 404
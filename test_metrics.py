@@ -0,0 +1,106 @@
+import asyncio
+import os
+import time
+
+from fastapi.testclient import TestClient
+
+import metrics
+from metrics import MetricsMiddleware, MetricsRegistry, RequestTimings, current_timings, stage
+
+
+def test_registry_renders_the_prometheus_text_format():
+    registry = MetricsRegistry()
+    requests = registry.counter("app_requests", "Requests", ("route",))
+    latency = registry.histogram("app_latency_seconds", "Latency", (), buckets=(0.1, 1.0))
+    registry.register_collector(lambda: [("app_queue_depth", "Queue depth", ("queue",), {("jobs",): 3})])
+
+    requests.inc(route="/a")
+    requests.inc(2, route='/"b"')
+    for value in (0.05, 0.1, 0.5, 4):
+        latency.observe(value)
+
+    assert registry.render().splitlines() == [
+        "# HELP app_requests_total Requests",
+        "# TYPE app_requests_total counter",
+        'app_requests_total{route="/\\"b\\""} 2',
+        'app_requests_total{route="/a"} 1',
+        "# HELP app_latency_seconds Latency",
+        "# TYPE app_latency_seconds histogram",
+        'app_latency_seconds_bucket{le="0.1"} 2',
+        'app_latency_seconds_bucket{le="1"} 3',
+        'app_latency_seconds_bucket{le="+Inf"} 4',
+        "app_latency_seconds_sum 4.65",
+        "app_latency_seconds_count 4",
+        "# HELP app_queue_depth Queue depth",
+        "# TYPE app_queue_depth gauge",
+        'app_queue_depth{queue="jobs"} 3',
+    ]
+
+
+def test_stages_are_attributed_to_the_current_request_only():
+    with stage("outside_a_request"):
+        pass
+    assert current_timings() is None
+
+    timings = RequestTimings()
+    token = metrics._current_timings.set(timings)
+    try:
+        with stage("load"):
+            time.sleep(0.002)
+        with stage("load"):
+            pass
+        metrics.record_stage("section.overview", 0.0015)
+    finally:
+        metrics._current_timings.reset(token)
+
+    assert set(timings.stages) == {"load", "section.overview"} and timings.stages["load"] >= 0.002
+    assert timings.server_timing().endswith("section-overview;dur=1.5")
+
+
+def test_analyze_reports_server_timing_and_is_scraped_by_route():
+    import api
+
+    with TestClient(api.app) as client:
+        response = client.post("/analyze", json={"target_domain": "berlin.de", "sections": ["overview"]})
+        assert response.status_code == 200
+        stages = [entry.split(";")[0] for entry in response.headers["server-timing"].split(", ")]
+        assert {"validate_files", "load", "section-overview", "serialize"} <= set(stages)
+
+        client.get("/jobs/unknown")
+        scraped = client.get("/metrics")
+        assert scraped.headers["content-type"] == metrics.PROMETHEUS_CONTENT_TYPE
+
+    body = scraped.text
+    assert 'search_analytics_http_request_duration_seconds_count{method="POST",route="/analyze",status="200"}' in body
+    assert 'route="/jobs/{job_id}",status="404"' in body
+    assert 'search_analytics_stage_duration_seconds_count{stage="section.overview"}' in body
+    assert 'search_analytics_cache_requests_total{cache="analytics",outcome="hit"}' in body
+    assert "search_analytics_admission_queue_depth 0" in body
+
+
+def test_slow_requests_are_profiled(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "PROFILE_OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "PROFILE_SAMPLE_INTERVAL_MS", 1)
+
+    def busy_wait(seconds):
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            pass
+
+    async def slow_app(scope, receive, send):
+        await asyncio.to_thread(busy_wait, 0.05)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"done"})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = MetricsMiddleware(slow_app, slow_request_ms=10)
+    asyncio.run(middleware({"type": "http", "method": "GET", "path": "/slow"}, None, send))
+
+    assert sent[-1]["body"] == b"done"
+    profiles = os.listdir(tmp_path)
+    assert len(profiles) == 1 and "-unmatched-" in profiles[0] and profiles[0].endswith("ms.folded")
+    assert "busy_wait (test_metrics.py:" in (tmp_path / profiles[0]).read_text()
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from analytics import SearchAnalytics
+
+
+@pytest.fixture
+def analytics():
+    """Eight prompts where example.com is cited at rank 1..7 or not at all, each with a better-ranked competitor"""
+    data = {}
+    for index in range(8):
+        rank = index + 1 if index < 7 else None
+        data[f"prompt {index}"] = {
+            f"query {index}": {
+                "example.com": {'citations': [] if rank is None else [rank], 'contents': ["Example snippet"]},
+                f"competitor{index}.com": {'citations': [0], 'contents': [f"Competitor {index} snippet"]}
+            }
+        }
+    return SearchAnalytics(data, {})
+
+
+def stub_gemini(analytics, monkeypatch, delay=0.05):
+    """Replace the Gemini call with a deterministic stub that records its peak concurrency"""
+    state = {'running': 0, 'peak': 0, 'calls': []}
+    lock = threading.Lock()
+
+    def call_gemini_analysis(prompt, domain_of_interest, competitor_info):
+        with lock:
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+            state['calls'].append(prompt)
+        time.sleep(delay)
+        with lock:
+            state['running'] -= 1
+        return f"analysis of {prompt} for {domain_of_interest} with {len(competitor_info)} competitors"
+
+    monkeypatch.setattr(analytics, "call_gemini_analysis", call_gemini_analysis)
+    return state
+
+
+def test_concurrent_analysis_matches_sequential(analytics, monkeypatch):
+    state = stub_gemini(analytics, monkeypatch)
+    sequential = analytics.analyze_poor_performance("example.com", worst_prompts=5, max_concurrency=1)
+    assert state['peak'] == 1
+
+    state = stub_gemini(analytics, monkeypatch)
+    concurrent = analytics.analyze_poor_performance("example.com", worst_prompts=5, max_concurrency=8)
+    assert concurrent == sequential
+    assert list(concurrent) == list(sequential)
+    assert state['peak'] > 1
+
+    assert len(concurrent) == 5
+    for prompt, entry in concurrent.items():
+        if entry['competitor_info']:
+            assert entry['gemini_analysis'].startswith(f"analysis of {prompt} for example.com")
+        else:
+            assert entry['gemini_analysis'] == "No competitor data available for analysis"
+
+
+def test_concurrency_is_bounded(analytics, monkeypatch):
+    state = stub_gemini(analytics, monkeypatch)
+    analysis = analytics.analyze_poor_performance("example.com", worst_prompts=6, max_concurrency=2)
+    assert state['peak'] == 2
+    assert len(state['calls']) == sum(1 for entry in analysis.values() if entry['competitor_info'])
+
+
+def test_worst_prompts_limits_the_analyzed_prompts(analytics, monkeypatch):
+    stub_gemini(analytics, monkeypatch, delay=0)
+    three = analytics.analyze_poor_performance("example.com", worst_prompts=3)
+    five = analytics.analyze_poor_performance("example.com", worst_prompts=5)
+    assert list(three) == list(five)[:3]
+    assert [entry['performance_rating'] for entry in three.values()] == ['absent', 'poor', 'poor']
+    assert analytics.analyze_poor_performance("example.com", worst_prompts=0) == {}
+    scores = [entry['performance_score'] for entry in five.values()]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_async_analysis_matches_sync_and_selects_on_the_executor(analytics, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    stub_gemini(analytics, monkeypatch, delay=0)
+    expected = analytics.analyze_poor_performance("example.com", worst_prompts=5)
+
+    running = {'now': 0, 'peak': 0}
+    selection_threads = []
+    select = analytics._select_poor_performers
+
+    def recording_select(*args):
+        selection_threads.append(threading.current_thread().name)
+        return select(*args)
+
+    async def call_gemini_analysis_async(prompt, domain_of_interest, competitor_info):
+        running['now'] += 1
+        running['peak'] = max(running['peak'], running['now'])
+        await asyncio.sleep(0.01)
+        running['now'] -= 1
+        return f"analysis of {prompt} for {domain_of_interest} with {len(competitor_info)} competitors"
+
+    monkeypatch.setattr(analytics, "_select_poor_performers", recording_select)
+    monkeypatch.setattr(analytics, "call_gemini_analysis_async", call_gemini_analysis_async)
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="selection") as executor:
+        result = asyncio.run(analytics.analyze_poor_performance_async(
+            "example.com", worst_prompts=5, max_concurrency=2, executor=executor
+        ))
+
+    assert result == expected
+    assert list(result) == list(expected)
+    assert selection_threads and selection_threads[0].startswith("selection")
+    assert running['peak'] == 2
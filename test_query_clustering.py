@@ -0,0 +1,114 @@
+import itertools
+import os
+
+import pytest
+
+from analytics import SearchAnalytics, load_multiple_experiment_files
+from query_clustering import QueryClusterIndex, jaccard_similarity, normalize_query, query_shingles
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_FILES = [
+    os.path.join(REPO_DIR, "gemini_experiment_results.json"),
+    os.path.join(REPO_DIR, "internal_responce_log.json"),
+]
+
+
+def load_sample():
+    return SearchAnalytics(*load_multiple_experiment_files(SAMPLE_FILES))
+
+
+def brute_force_clusters(queries, threshold):
+    """Single-linkage clusters from comparing every pair of normalized queries"""
+    queries = list(dict.fromkeys(queries))
+    parents = list(range(len(queries)))
+
+    def find(node):
+        while parents[node] != node:
+            node = parents[node]
+        return node
+
+    shingles = [query_shingles(normalize_query(query)) for query in queries]
+    for first, second in itertools.combinations(range(len(queries)), 2):
+        if normalize_query(queries[first]) == normalize_query(queries[second]) or \
+                jaccard_similarity(shingles[first], shingles[second]) >= threshold:
+            roots = sorted((find(first), find(second)))
+            parents[roots[1]] = roots[0]
+
+    clusters = {}
+    for node, query in enumerate(queries):
+        clusters.setdefault(queries[find(node)], []).append(query)
+    return clusters
+
+
+def test_normalize_query():
+    assert normalize_query("  Best bikes,  Berlin!") == "best bikes berlin"
+    assert normalize_query("Fahrräder München") == "fahrrader munchen"
+    assert query_shingles("ab") == {"ab"}
+
+
+def test_variants_share_a_cluster_labelled_by_the_first_query():
+    index = QueryClusterIndex()
+    index.add_all(["bikes in Berlin", "Bikes in Berlin!", "bikes in Berlin 2024", "running shoes", "bikes in Berlin"])
+
+    assert index.cluster_of("Bikes in Berlin!") == "bikes in Berlin"
+    assert index.cluster_of("bikes in Berlin 2024") == "bikes in Berlin"
+    assert index.cluster_of("running shoes") == "running shoes"
+    assert index.cluster_of("never added") is None
+    assert index.clusters() == {
+        "bikes in Berlin": ["bikes in Berlin", "Bikes in Berlin!", "bikes in Berlin 2024"],
+        "running shoes": ["running shoes"]
+    }
+    assert index.stats()['queries'] == 4
+    assert index.stats()['normalized_queries'] == 3
+    assert index.stats()['clusters'] == 2
+
+
+def test_invalid_banding_is_rejected():
+    with pytest.raises(ValueError):
+        QueryClusterIndex(num_permutations=96, bands=25)
+
+
+@pytest.mark.parametrize("threshold", [0.7, 0.9])
+def test_matches_brute_force_clustering_on_sample_queries(threshold):
+    analytics = load_sample()
+    queries = [query for queries in analytics.data.values() for query in queries]
+    index = analytics.get_query_cluster_index(threshold)
+
+    assert index.clusters() == brute_force_clusters(queries, threshold)
+    assert analytics.get_query_cluster_index(threshold) is index
+
+
+@pytest.mark.parametrize("threshold", [0.3, 0.5])
+def test_low_thresholds_never_merge_dissimilar_queries(threshold):
+    # The bands are tuned for the default threshold, so far below it LSH may miss
+    # a similar pair, but every merge is still verified against the exact similarity
+    analytics = load_sample()
+    queries = [query for queries in analytics.data.values() for query in queries]
+    expected = {query: label for label, members in brute_force_clusters(queries, threshold).items() for query in members}
+
+    for members in analytics.get_query_cluster_index(threshold).clusters().values():
+        assert len({expected[query] for query in members}) == 1
+
+
+def test_exact_threshold_matches_query_frequency_stats():
+    analytics = load_sample()
+    # Above every similarity, clusters only merge queries with the same normalized form
+    clusters = analytics.calculate_query_cluster_stats(threshold=1.01)
+    frequencies = analytics.calculate_query_frequency_stats()
+
+    assert clusters['total_queries'] == frequencies['total_queries']
+    index = analytics.get_query_cluster_index(1.01)
+    for query, details in frequencies['query_details'].items():
+        cluster = clusters['cluster_details'][index.cluster_of(query)]
+        assert query in cluster['queries']
+        assert set(details['prompts']) <= set(cluster['prompts'])
+    assert sum(cluster['frequency'] for cluster in clusters['cluster_details'].values()) == frequencies['total_queries']
+    assert len(clusters['cluster_details']) == len({normalize_query(query) for query in frequencies['query_details']})
+
+    intersecting = analytics.analyze_intersecting_queries()
+    for query, details in analytics.analyze_intersecting_query_clusters(threshold=1.01).items():
+        if details['queries'] == [query]:
+            assert details['prompts'] == intersecting[query]['prompts']
+            assert details['domains_with_citations'] == {
+                domain: sorted(ranks) for domain, ranks in intersecting[query]['domains_with_citations'].items()
+            }
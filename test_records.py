@@ -0,0 +1,45 @@
+import json
+import pickle
+from array import array
+
+import pytest
+
+from records import CitationRecord, citation_ranks, pack_ranks
+from snippets import SnippetList, SnippetStore
+
+
+def test_ranks_are_packed_into_bytes_until_one_does_not_fit():
+    assert pack_ranks([1, 3, 255]) == bytes([1, 3, 255])
+    assert pack_ranks([]) is pack_ranks(iter(()))
+    wide = pack_ranks([1, 256, 70000])
+    assert isinstance(wide, array) and list(wide) == [1, 256, 70000]
+
+
+@pytest.mark.parametrize("ranks", [[1, 2, 9], [3, 300], []])
+def test_record_reads_like_the_dict_it_replaces(ranks):
+    contents = SnippetList(SnippetStore(), ["snippet"] * len(ranks))
+    record = CitationRecord(ranks, contents)
+    plain = {"citations": ranks, "contents": list(contents)}
+
+    assert record["citations"] == ranks and record["citations"] is not record["citations"]
+    assert record["contents"] is contents
+    assert list(record) == ["citations", "contents"] and len(record) == 2
+    assert "citations" in record and "ranks" not in record and record.get("ranks") is None
+    assert dict(record) == {"citations": ranks, "contents": contents}
+    assert record == plain and plain == record and record.to_dict() == plain
+    assert json.loads(json.dumps(record.to_dict())) == plain
+    assert citation_ranks(record) is record.ranks and citation_ranks(plain) is ranks
+    with pytest.raises(KeyError):
+        record["ranks"]
+
+    restored = pickle.loads(pickle.dumps(record))
+    assert restored == record and restored.ranks == record.ranks
+
+
+def test_record_fields_can_be_reassigned():
+    record = CitationRecord([2, 1], [])
+    record["citations"] = sorted(set(record["citations"] + [1, 400]))
+    record["contents"] = ["a"]
+    assert record == {"citations": [1, 2, 400], "contents": ["a"]}
+    with pytest.raises(KeyError):
+        record["ranks"] = [1]
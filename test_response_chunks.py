@@ -0,0 +1,97 @@
+from types import SimpleNamespace
+
+import pytest
+
+from analytics import SearchAnalytics, extract_experiment_response_chunks, response_segments_from_citation_index
+
+RESPONSE = "Über Räder: Fahrrad.de führt. Decathlon ist günstig. Reddit diskutiert."
+
+
+def byte_span(text):
+    start = RESPONSE.encode("utf-8").index(text.encode("utf-8"))
+    return start, start + len(text.encode("utf-8"))
+
+
+def support(text, chunk_indices):
+    span_start, span_end = byte_span(text) if text in RESPONSE else (None, None)
+    return SimpleNamespace(
+        segment=SimpleNamespace(text=text, start_index=span_start, end_index=span_end),
+        grounding_chunk_indices=chunk_indices,
+    )
+
+
+def test_citation_index_round_trips_utf8_offsets():
+    extract = pytest.importorskip("extract")
+
+    uris = ["https://www.fahrrad.de/a", "https://decathlon.de/b", "https://www.fahrrad.de/a"]
+    supports = [
+        support("Decathlon ist günstig.", [1, 0]),
+        support("Über Räder: Fahrrad.de führt.", [0, 2]),
+        support("Reddit diskutiert.", [7]),  # chunk index out of range: not cited
+        support("Text without offsets", [1]),  # no start index: sorted last, text kept
+    ]
+    index = extract.build_citation_index(RESPONSE, supports, uris)
+
+    assert index["sources"] == ["https://www.fahrrad.de/a", "https://decathlon.de/b"]
+    assert index["segments"][0] == [0, len("Über Räder: Fahrrad.de führt.".encode("utf-8")), [0, 0]]
+    assert len(index["segments"][1]) == 3
+    assert index["segments"][2][2:] == [[1], "Text without offsets"]
+
+    assert response_segments_from_citation_index(RESPONSE, index) == [
+        ("Über Räder: Fahrrad.de führt.", ["fahrrad.de", "fahrrad.de"]),
+        ("Decathlon ist günstig.", ["decathlon.de", "fahrrad.de"]),
+        ("Text without offsets", ["decathlon.de"]),
+    ]
+
+
+def experiment(run_result):
+    return {"prompt": "p", "results": {"gemini": [run_result]}}
+
+
+def test_response_chunks_come_from_the_index_or_the_stored_segments():
+    with_index = experiment({
+        "success": True,
+        "response": RESPONSE,
+        "citation_index": {
+            "sources": ["https://decathlon.de/b", "https://www.fahrrad.de/a"],
+            "segments": [[*byte_span("Decathlon ist günstig."), [0, 1]], [*byte_span("Reddit diskutiert."), [1]]],
+        },
+    })
+    assert extract_experiment_response_chunks(with_index) == {
+        "Decathlon ist günstig.": ["decathlon.de", "fahrrad.de"],
+        "Reddit diskutiert.": ["fahrrad.de"],
+    }
+
+    # Results extracted before the citation index existed keep the segment texts in web_searches
+    legacy = experiment({
+        "success": True,
+        "response": RESPONSE,
+        "web_searches": {
+            "fahrrad kaufen": {
+                "https://decathlon.de/b": {"citations": [2], "contents": ["Decathlon ist günstig."]},
+                "https://www.fahrrad.de/a": {"citations": [1, 2], "contents": ["Über Räder.", "Decathlon ist günstig."]},
+            },
+            "fahrrad test": {},
+        },
+    })
+    assert extract_experiment_response_chunks(legacy) == {
+        "Über Räder.": ["fahrrad.de"],
+        "Decathlon ist günstig.": ["decathlon.de", "fahrrad.de"],
+    }
+
+    assert extract_experiment_response_chunks(experiment({"success": False, "response": RESPONSE})) == {}
+
+
+def test_response_chunk_analysis_counts_citations_per_sentence():
+    response_chunks = {
+        "p": {
+            "Decathlon ist günstig.": ["decathlon.de", "fahrrad.de", "decathlon.de"],
+            "Reddit diskutiert.": ["reddit.com"],
+        }
+    }
+    analytics = SearchAnalytics({"p": {"q": {"decathlon.de": {"citations": [1], "contents": [""]}}}}, response_chunks)
+
+    analysis = analytics.analyze_response_chunks("decathlon.de")["p"]
+    assert analysis["domain_mentions"] == [{"sentence": "Decathlon ist günstig.", "position": 1, "citation_count": 2}]
+    assert analysis["domain_citations"] == 2 and analysis["total_citations"] == 4
+    assert analytics.get_sentence_domain_counts() is analytics.get_sentence_domain_counts()
@@ -0,0 +1,84 @@
+import asyncio
+import gzip
+import json
+import threading
+
+import pytest
+
+import serialization
+from serialization import MIN_COMPRESS_BYTES, choose_encoding, encode_body, json_response, parse_accept_encoding
+
+LARGE_PAYLOAD = {"rows": [{"domain": f"example{index}.com", "rank": index} for index in range(200)]}
+SMALL_PAYLOAD = {"ok": True}
+
+
+def decode(response):
+    body = response.body
+    encoding = response.headers.get("content-encoding")
+    if encoding == "gzip":
+        body = gzip.decompress(body)
+    elif encoding == "br":
+        body = serialization.brotli.decompress(body)
+    return json.loads(body)
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding("gzip, deflate, br;q=0.9") == {"gzip": 1.0, "deflate": 1.0, "br": 0.9}
+    assert parse_accept_encoding("GZIP;q=bad") == {"gzip": 0.0}
+    assert parse_accept_encoding(None) == {}
+
+
+def test_choose_encoding(monkeypatch):
+    if serialization.brotli is not None:
+        assert choose_encoding("gzip, br") == "br"
+        assert choose_encoding("*") == "br"
+    assert choose_encoding("gzip, br;q=0.5") == "gzip"
+    assert choose_encoding("gzip;q=0, br;q=0") is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding(None) is None
+
+    monkeypatch.setattr(serialization, "brotli", None)
+    assert choose_encoding("br") is None
+    assert choose_encoding("br, gzip;q=0.1") == "gzip"
+
+
+def test_bodies_below_the_threshold_are_not_compressed():
+    body, encoding = encode_body(SMALL_PAYLOAD, "gzip, br")
+    assert encoding is None
+    assert json.loads(body) == SMALL_PAYLOAD
+
+    body, encoding = encode_body(LARGE_PAYLOAD, "gzip")
+    assert len(serialization.encode_json(LARGE_PAYLOAD)) >= MIN_COMPRESS_BYTES
+    assert encoding == "gzip"
+    assert json.loads(gzip.decompress(body)) == LARGE_PAYLOAD
+
+
+@pytest.mark.parametrize("accept_encoding", [None, "gzip", "br", "gzip, br"])
+def test_json_response_negotiates_the_encoding(accept_encoding):
+    response = asyncio.run(json_response(LARGE_PAYLOAD, accept_encoding, headers={"ETag": '"tag"'}))
+    expected = choose_encoding(accept_encoding)
+
+    assert response.headers.get("content-encoding") == expected
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == '"tag"'
+    assert response.media_type == "application/json"
+    assert decode(response) == LARGE_PAYLOAD
+
+
+def test_json_response_encodes_off_the_event_loop(monkeypatch):
+    threads = []
+
+    def recording_encode_body(payload, accept_encoding):
+        threads.append(threading.get_ident())
+        return encode_body(payload, accept_encoding)
+
+    monkeypatch.setattr(serialization, "encode_body", recording_encode_body)
+
+    async def scenario():
+        response = await json_response(LARGE_PAYLOAD, "gzip", status_code=201, run_blocking=asyncio.to_thread)
+        return response, threading.get_ident()
+
+    response, loop_thread = asyncio.run(scenario())
+    assert len(threads) == 1 and threads[0] != loop_thread
+    assert response.status_code == 201
+    assert decode(response) == LARGE_PAYLOAD
@@ -0,0 +1,95 @@
+import gc
+import json
+import os
+import shutil
+import weakref
+
+from analytics import SearchAnalytics, load_and_process_experiment_results
+from cache import get_file_fingerprint
+from serialization import encode_json
+from shared_dataset import SharedDataset, SharedDatasetStore, write_dataset_file
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gemini_experiment_results.json")
+
+
+def report(analytics: SearchAnalytics, domain: str) -> dict:
+    return json.loads(encode_json(analytics.generate_comprehensive_report(domain, include_gemini=False)))
+
+
+def test_mapped_dataset_matches_loaded_dataset(tmp_path):
+    data, response_chunks = load_and_process_experiment_results(SAMPLE_FILE, use_cache=False)
+    path = str(tmp_path / "sample.dataset")
+    write_dataset_file(path, data, response_chunks, generation=1)
+    dataset = SharedDataset(path)
+
+    assert list(dataset.data) == list(data)
+    for prompt, queries in data.items():
+        assert list(dataset.data[prompt]) == list(queries)
+        for query, domains in queries.items():
+            for domain, record in domains.items():
+                assert list(dataset.data[prompt][query][domain]['citations']) == list(record['citations'])
+                assert list(dataset.data[prompt][query][domain]['contents']) == list(record['contents'])
+    assert {prompt: dict(chunks.items()) for prompt, chunks in dataset.response_chunks.items()} == response_chunks
+
+    in_memory = SearchAnalytics(data, response_chunks)
+    mapped = SearchAnalytics(dataset.data, dataset.response_chunks)
+    for domain in ("berlin.de", "decathlon.de", "nonexistent.example"):
+        assert report(mapped, domain) == report(in_memory, domain)
+
+
+def test_changed_sources_bump_the_generation_and_drop_old_files(tmp_path):
+    source = str(tmp_path / "results.json")
+    shutil.copy(SAMPLE_FILE, source)
+    store = SharedDatasetStore(str(tmp_path / "store"))
+    builds = []
+
+    def build():
+        builds.append(1)
+        return load_and_process_experiment_results(source, use_cache=False)
+
+    datasets = []
+    for generation in range(1, 5):
+        if generation > 1:
+            stat = os.stat(source)
+            os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        dataset = store.get_or_publish([get_file_fingerprint(source)], build)
+        assert dataset.generation == generation
+        datasets.append(dataset)
+
+    key = store.dataset_key([{'path': source}])
+    assert sorted(name for name in os.listdir(tmp_path / "store") if name.endswith(".dataset")) == [
+        f"{key}-3.dataset", f"{key}-4.dataset"
+    ]
+    assert len(builds) == 4
+    assert list(store.stats()['datasets']) == [key]
+
+    # Unchanged sources map the current generation without rebuilding
+    assert store.get_or_publish([get_file_fingerprint(source)], build) is datasets[-1]
+    assert len(builds) == 4
+
+
+def test_reader_survives_a_republish(tmp_path):
+    source = str(tmp_path / "results.json")
+    shutil.copy(SAMPLE_FILE, source)
+    store = SharedDatasetStore(str(tmp_path / "store"))
+
+    def build():
+        return load_and_process_experiment_results(source, use_cache=False)
+
+    dataset = store.get_or_publish([get_file_fingerprint(source)], build)
+    reader = SearchAnalytics(dataset.data, dataset.response_chunks)
+    expected = report(reader, "berlin.de")
+
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    republished = store.get_or_publish([get_file_fingerprint(source)], build)
+    assert republished.generation == dataset.generation + 1
+
+    # An analysis still holding the previous generation keeps working
+    assert report(reader, "berlin.de") == expected
+
+    # Once its last reader is gone, the old generation is released
+    superseded = weakref.ref(dataset)
+    del dataset, reader
+    gc.collect()
+    assert superseded() is None
@@ -0,0 +1,122 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from analytics import SearchAnalytics, load_multiple_experiment_files
+from snippet_index import SnippetSearchIndex, tokenize_snippet
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_FILES = [
+    os.path.join(REPO_DIR, "gemini_experiment_results.json"),
+    os.path.join(REPO_DIR, "internal_responce_log.json"),
+]
+
+
+def brute_force_search(data, text, domain=None, prompt=None, prefix=False):
+    """Scan every citation record for snippets containing all search terms"""
+    terms = tokenize_snippet(text)
+    hits = {}
+    for p, queries in data.items():
+        for q, domains in queries.items():
+            for d, citation_data in domains.items():
+                citations = citation_data.get('citations', [])
+                for snippet in dict.fromkeys(citation_data.get('contents', [])):
+                    occurrences = hits.setdefault(snippet, [])
+                    words = set(tokenize_snippet(snippet))
+                    if not terms or not all(term in words for term in terms[:-1]):
+                        continue
+                    if prefix:
+                        if not any(word.startswith(terms[-1]) for word in words):
+                            continue
+                    elif terms[-1] not in words:
+                        continue
+                    if (domain is None or d == domain) and (prompt is None or p == prompt):
+                        occurrences.append({'prompt': p, 'query': q, 'domain': d,
+                                            'record_best_rank': min(citations) if citations else None})
+
+    results = []
+    for order, (snippet, occurrences) in enumerate(hits.items()):
+        if occurrences:
+            ranks = [occurrence['record_best_rank'] for occurrence in occurrences
+                     if occurrence['record_best_rank'] is not None]
+            results.append((-len(occurrences), min(ranks) if ranks else float('inf'), order, {
+                'snippet': snippet,
+                'citation_count': len(occurrences),
+                'best_record_rank': min(ranks) if ranks else None,
+                'domains': list(dict.fromkeys(occurrence['domain'] for occurrence in occurrences)),
+                'citations': occurrences
+            }))
+    results.sort(key=lambda result: result[:3])
+    return {'terms': terms, 'total_snippets': len(results), 'results': [result[3] for result in results]}
+
+
+@pytest.fixture(scope="module")
+def analytics():
+    return SearchAnalytics(*load_multiple_experiment_files(SAMPLE_FILES))
+
+
+@pytest.mark.parametrize("text, options", [
+    ("city bikes", {}),
+    ("Berlin", {'domain': "berlin.de"}),
+    ("e-bikes", {}),
+    ("hybrid ROAD", {}),
+    ("cycl", {'prefix': True}),
+    ("bikes off", {'prefix': True}),
+    ("bikes", {'prompt': "__missing__"}),
+    ("nonexistentterm", {}),
+    ("!!!", {}),
+])
+def test_matches_brute_force_scan(analytics, text, options):
+    index = analytics.get_snippet_index()
+    assert index.search(text, limit=10_000, **options) == brute_force_search(analytics.data, text, **options)
+
+
+def test_prompt_filter_and_limit(analytics):
+    prompt = next(iter(analytics.data))
+    index = analytics.get_snippet_index()
+    expected = brute_force_search(analytics.data, "bikes", prompt=prompt)
+    assert expected['total_snippets'] > 3
+
+    result = index.search("bikes", prompt=prompt, limit=3)
+    assert result['total_snippets'] == expected['total_snippets']
+    assert result['results'] == expected['results'][:3]
+
+
+def test_duplicate_contents_count_once_per_record():
+    data = {
+        "prompt": {
+            "query": {
+                "a.com": {'citations': [2, 1], 'contents': ["Warranty: 6 months", "Warranty: 6 months"]},
+                "b.com": {'citations': [], 'contents': ["warranty 6 MONTHS", "Free shipping"]}
+            }
+        }
+    }
+    index = SnippetSearchIndex(data)
+    result = index.search("warranty 6 months")
+
+    assert result['terms'] == ["warranty", "6", "months"]
+    assert [hit['snippet'] for hit in result['results']] == ["Warranty: 6 months", "warranty 6 MONTHS"]
+    assert result['results'][0]['citation_count'] == 1
+    assert result['results'][0]['best_record_rank'] == 1
+    assert result['results'][0]['citations'][0]['record_best_rank'] == 1
+    assert result['results'][1]['best_record_rank'] is None
+    assert index.stats() == {'snippets': 3, 'terms': 5, 'postings': 8, 'occurrences': 3}
+
+
+def test_snippet_search_endpoint_matches_index():
+    import api
+
+    with TestClient(api.app) as client:
+        response = client.get("/snippets/search", params={"q": "bikes", "domain": "berlin.de", "limit": 5})
+        assert response.status_code == 200
+        body = response.json()
+
+        analytics = SearchAnalytics(*load_multiple_experiment_files(api.resolve_experiment_files(None)))
+        expected = brute_force_search(analytics.data, "bikes", domain="berlin.de")
+        assert body['query'] == "bikes"
+        assert expected['total_snippets'] > 5
+        assert body['total_snippets'] == expected['total_snippets']
+        assert body['results'] == expected['results'][:5]
+
+        assert client.get("/snippets/search", params={"q": ""}).status_code == 422
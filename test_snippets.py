@@ -0,0 +1,100 @@
+import json
+import pickle
+
+import pytest
+
+from analytics import load_and_process_experiment_results, load_multiple_experiment_files
+from snippets import SnippetList, SnippetStore
+
+
+def test_store_keeps_each_distinct_snippet_once():
+    store = SnippetStore()
+    first = store.intern("Decathlon sells bikes")
+    assert store.intern("Fahrrad.de sells bikes") == first + 1
+    assert store.intern("Decathlon sells bikes") == first
+    assert store.lookup("Decathlon sells bikes") == first and store.lookup("missing") is None
+    assert store.get(first) == "Decathlon sells bikes"
+    other = SnippetStore()
+    assert store.key(first) == other.key(other.intern("Decathlon sells bikes"))
+
+    stats = store.stats()
+    assert (len(store), stats["references"], stats["deduplication_factor"]) == (2, 3, 1.5)
+
+
+def test_snippet_list_behaves_like_a_list_of_strings():
+    store = SnippetStore()
+    snippets = SnippetList(store, ["a", "b", "a"])
+    snippets.append("c")
+    snippets.extend(["b"])
+
+    assert snippets == ["a", "b", "a", "c", "b"] and snippets != ["a"]
+    assert list(snippets) == ["a", "b", "a", "c", "b"] and len(snippets) == 5 and bool(snippets)
+    assert snippets[1] == "b" and snippets[-1] == "b" and snippets[1:3] == ["b", "a"]
+    assert "c" in snippets and snippets.count("a") == 2 and snippets.index("c") == 3
+    assert not SnippetList(store) and len(store) == 3
+
+    copy = SnippetList(store)
+    copy.extend(snippets)
+    assert copy == snippets and copy.ids == snippets.ids
+
+    other_store = SnippetStore()
+    moved = SnippetList(other_store, snippets)
+    assert moved == snippets and len(other_store) == 3
+
+
+def test_pickled_lists_share_one_store():
+    store = SnippetStore()
+    dataset = {"q": {"a.com": SnippetList(store, ["x", "y"]), "b.com": SnippetList(store, ["y"])}}
+
+    restored = pickle.loads(pickle.dumps(dataset))
+    assert restored["q"]["a.com"] == ["x", "y"] and restored["q"]["b.com"] == ["y"]
+    assert restored["q"]["a.com"].store is restored["q"]["b.com"].store
+    assert restored["q"]["a.com"].store.lookup("y") == 1
+
+
+def write_results(path, snippet_text, runs):
+    experiment = {
+        "prompt": "best bikes",
+        "results": {
+            "gemini": [
+                {"success": True, "web_searches": {"bikes": {"https://www.decathlon.de/x": {"citations": [1], "contents": [snippet_text]}}}}
+                for _ in range(runs)
+            ]
+        },
+    }
+    path.write_text(json.dumps([experiment]))
+    return str(path)
+
+
+def test_loaded_datasets_reference_snippets_instead_of_copying_them(tmp_path):
+    first = write_results(tmp_path / "a.json", "Decathlon has bikes", runs=3)
+    second = write_results(tmp_path / "b.json", "Decathlon has bikes", runs=2)
+
+    search_data, _ = load_and_process_experiment_results(first, use_cache=False)
+    contents = search_data["best bikes"]["bikes"]["decathlon.de"]["contents"]
+    assert contents == ["Decathlon has bikes"] * 3
+    assert isinstance(contents, SnippetList) and len(contents.store) == 1
+
+    combined, _ = load_multiple_experiment_files([first, second])
+    contents = combined["best bikes"]["bikes"]["decathlon.de"]["contents"]
+    assert contents == ["Decathlon has bikes"] * 5 and len(contents.store) == 1
+
+
+def test_malformed_snippets_are_skipped_without_dropping_the_file(tmp_path, capsys):
+    experiment = {
+        "prompt": "best bikes",
+        "results": {"gemini": [{"success": True, "web_searches": {"bikes": {
+            "https://www.decathlon.de/x": {"citations": [1], "contents": ["Decathlon has bikes", None, {"text": "x"}]},
+            "https://fahrrad.de/y": {"citations": [2], "contents": ["Fahrrad.de has bikes"]},
+        }}}]},
+    }
+    path = tmp_path / "results.json"
+    path.write_text(json.dumps([experiment]))
+
+    search_data, _ = load_and_process_experiment_results(str(path), use_cache=False)
+    assert search_data["best bikes"]["bikes"]["decathlon.de"] == {"citations": [1], "contents": ["Decathlon has bikes"]}
+    assert search_data["best bikes"]["bikes"]["fahrrad.de"]["contents"] == ["Fahrrad.de has bikes"]
+    assert "Skipping 2 non-text snippet(s) for decathlon.de on query 'bikes'" in capsys.readouterr().out
+
+    with pytest.raises(TypeError):
+        SnippetList(SnippetStore(), ["ok", 3])
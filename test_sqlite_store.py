@@ -0,0 +1,183 @@
+import json
+import os
+import sqlite3
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from analytics import SearchAnalytics, load_and_process_experiment_results, load_multiple_experiment_files
+from sqlite_store import SQLiteAnalyticsStore
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_FILES = [
+    os.path.join(REPO_DIR, "gemini_experiment_results.json"),
+    os.path.join(REPO_DIR, "internal_responce_log.json"),
+]
+
+
+def load(files):
+    if len(files) == 1:
+        return SearchAnalytics(*load_and_process_experiment_results(files[0], use_cache=False))
+    return SearchAnalytics(*load_multiple_experiment_files(files))
+
+
+def all_domains(analytics):
+    return sorted({domain for queries in analytics.data.values() for domains in queries.values() for domain in domains})
+
+
+def normalized_query_analysis(analysis):
+    # SearchAnalytics builds all_domains from a set, so only its contents are comparable
+    return {query: {**stats, 'all_domains': sorted(stats['all_domains'])} for query, stats in analysis.items()}
+
+
+def experiment(prompt, searches, timestamp=None):
+    run = {'success': True, 'web_searches': searches}
+    if timestamp is not None:
+        run['timestamp'] = timestamp
+    return {'prompt': prompt, 'results': {'model': [run]}}
+
+
+@pytest.mark.parametrize("files", [SAMPLE_FILES[:1], SAMPLE_FILES[1:], SAMPLE_FILES])
+def test_matches_search_analytics_on_sample_files(files):
+    store = SQLiteAnalyticsStore()
+    for file_path in files:
+        store.ingest_file(file_path)
+    analytics = load(files)
+
+    for domain in all_domains(analytics):
+        assert store.calculate_domain_stats(domain) == analytics.calculate_domain_stats(domain), domain
+    for domain in ("berlin.de", "fietsenboerse.de", "decathlon.de"):
+        assert (normalized_query_analysis(store.analyze_queries_with_target_domain(domain))
+                == normalized_query_analysis(analytics.analyze_queries_with_target_domain(domain)))
+    assert store.analyze_intersecting_queries() == analytics.analyze_intersecting_queries()
+
+
+def test_rerun_prompt_replaces_earlier_record_within_a_file(tmp_path):
+    records = [
+        experiment("prompt", {"query": {"https://a.com/1": {'citations': [1, 2]}, "https://b.com": {'citations': [3]}}}),
+        experiment("prompt", {"query": {"https://a.com/2": {'citations': [4]}}}),
+    ]
+    path = tmp_path / "rerun.json"
+    path.write_text(json.dumps(records))
+
+    store = SQLiteAnalyticsStore()
+    store.ingest_file(str(path))
+    analytics = load([str(path)])
+
+    for domain in ("a.com", "b.com"):
+        assert store.calculate_domain_stats(domain) == analytics.calculate_domain_stats(domain)
+    # The later record replaces a.com's ranks; b.com keeps the earlier record's entry
+    assert store.calculate_domain_stats("a.com")['citation_positions'] == [4]
+    assert store.calculate_domain_stats("b.com")['citation_positions'] == [3]
+
+
+def test_unchanged_file_is_ingested_once_under_concurrency(tmp_path):
+    db_path = str(tmp_path / "analytics.sqlite3")
+    stores = [SQLiteAnalyticsStore(db_path) for _ in range(4)]
+    counts = []
+    barrier = threading.Barrier(len(stores))
+
+    def ingest(store):
+        barrier.wait()
+        counts.append(store.ingest_file(SAMPLE_FILES[0]))
+
+    threads = [threading.Thread(target=ingest, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(count > 0 for count in counts) == [False, False, False, True]
+    assert stores[0].stats()['sources'] == 1
+    assert stores[0].stats()['runs'] == max(counts)
+    for store in stores:
+        store.close()
+
+
+def test_model_and_time_filters_select_the_same_merge_as_the_latest_table():
+    store = SQLiteAnalyticsStore()
+    for file_path in SAMPLE_FILES:
+        store.ingest_file(file_path)
+    every_run = {'models': store.list_models(), 'since': 0}
+
+    for domain in ("berlin.de", "decathlon.de"):
+        assert store.calculate_domain_stats(domain, **every_run) == store.calculate_domain_stats(domain)
+        assert (store.analyze_queries_with_target_domain(domain, **every_run)
+                == store.analyze_queries_with_target_domain(domain))
+    assert store.analyze_intersecting_queries(**every_run) == store.analyze_intersecting_queries()
+    assert store.top_competitors("berlin.de", **every_run) == store.top_competitors("berlin.de")
+
+
+def test_time_slices_use_the_run_timestamp_not_the_ingestion_time(tmp_path):
+    records = [
+        experiment("prompt", {"query": {"https://a.com": {'citations': [1]}}}, timestamp=1000.0),
+        experiment("prompt", {"query": {"https://a.com": {'citations': [2]}}}, timestamp=2000.0),
+        experiment("other", {"query": {"https://a.com": {'citations': [5]}}}),
+    ]
+    path = tmp_path / "timed.json"
+    path.write_text(json.dumps(records))
+    os.utime(path, (3000.0, 3000.0))
+
+    store = SQLiteAnalyticsStore()
+    store.ingest_file(str(path), ingested_at=9999.0)
+
+    # Within the slice, the latest record that falls inside it is the one merged
+    assert store.calculate_domain_stats("a.com", until=1500)['citation_positions'] == [1]
+    assert store.calculate_domain_stats("a.com", since=1500, until=2500)['citation_positions'] == [2]
+    # Runs without a timestamp fall back to the file's modification time
+    assert store.calculate_domain_stats("a.com", since=2500, until=9999)['citation_positions'] == [5]
+    assert store.calculate_domain_stats("a.com")['citation_positions'] == [2, 5]
+
+
+def test_latest_table_follows_replaced_files_and_is_rebuilt_for_older_databases(tmp_path):
+    path = tmp_path / "results.json"
+    path.write_text(json.dumps([
+        experiment("prompt", {"query": {"https://a.com": {'citations': [1]}, "https://b.com": {'citations': [2]}}}),
+        experiment("prompt", {"query": {"https://a.com": {'citations': [3]}}}),
+    ]))
+    db_path = str(tmp_path / "analytics.sqlite3")
+    store = SQLiteAnalyticsStore(db_path)
+    store.ingest_file(str(path))
+    assert store.calculate_domain_stats("a.com")['citation_positions'] == [3]
+
+    # The new version of the file drops the re-run, so its first record is the latest again
+    path.write_text(json.dumps([
+        experiment("prompt", {"query": {"https://a.com": {'citations': [4]}}}),
+    ]))
+    store.ingest_file(str(path))
+    analytics = load([str(path)])
+    for domain in ("a.com", "b.com"):
+        assert store.calculate_domain_stats(domain) == analytics.calculate_domain_stats(domain)
+    store.close()
+
+    # A database from before the table existed gets it rebuilt from its runs
+    connection = sqlite3.connect(db_path)
+    connection.execute("DROP TABLE latest_appearances")
+    connection.commit()
+    connection.close()
+    reopened = SQLiteAnalyticsStore(db_path)
+    assert reopened.calculate_domain_stats("a.com") == analytics.calculate_domain_stats("a.com")
+    reopened.close()
+
+
+def test_api_sqlite_backend_returns_the_in_memory_analyses(tmp_path, monkeypatch):
+    import api
+
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    request = {"target_domain": "berlin.de", "experiment_files": SAMPLE_FILES,
+               "sections": ["domain_analysis", "query_analysis", "intersecting_queries"]}
+    with TestClient(api.app) as client:
+        api.analytics_cache.clear()
+        expected = client.post("/analyze", json=request).json()["data"]
+
+        monkeypatch.setattr(api, "ANALYTICS_BACKEND", "sqlite")
+        monkeypatch.setattr(api, "analytics_store", SQLiteAnalyticsStore(str(tmp_path / "analytics.sqlite3")))
+        api.analytics_cache.clear()
+        actual = client.post("/analyze", json=request).json()["data"]
+        api.analytics_cache.clear()
+
+    assert api.analytics_store.stats()['sources'] == len(SAMPLE_FILES)
+    assert actual["domain_analysis"] == expected["domain_analysis"]
+    assert actual["intersecting_queries"] == expected["intersecting_queries"]
+    assert normalized_query_analysis(actual["query_analysis"]) == normalized_query_analysis(expected["query_analysis"])